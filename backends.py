@@ -0,0 +1,259 @@
+"""
+Alternative inference backends for the detection model.
+
+PyTorch weights are exported once to ONNX or OpenVINO IR with ultralytics and
+cached under settings.EXPORT_DIR, keyed by the hash of the source weights and
+the export input size, so later runs load the artifact directly. A parity
+check compares the exported model's boxes with the PyTorch model's.
+
+The exporters and runtimes are optional dependencies:
+
+    pip install -r requirements-backends.txt
+
+Export and verify from the repository root:
+
+    python backends.py --backend onnx
+    python backends.py --int8 --calibration-dir path/to/site/images
+"""
+import argparse
+import functools
+import hashlib
+import json
+from pathlib import Path
+import shutil
+
+import numpy as np
+
+import settings
+
+
+@functools.lru_cache(maxsize=32)
+def _digest(path, mtime_ns):
+    hasher = hashlib.blake2b(digest_size=16)
+    path = Path(path)
+    files = sorted(p for p in path.rglob('*') if p.is_file()) if path.is_dir() else [path]
+    for file in files:
+        hasher.update(file.name.encode())
+        with open(file, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def weights_digest(path):
+    """Returns a content hash of a weights file or exported model directory."""
+    path = Path(path).resolve()
+    return _digest(str(path), path.stat().st_mtime_ns)
+
+
+def artifact_nbytes(path):
+    path = Path(path)
+    if path.is_dir():
+        return sum(p.stat().st_size for p in path.rglob('*') if p.is_file())
+    return path.stat().st_size
+
+
+IMAGE_SUFFIXES = ('.jpg', '.jpeg', '.png', '.bmp', '.webp')
+
+
+def list_images(folder):
+    return sorted(p for p in Path(folder).iterdir() if p.suffix.lower() in IMAGE_SUFFIXES)
+
+
+def calibration_digest(folder):
+    """Identifies a calibration set by its file names and sizes."""
+    hasher = hashlib.blake2b(digest_size=8)
+    for image in list_images(folder)[:settings.INT8_CALIBRATION_IMAGES]:
+        hasher.update(f"{image.name}:{image.stat().st_size}".encode())
+    return hasher.hexdigest()
+
+
+def export_path(weights_path, backend, imgsz=settings.MODEL_EXPORT_IMGSZ, int8=False, calibration_dir=None):
+    """Where the exported artifact for these weights, backend, input size and precision is cached."""
+    weights_path = Path(weights_path)
+    precision = f"-int8-{calibration_digest(calibration_dir)}" if int8 else ''
+    name = f"{weights_path.stem}-{weights_digest(weights_path)[:12]}-{imgsz}{precision}"
+    if backend == settings.BACKEND_OPENVINO:
+        return settings.EXPORT_DIR / f"{name}_openvino_model"
+    return settings.EXPORT_DIR / f"{name}.onnx"
+
+
+def _sample_images(limit=8):
+    images = [Path(settings.DEFAULT_IMAGE)]
+    if Path(settings.IMAGES_DIR).is_dir():
+        images += list_images(settings.IMAGES_DIR)
+    return [p for p in images if p.exists()][:limit]
+
+
+def _calibration_dataset(folder, names):
+    """
+    Writes the dataset YAML ultralytics reads INT8 calibration images from.
+
+    Calibration needs no labels, so the image folder is used as is for the
+    'val' split.
+    """
+    folder = Path(folder).resolve()
+    images = list_images(folder)
+    if not images:
+        raise FileNotFoundError(f"No calibration images found in {folder}")
+    images = images[:settings.INT8_CALIBRATION_IMAGES]
+    settings.EXPORT_DIR.mkdir(parents=True, exist_ok=True)
+    list_file = settings.EXPORT_DIR / f"calibration-{calibration_digest(folder)}.txt"
+    list_file.write_text("\n".join(str(p) for p in images))
+    data_file = list_file.with_suffix('.yaml')
+    data_file.write_text(json.dumps({'path': str(folder), 'train': str(list_file), 'val': str(list_file),
+                                     'names': {int(k): v for k, v in names.items()}}))
+    return data_file
+
+
+def export_model(weights_path, backend, imgsz=settings.MODEL_EXPORT_IMGSZ, verify=True,
+                 calibration_dir=settings.INT8_CALIBRATION_DIR, **export_args):
+    """
+    Exports PyTorch weights to another backend, reusing a cached export when present.
+
+    Parameters:
+        weights_path (str): Path to the .pt weights.
+        backend (str): settings.BACKEND_ONNX or settings.BACKEND_OPENVINO.
+        imgsz (int): Export input size.
+        verify (bool): Run parity_check unless a report is already stored
+            next to the artifact.
+        calibration_dir (str): Images to calibrate on when exporting with int8=True.
+        export_args: Extra arguments for `YOLO.export`, e.g. int8=True.
+
+    Returns:
+        Path of the exported model.
+    """
+    if backend not in (settings.BACKEND_ONNX, settings.BACKEND_OPENVINO):
+        raise ValueError(f"Unknown export backend: {backend}")
+    int8 = export_args.get('int8', False)
+    target = export_path(weights_path, backend, imgsz, int8, calibration_dir)
+    if target.exists() and (not verify or parity_report_path(target).exists()):
+        return target
+
+    from ultralytics import YOLO
+
+    reference = YOLO(str(weights_path))
+    if int8 and 'data' not in export_args:
+        export_args['data'] = str(_calibration_dataset(calibration_dir, reference.names))
+    if not target.exists():
+        # Dynamic axes so batched and tiled calls work with any batch size and input size
+        exported = Path(reference.export(format=backend, imgsz=imgsz, dynamic=True, **export_args))
+        target.parent.mkdir(parents=True, exist_ok=True)
+        shutil.move(str(exported), str(target))
+
+    if verify:
+        candidate = YOLO(str(target), task='detect')
+        report = parity_check(reference, candidate, _sample_images(), imgsz=imgsz)
+        parity_report_path(target).write_text(json.dumps(report, indent=2))
+    return target
+
+
+def parity_report_path(artifact):
+    artifact = Path(artifact)
+    return artifact.with_name(artifact.name + '.parity.json')
+
+
+def load_parity_report(artifact):
+    path = parity_report_path(artifact)
+    return json.loads(path.read_text()) if path.exists() else None
+
+
+def match_boxes(reference, candidate, iou_threshold):
+    """
+    Greedily matches candidate boxes to reference boxes by IoU.
+
+    Returns:
+        (reference index, candidate index, IoU) arrays of the matched pairs.
+    """
+    if not len(reference) or not len(candidate):
+        empty = np.zeros(0, int)
+        return empty, empty, np.zeros(0)
+    x1 = np.maximum(reference[:, None, 0], candidate[None, :, 0])
+    y1 = np.maximum(reference[:, None, 1], candidate[None, :, 1])
+    x2 = np.minimum(reference[:, None, 2], candidate[None, :, 2])
+    y2 = np.minimum(reference[:, None, 3], candidate[None, :, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area_r = (reference[:, 2] - reference[:, 0]) * (reference[:, 3] - reference[:, 1])
+    area_c = (candidate[:, 2] - candidate[:, 0]) * (candidate[:, 3] - candidate[:, 1])
+    iou = inter / np.maximum(area_r[:, None] + area_c[None, :] - inter, 1e-9)
+
+    pairs = []
+    used_r, used_c = set(), set()
+    for r, c in zip(*np.unravel_index(np.argsort(-iou, axis=None), iou.shape)):
+        if iou[r, c] < iou_threshold:
+            break
+        if r not in used_r and c not in used_c:
+            pairs.append((r, c, iou[r, c]))
+            used_r.add(r)
+            used_c.add(c)
+    if not pairs:
+        empty = np.zeros(0, int)
+        return empty, empty, np.zeros(0)
+    ref_idx, cand_idx, ious = map(np.array, zip(*pairs))
+    return ref_idx, cand_idx, ious
+
+
+def parity_check(reference, candidate, images, conf=0.25, imgsz=settings.MODEL_EXPORT_IMGSZ,
+                 iou_tolerance=settings.BACKEND_PARITY_IOU, conf_tolerance=settings.BACKEND_PARITY_CONF):
+    """
+    Compares the boxes of two models on the same images.
+
+    The check passes when every box of either model has a counterpart in the
+    other with IoU >= `iou_tolerance`, and matched confidences differ by at
+    most `conf_tolerance`. Unmatched boxes within `conf_tolerance` of the
+    threshold are not counted, since either model may fall just below it.
+
+    Parameters:
+        reference (YOLO): The PyTorch model.
+        candidate (YOLO): The exported model.
+        images (list): Image paths or arrays.
+        conf (float): Confidence threshold for both models.
+        imgsz (int): Inference size for both models.
+
+    Returns:
+        A dict report with per-model box counts, match rates, worst IoU and
+        largest confidence difference, and 'passed'.
+    """
+    report = {'images': len(images), 'reference_boxes': 0, 'candidate_boxes': 0, 'matched': 0,
+              'unmatched': 0, 'min_iou': 1.0, 'max_conf_diff': 0.0}
+    for image in images:
+        ref = reference.predict(image, conf=conf, imgsz=imgsz, verbose=False)[0].boxes.data.cpu().numpy()
+        cand = candidate.predict(image, conf=conf, imgsz=imgsz, verbose=False)[0].boxes.data.cpu().numpy()
+        r, c, ious = match_boxes(ref[:, :4], cand[:, :4], iou_tolerance)
+        report['reference_boxes'] += len(ref)
+        report['candidate_boxes'] += len(cand)
+        report['matched'] += len(r)
+        borderline = conf + conf_tolerance
+        report['unmatched'] += int((np.delete(ref[:, -2], r) >= borderline).sum()
+                                   + (np.delete(cand[:, -2], c) >= borderline).sum())
+        if len(r):
+            report['min_iou'] = min(report['min_iou'], float(ious.min()))
+            report['max_conf_diff'] = max(report['max_conf_diff'],
+                                          float(np.abs(ref[r, -2] - cand[c, -2]).max()))
+    report['passed'] = report['unmatched'] == 0 and report['max_conf_diff'] <= conf_tolerance
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the detection model and check parity with PyTorch.")
+    parser.add_argument('--weights', default=str(settings.DETECTION_MODEL))
+    parser.add_argument('--backend', default=settings.BACKEND_ONNX,
+                        choices=(settings.BACKEND_ONNX, settings.BACKEND_OPENVINO))
+    parser.add_argument('--imgsz', type=int, default=settings.MODEL_EXPORT_IMGSZ)
+    parser.add_argument('--int8', action='store_true', help='quantize to INT8 (OpenVINO only)')
+    parser.add_argument('--calibration-dir', default=str(settings.INT8_CALIBRATION_DIR))
+    args = parser.parse_args()
+
+    if args.int8:
+        artifact = export_model(args.weights, settings.BACKEND_OPENVINO, args.imgsz, verify=False, int8=True,
+                                calibration_dir=args.calibration_dir)
+        print(f"Exported model: {artifact}")
+        print("Compare it with FP32 using benchmarks/quant_report.py")
+        return
+    artifact = export_model(args.weights, args.backend, args.imgsz)
+    print(f"Exported model: {artifact}")
+    print(json.dumps(load_parity_report(artifact), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,351 @@
+"""
+Headless batch detection over image folders and video files.
+
+    python -m batch_detect images/survey_2024 footage/*.mp4 --output runs/nightly --workers 4
+
+Inputs are split into tasks (a group of images, or a range of video frames)
+that a pool of worker processes runs, each with its own model. Detections are
+appended to `detections.csv` in the output folder as tasks finish, and every
+finished task is recorded in `manifest.jsonl` together with the CSV size at
+that point. A task that raises is recorded as failed, with its error, and the
+others carry on; the command exits non-zero if any task failed. Re-running the
+same command resumes: finished tasks are skipped, failed ones are retried, and
+any rows written after the last recorded task are truncated away.
+Every finished task also writes its boxes to a DetectionStore part file in
+`parts/`; after the run the parts of all finished tasks are concatenated into
+`store.parquet`, from which --export-formats writes Parquet or COCO JSON (and
+the app's CSV layout) the same way the app exports video runs.
+With --export-video every video frame range is also written as an annotated
+video to `videos/` in the output folder. With --dedup the detections of
+overlapping frames are merged into unique objects afterwards (survey_dedup),
+written to `objects.csv`.
+"""
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+from pathlib import Path
+import sys
+import time
+
+import cv2
+import numpy as np
+import PIL.Image
+
+import detection_store
+from detection_store import DetectionStore
+import detection_table
+import settings
+from result_cache import Detections
+import survey_dedup
+from tiling import TileConfig, tiled_predict
+from video_export import AnnotatedVideoWriter
+
+# --export-formats values, e.g. 'coco' for detection_store's 'COCO JSON'
+STORE_FORMATS = {fmt.split()[0].lower(): fmt for fmt in detection_store.EXPORT_FORMATS}
+IMAGE_SUFFIXES = ('.jpg', '.jpeg', '.png', '.bmp', '.webp')
+VIDEO_SUFFIXES = ('.mp4', '.avi', '.mov', '.mkv', '.m4v')
+COLUMNS = ['file_name', 'frame', 'object_id', 'x1', 'y1', 'x2', 'y2', 'class', 'confidence']
+
+_worker = {}  # per-process model and options, set by init_worker
+
+
+def collect_inputs(inputs):
+    """Expands folders and list files into sorted image and video paths."""
+    images, videos = [], []
+    for item in inputs:
+        path = Path(item)
+        if path.is_dir():
+            candidates = sorted(p for p in path.rglob('*') if p.is_file())
+        elif path.suffix.lower() == '.txt':
+            candidates = [Path(line.strip()) for line in path.read_text().splitlines() if line.strip()]
+        else:
+            candidates = [path]
+        for candidate in candidates:
+            suffix = candidate.suffix.lower()
+            if suffix in IMAGE_SUFFIXES:
+                images.append(str(candidate))
+            elif suffix in VIDEO_SUFFIXES:
+                videos.append(str(candidate))
+    return images, videos
+
+
+def plan_tasks(images, videos, images_per_task, frames_per_task):
+    """Splits the inputs into independent, resumable tasks with stable IDs."""
+    tasks = []
+    for start in range(0, len(images), images_per_task):
+        chunk = images[start:start + images_per_task]
+        tasks.append({'id': f"images:{chunk[0]}:{len(chunk)}", 'kind': 'images', 'paths': chunk})
+    for video in videos:
+        vid_cap = cv2.VideoCapture(video)
+        total = int(vid_cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        vid_cap.release()
+        if total <= 0:
+            # Unknown length: one task that reads to the end
+            tasks.append({'id': f"video:{video}:0-", 'kind': 'video', 'path': video, 'start': 0, 'end': None})
+            continue
+        for start in range(0, total, frames_per_task):
+            end = min(start + frames_per_task, total)
+            tasks.append({'id': f"video:{video}:{start}-{end}", 'kind': 'video', 'path': video,
+                          'start': start, 'end': end})
+    return tasks
+
+
+def init_worker(options):
+    import helper
+
+    if options['threads']:
+        import torch
+        torch.set_num_threads(options['threads'])
+    _worker['options'] = options
+    _worker['model'] = helper.load_model(options['weights'], backend=options['backend'],
+                                         int8=options['int8'])
+
+
+def worker_context():
+    """Returns the (model, options) of the current worker process."""
+    return _worker['model'], _worker['options']
+
+
+def _table(detections, file_names, frames=None):
+    """CSV rows (without header) and row count for a task's Detections, built column-wise."""
+    columns = detection_table.build_columns(detections, file_names, frames)
+    frame = detection_table.to_dataframe(
+        columns, ['File_name', 'frame', 'object_id', 'X1', 'Y1', 'X2', 'Y2', 'class', 'confidence'])
+    return detection_table.to_csv(frame, header=False), len(frame)
+
+
+def _run_images(task, model, options):
+    import helper
+
+    detections = []
+    if options['tiling']:
+        for path in task['paths']:
+            image = np.asarray(PIL.Image.open(path).convert('RGB'))[:, :, ::-1]
+            detections.append(tiled_predict(model, image, options['conf'], options['tiling']))
+    else:
+        detections = [Detections.from_result(result) for _, _, result in
+                      helper.detect_images(model, task['paths'], options['conf'],
+                                           batch_size=options['batch_size'], workers=2)]
+    return detections, task['paths'], None
+
+
+def _video_exporter(task, vid_cap, options):
+    """One annotated video per frame range, named after the source and the range."""
+    export = options.get('export')
+    if not export:
+        return None
+    end = task['end'] if task['end'] is not None else 'end'
+    path = Path(export['dir']) / f"{Path(task['path']).stem}_{task['start']}-{end}.mp4"
+    # Offline, so every frame is kept: wait for the encoder instead of dropping frames
+    return AnnotatedVideoWriter(path, vid_cap.get(cv2.CAP_PROP_FPS), width=export['width'],
+                                bitrate=export['bitrate'], segments_only=export['segments_only'], block=True)
+
+
+def _run_video(task, model, options):
+    import helper
+
+    detections, frames = [], []
+    tracker = options['tracker']
+    if tracker:
+        # Every task starts with a fresh tracker
+        model = model.tracking_copy()
+    vid_cap = cv2.VideoCapture(task['path'])
+    vid_cap.set(cv2.CAP_PROP_POS_FRAMES, task['start'])
+    exporter = _video_exporter(task, vid_cap, options)
+    frame_index = task['start']
+    try:
+        while task['end'] is None or frame_index < task['end']:
+            success, image = vid_cap.read()
+            if not success:
+                break
+            frame_result = helper.detect_frame(options['conf'], model, image, bool(tracker), tracker,
+                                               frame_index, options['tiling'])
+            if exporter is not None:
+                exporter.write(frame_result, image)
+            # Keep the boxes only, not the frame
+            detections.append(Detections(frame_result.boxes, frame_result.conf, frame_result.cls,
+                                         frame_result.image.shape[:2], model.names, frame_result.track_ids))
+            frames.append(frame_index)
+            frame_index += 1
+    finally:
+        vid_cap.release()
+        if exporter is not None:
+            exporter.close()
+    return detections, [task['path']] * len(frames), frames
+
+
+def part_path(parts_dir, task_id):
+    """The DetectionStore part file of one task."""
+    return Path(parts_dir) / f"{hashlib.sha1(task_id.encode()).hexdigest()[:16]}.parquet"
+
+
+def _write_part(path, detections, file_names, frames, names):
+    """Writes a task's Detections to its part file, renamed into place once complete."""
+    partial = path.with_suffix('.partial')
+    with DetectionStore(partial, names=names) as store:
+        for index, found in enumerate(detections):
+            store.append(found, file_names[index], frames[index] if frames is not None else 0)
+    os.replace(partial, path)
+
+
+def _run_task(task):
+    """Returns (task ID, CSV rows, row count, seconds, error); a failed task has no rows and an error message."""
+    start = time.perf_counter()
+    model, options = worker_context()
+    try:
+        if task['kind'] == 'images':
+            detections, file_names, frames = _run_images(task, model, options)
+        else:
+            detections, file_names, frames = _run_video(task, model, options)
+        data, rows = _table(detections, file_names, frames)
+        _write_part(part_path(options['parts_dir'], task['id']), detections, file_names, frames, model.names)
+    except Exception as e:
+        # One unreadable file must not abort the whole job
+        return task['id'], b'', 0, time.perf_counter() - start, f"{type(e).__name__}: {e}"
+    return task['id'], data, rows, time.perf_counter() - start, None
+
+
+def _load_manifest(manifest_path, csv_path):
+    """
+    Returns the finished task IDs and truncates rows written after the last recorded task.
+
+    Tasks recorded as failed are not returned, so they run again.
+    """
+    done, offset, valid = set(), 0, []
+    if manifest_path.exists():
+        for line in manifest_path.read_text().splitlines():
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # A line cut short by the interruption
+                continue
+            valid.append(line)
+            if 'error' not in record:
+                done.add(record['task'])
+            offset = max(offset, record['csv_offset'])
+        manifest_path.write_text(''.join(line + '\n' for line in valid))
+    if csv_path.exists() and csv_path.stat().st_size > offset:
+        with open(csv_path, 'r+b') as f:
+            f.truncate(offset)
+    return done
+
+
+def run(tasks, output_dir, options, workers):
+    """
+    Runs the tasks in a worker pool, writing detections and the manifest as they finish.
+
+    The store parts of all finished tasks are then concatenated, in task
+    order, into `store.parquet` in the output folder.
+
+    Returns:
+        (number of tasks run, IDs of the tasks that failed); finished tasks
+        from earlier runs are not counted.
+    """
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    csv_path = output_dir / 'detections.csv'
+    manifest_path = output_dir / 'manifest.jsonl'
+    done = _load_manifest(manifest_path, csv_path)
+    pending = [task for task in tasks if task['id'] not in done]
+    print(f"{len(tasks)} tasks, {len(tasks) - len(pending)} already done, {len(pending)} to run")
+    parts_dir = output_dir / 'parts'
+    if not pending:
+        _merge_parts(tasks, done, parts_dir, output_dir / 'store.parquet')
+        return 0, []
+    options = dict(options, parts_dir=str(parts_dir))
+
+    new_file = not csv_path.exists() or csv_path.stat().st_size == 0
+    failed = []
+    context = multiprocessing.get_context('spawn')
+    with open(csv_path, 'ab') as csv_file, open(manifest_path, 'a') as manifest, \
+            context.Pool(workers, initializer=init_worker, initargs=(options,)) as pool:
+        if new_file:
+            csv_file.write((','.join(COLUMNS) + '\n').encode())
+        for finished, (task_id, data, rows, seconds, error) in enumerate(
+                pool.imap_unordered(_run_task, pending), 1):
+            csv_file.write(data)
+            csv_file.flush()
+            os.fsync(csv_file.fileno())
+            record = {'task': task_id, 'rows': rows, 'seconds': round(seconds, 3), 'csv_offset': csv_file.tell()}
+            if error is not None:
+                record['error'] = error
+                failed.append(task_id)
+            else:
+                done.add(task_id)
+            manifest.write(json.dumps(record) + '\n')
+            manifest.flush()
+            if error is not None:
+                print(f"[{finished}/{len(pending)}] {task_id}: failed after {seconds:.1f}s: {error}")
+            else:
+                print(f"[{finished}/{len(pending)}] {task_id}: {rows} detections in {seconds:.1f}s")
+    if failed:
+        print(f"{len(failed)} of {len(pending)} tasks failed; re-run the same command to retry them")
+    _merge_parts(tasks, done, parts_dir, output_dir / 'store.parquet')
+    return len(pending), failed
+
+
+def _merge_parts(tasks, done, parts_dir, store_path):
+    """Concatenates the parts of the finished tasks; a part left by a failed retry is not included."""
+    detection_store.concat([part_path(parts_dir, task['id']) for task in tasks if task['id'] in done], store_path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run plastic detection over folders of images and videos.")
+    parser.add_argument('inputs', nargs='+', help='image/video files, folders, or .txt lists of paths')
+    parser.add_argument('--output', required=True, help='folder for detections.csv and manifest.jsonl')
+    parser.add_argument('--workers', type=int, default=max(1, (os.cpu_count() or 2) // 2))
+    parser.add_argument('--conf', type=float, default=0.35)
+    parser.add_argument('--weights', default=str(settings.DETECTION_MODEL))
+    parser.add_argument('--backend', default=settings.MODEL_BACKEND,
+                        choices=(settings.BACKEND_TORCH, settings.BACKEND_ONNX, settings.BACKEND_OPENVINO))
+    parser.add_argument('--int8', action='store_true', help='use the INT8 quantized model')
+    parser.add_argument('--batch-size', type=int, default=settings.IMAGE_BATCH_SIZE)
+    parser.add_argument('--images-per-task', type=int, default=64)
+    parser.add_argument('--frames-per-task', type=int, default=1800)
+    parser.add_argument('--tracker', choices=('bytetrack.yaml', 'botsort.yaml'),
+                        help='track objects in videos (IDs restart in every frame range; '
+                             'use video_shards for IDs stitched across ranges)')
+    parser.add_argument('--tile', type=int, help='tiled inference with this tile size')
+    parser.add_argument('--export-video', action='store_true',
+                        help='also write annotated videos to <output>/videos, one per frame range')
+    parser.add_argument('--export-width', type=int, help='width of the exported videos (default: source size)')
+    parser.add_argument('--export-bitrate', default=settings.EXPORT_BITRATE, help='e.g. 4M, used with ffmpeg')
+    parser.add_argument('--export-segments-only', action='store_true',
+                        help='only export the stretches of video with detections')
+    parser.add_argument('--export-formats', nargs='+', choices=list(STORE_FORMATS), default=[],
+                        help='also export store.parquet in these formats (csv is the app table layout)')
+    parser.add_argument('--dedup', nargs='?', const='auto', choices=survey_dedup.METHODS,
+                        help='count unique objects across overlapping frames into <output>/objects.csv, '
+                             'placing images by DJI geotags or feature matches (default: auto)')
+    args = parser.parse_args(argv)
+
+    images, videos = collect_inputs(args.inputs)
+    tasks = plan_tasks(images, videos, args.images_per_task, args.frames_per_task)
+    options = {
+        'weights': args.weights,
+        'backend': args.backend,
+        'int8': args.int8,
+        'conf': args.conf,
+        'batch_size': args.batch_size,
+        'tracker': args.tracker,
+        'tiling': TileConfig(tile_size=args.tile) if args.tile else None,
+        'export': {'dir': str(Path(args.output) / 'videos'), 'width': args.export_width,
+                   'bitrate': args.export_bitrate, 'segments_only': args.export_segments_only}
+        if args.export_video else None,
+        # Share the cores between workers instead of every worker using all of them
+        'threads': max(1, (os.cpu_count() or 1) // args.workers),
+    }
+    _, failed = run(tasks, args.output, options, args.workers)
+    for fmt in args.export_formats:
+        print(f"exported {detection_store.export(Path(args.output) / 'store.parquet', STORE_FORMATS[fmt])}")
+    if args.dedup:
+        dedup = survey_dedup.deduplicate_survey(Path(args.output) / 'detections.csv', images, videos, args.dedup)
+        survey_dedup.report(dedup, Path(args.output) / 'objects.csv')
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,10 @@
+"""Helpers shared by the benchmark scripts."""
+from pathlib import Path
+
+import settings
+
+
+def resolve_video(name):
+    """A key of settings.VIDEOS_DICT or a path, relative to settings.VIDEO_DIR unless it exists as given."""
+    path = Path(settings.VIDEOS_DICT.get(name, name))
+    return path if path.exists() else settings.VIDEO_DIR / path
@@ -0,0 +1,129 @@
+"""
+Merging a survey's detections into unique objects: the grid-hash spatial index
+of survey_dedup versus matching every frame against all objects seen so far.
+
+Frames are simulated windows sliding over a plane of randomly placed objects,
+with their transforms known, so only merging is timed and the unique counts
+can be checked against the truth. With --register the same survey is also
+rendered and registered by feature matching, which times registration and
+reports its corner error. Run from the repository root:
+
+    python benchmarks/bench_dedup.py [--objects 2000 8000 16000] [--register]
+"""
+import argparse
+from pathlib import Path
+import sys
+import time
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import cv2
+import numpy as np
+
+from backends import match_boxes
+import settings
+from survey_dedup import MOTIONS, FeatureRegistrar, SurveyDeduplicator, _downscale, project_boxes
+
+FRAME = (1600, 1200)
+STEP = 400  # pixels between neighbouring frames, 75% forward overlap
+BOX = 28
+
+
+def simulate(objects, seed=0):
+    """
+    A survey strip with `objects` objects at a constant density.
+
+    Returns:
+        (frames, number of objects seen): frames are (boxes, transform) with
+        boxes in frame pixels and the transform from frame to plane pixels.
+    """
+    rng = np.random.default_rng(seed)
+    width, height = FRAME
+    length = int(objects / 2e-4 / height)  # about 200 objects per megapixel
+    centres = np.column_stack([rng.uniform(0, length, objects), rng.uniform(0, height, objects)])
+    frames, seen = [], set()
+    for x0 in range(0, max(length - width, 0) + 1, STEP):
+        angle = np.radians(rng.uniform(-5, 5))
+        cos, sin = np.cos(angle), np.sin(angle)
+        # Plane -> frame: rotate about the frame centre and shift to the window
+        cx, cy = x0 + width / 2, height / 2
+        to_frame = np.array([[cos, sin, width / 2 - cos * cx - sin * cy],
+                             [-sin, cos, height / 2 + sin * cx - cos * cy], [0, 0, 1]])
+        points = centres @ to_frame[:2, :2].T + to_frame[:2, 2]
+        inside = np.flatnonzero((points[:, 0] > BOX) & (points[:, 0] < width - BOX) &
+                                (points[:, 1] > BOX) & (points[:, 1] < height - BOX))
+        seen.update(inside.tolist())
+        points = points[inside] + rng.normal(0, 1.5, (len(inside), 2))
+        frames.append((np.column_stack([points - BOX / 2, points + BOX / 2]), np.linalg.inv(to_frame)))
+    return frames, len(seen)
+
+
+def merge_indexed(frames):
+    dedup = SurveyDeduplicator()
+    for boxes, transform in frames:
+        dedup.add(boxes, np.full(len(boxes), 0.8), ['plastic'] * len(boxes), transform, 'survey', 'frame')
+    return len(dedup.objects)
+
+
+def merge_all_pairs(frames, iou=settings.DEDUP_IOU):
+    """The same greedy one-to-one matching, against every object so far."""
+    objects = np.zeros((0, 4))
+    for boxes, transform in frames:
+        projected = project_boxes(boxes, transform)
+        matched = np.zeros(len(projected), bool)
+        _, candidate, _ = match_boxes(objects, projected, iou)
+        matched[candidate] = True
+        objects = np.concatenate([objects, projected[~matched]])
+    return len(objects)
+
+
+def bench_registration(frames, motion):
+    """Renders the first frames of the survey and registers them by feature matching."""
+    rng = np.random.default_rng(1)
+    width, height = FRAME
+    length = int(max(transform[0, 2] for _, transform in frames[:20])) + 2 * width
+    plane = cv2.GaussianBlur(rng.integers(0, 255, (height, length), dtype=np.uint8), (0, 0), 2)
+    registrar = FeatureRegistrar(motion)
+    errors, times = [], []
+    corners = np.float64([[0, 0], [width, 0], [width, height], [0, height]]).reshape(-1, 1, 2)
+    first = None
+    for _, transform in frames[:20]:
+        image = cv2.warpPerspective(plane, np.linalg.inv(transform), FRAME)
+        start = time.perf_counter()
+        _, registered = registrar.register(*_downscale(image))
+        times.append(time.perf_counter() - start)
+        first = transform if first is None else first
+        # The chain's plane is the first frame's pixels
+        truth = np.linalg.inv(first) @ transform
+        errors.append(np.abs(cv2.perspectiveTransform(corners, registered) -
+                             cv2.perspectiveTransform(corners, truth)).max())
+    print(f"{motion} registration: {1000 * np.mean(times):.1f} ms/frame, {registrar.chain + 1} chain(s), "
+          f"corner error max {max(errors):.1f} px after {len(errors)} frames")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--objects', type=int, nargs='+', default=[2000, 8000, 16000])
+    parser.add_argument('--register', action='store_true', help='also time feature registration')
+    args = parser.parse_args()
+
+    print(f"{'objects':>8} {'frames':>7} {'detections':>11} {'unique':>7} {'index ms':>9} {'all pairs ms':>13}")
+    for objects in args.objects:
+        frames, seen = simulate(objects)
+        start = time.perf_counter()
+        unique = merge_indexed(frames)
+        indexed = time.perf_counter() - start
+        start = time.perf_counter()
+        unique_all_pairs = merge_all_pairs(frames)
+        all_pairs = time.perf_counter() - start
+        detections = sum(len(boxes) for boxes, _ in frames)
+        mismatch = '' if unique == unique_all_pairs else f"  (all pairs: {unique_all_pairs})"
+        print(f"{seen:>8} {len(frames):>7} {detections:>11} {unique:>7} {1000 * indexed:>9.0f} "
+              f"{1000 * all_pairs:>13.0f}{mismatch}")
+    if args.register:
+        for motion in MOTIONS:
+            bench_registration(frames, motion)
+
+
+if __name__ == '__main__':
+    main()
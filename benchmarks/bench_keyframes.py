@@ -0,0 +1,117 @@
+"""
+Speed/recall trade-off of keyframe inference on a stored video.
+
+Every mode is compared against running the tracker on every frame. Recall is
+the share of those boxes that the keyframe mode reproduces (inferred or
+propagated) with IoU >= 0.5. "source FPS" is how many frames of the video are
+covered per second of processing. Run from the repository root:
+
+    python benchmarks/bench_keyframes.py [--video video_1] [--frames 300] [--every 2 5 10] [--motion 0.04]
+"""
+import argparse
+from pathlib import Path
+import sys
+import time
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import cv2
+
+from _common import resolve_video
+import helper
+import settings
+from backends import match_boxes
+from keyframes import BoxPropagator, KeyframeScheduler, grab_reader
+
+TRACKER = 'bytetrack.yaml'
+
+
+def full_inference(model, video_path, max_frames):
+    model = model.tracking_copy()
+    vid_cap = cv2.VideoCapture(str(video_path))
+    boxes = {}
+    start = time.perf_counter()
+    for index in range(max_frames):
+        success, image = vid_cap.read()
+        if not success:
+            break
+        boxes[index] = helper.detect_frame(0.35, model, image, True, TRACKER, index).boxes
+    elapsed = time.perf_counter() - start
+    vid_cap.release()
+    return boxes, len(boxes) / elapsed
+
+
+def keyframe_inference(model, video_path, max_frames, scheduler):
+    """Decodes every frame, infers keyframes and propagates boxes to the rest."""
+    model = model.tracking_copy()
+    propagator = BoxPropagator()
+    vid_cap = cv2.VideoCapture(str(video_path))
+    boxes = {}
+    start = time.perf_counter()
+    for index in range(max_frames):
+        success, image = vid_cap.read()
+        if not success:
+            break
+        if scheduler.is_keyframe(image, index):
+            frame_result = helper.detect_frame(0.35, model, image, True, TRACKER, index)
+            propagator.update(frame_result)
+        else:
+            frame_result = helper.propagated_frame(model, image, propagator, index)
+        boxes[index] = frame_result.boxes
+    elapsed = time.perf_counter() - start
+    vid_cap.release()
+    return boxes, len(boxes) / elapsed
+
+
+def grab_inference(model, video_path, max_frames, every_n):
+    """Decodes and infers only every n-th frame; the rest are grabbed."""
+    model = model.tracking_copy()
+    vid_cap = cv2.VideoCapture(str(video_path))
+    read = grab_reader(vid_cap, every_n)
+    covered = 0
+    start = time.perf_counter()
+    while covered < max_frames:
+        success, image, index = read()
+        if not success:
+            break
+        helper.detect_frame(0.35, model, image, True, TRACKER, index)
+        covered = index + every_n
+    elapsed = time.perf_counter() - start
+    vid_cap.release()
+    return covered / elapsed
+
+
+def recall(reference, candidate):
+    found = total = 0
+    for index, ref in reference.items():
+        found += len(match_boxes(ref, candidate.get(index, ref[:0]), 0.5)[0])
+        total += len(ref)
+    return found / total if total else 1.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--video', default='video_1', help='key of settings.VIDEOS_DICT or a path')
+    parser.add_argument('--frames', type=int, default=300)
+    parser.add_argument('--every', type=int, nargs='+', default=[2, 5, 10])
+    parser.add_argument('--motion', type=float, default=settings.KEYFRAME_MOTION_THRESHOLD)
+    args = parser.parse_args()
+
+    model = helper.load_model(settings.DETECTION_MODEL)
+    video_path = resolve_video(args.video)
+
+    reference, full_fps = full_inference(model, video_path, args.frames)
+    print(f"{'mode':>26} {'inferred':>9} {'source FPS':>11} {'grab FPS':>9} {'recall@0.5':>11}")
+    print(f"{'every frame':>26} {'100%':>9} {full_fps:>11.1f} {'-':>9} {1.0:>11.3f}")
+
+    schedulers = [(f"every {n} frames", KeyframeScheduler(n), n) for n in args.every]
+    schedulers.append((f"motion > {args.motion:.2f}", KeyframeScheduler(max(args.every), args.motion), None))
+    for label, scheduler, every_n in schedulers:
+        boxes, fps = keyframe_inference(model, video_path, args.frames, scheduler)
+        grab_fps = f"{grab_inference(model, video_path, args.frames, every_n):.1f}" if every_n else '-'
+        print(f"{label:>26} {100 * scheduler.keyframe_ratio:>8.0f}% {fps:>11.1f} {grab_fps:>9} "
+              f"{recall(reference, boxes):>11.3f}")
+
+
+if __name__ == '__main__':
+    main()
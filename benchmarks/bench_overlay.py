@@ -0,0 +1,62 @@
+"""
+Per-frame cost of drawing detections: ultralytics' `Results.plot()` plus the
+BGR->RGB copy the app used to make, versus OverlayRenderer in each mode.
+
+Inference runs once per frame up front; only drawing is timed. Run from the
+repository root:
+
+    python benchmarks/bench_overlay.py [--video video_1] [--frames 150]
+"""
+import argparse
+from pathlib import Path
+import sys
+import time
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import cv2
+import numpy as np
+
+from _common import resolve_video
+import helper
+import settings
+from overlay import MODES, OverlayRenderer
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--video', default='video_1', help='key of settings.VIDEOS_DICT or a path')
+    parser.add_argument('--frames', type=int, default=150)
+    args = parser.parse_args()
+
+    model = helper.load_model(settings.DETECTION_MODEL)
+    vid_cap = cv2.VideoCapture(str(resolve_video(args.video)))
+    results = []
+    while len(results) < args.frames:
+        success, image = vid_cap.read()
+        if not success:
+            break
+        results.append(model.predict(image, conf=0.35, verbose=False)[0])
+    vid_cap.release()
+
+    start = time.perf_counter()
+    for result in results:
+        np.ascontiguousarray(result.plot()[:, :, ::-1])
+    timings = {'plot() + RGB copy': time.perf_counter() - start}
+    for mode, label in MODES.items():
+        renderer = OverlayRenderer(mode)
+        start = time.perf_counter()
+        for result in results:
+            data = result.boxes.data.cpu().numpy()
+            renderer.draw(result.orig_img, data[:, :4], data[:, -2], data[:, -1].astype(int), result.names)
+        timings[label] = time.perf_counter() - start
+
+    boxes = sum(len(result.boxes) for result in results)
+    print(f"{len(results)} frames, {boxes / max(len(results), 1):.1f} boxes per frame")
+    print(f"{'renderer':>20} {'ms/frame':>9}")
+    for label, seconds in timings.items():
+        print(f"{label:>20} {1000 * seconds / max(len(results), 1):>9.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+"""
+Pixels inferred and throughput with region-of-interest crops versus whole frames.
+
+Recall is the share of whole-frame boxes whose centre lies in the ROI that the
+ROI run reproduces with IoU >= 0.5. Run from the repository root:
+
+    python benchmarks/bench_roi.py [--video video_1] [--frames 150] [--roi "0,0.4 1,0.4 1,1 0,1"]
+"""
+import argparse
+from pathlib import Path
+import sys
+import time
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import cv2
+
+from _common import resolve_video
+import helper
+import settings
+from backends import match_boxes
+from roi import RoiConfig, _inside, parse_polygons
+
+
+def run(model, video_path, max_frames, roi=None):
+    vid_cap = cv2.VideoCapture(str(video_path))
+    boxes, shape = [], None
+    start = time.perf_counter()
+    while len(boxes) < max_frames:
+        success, image = vid_cap.read()
+        if not success:
+            break
+        frame_result = helper.detect_frame(0.35, model, image, frame_index=len(boxes), roi=roi)
+        boxes.append(frame_result.boxes)
+        shape = frame_result.image.shape
+    elapsed = time.perf_counter() - start
+    vid_cap.release()
+    return boxes, len(boxes) / elapsed, shape
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--video', default='video_1', help='key of settings.VIDEOS_DICT or a path')
+    parser.add_argument('--frames', type=int, default=150)
+    parser.add_argument('--roi', help='polygons as in the sidebar, lines separated by ";" '
+                                      '(default: settings.ROI_POLYGONS of the video, else the lower 60%%)')
+    args = parser.parse_args()
+
+    if args.roi:
+        polygons = parse_polygons(args.roi.replace(';', '\n'))
+    else:
+        polygons = settings.ROI_POLYGONS.get(args.video) or parse_polygons("0,0.4 1,0.4 1,1 0,1")
+    model = helper.load_model(settings.DETECTION_MODEL)
+    video_path = resolve_video(args.video)
+
+    full, full_fps, shape = run(model, video_path, args.frames)
+    roi = RoiConfig(polygons)
+    cropped, roi_fps, _ = run(model, video_path, args.frames, roi)
+
+    # Boxes are in the coordinates of the resized frames
+    _, mask = roi.geometry(shape[1], shape[0])
+    found = total = 0
+    for reference, candidate in zip(full, cropped):
+        reference = reference[_inside(reference, mask)] if len(reference) else reference
+        found += len(match_boxes(reference, candidate, 0.5)[0])
+        total += len(reference)
+
+    print(f"{'mode':>12} {'pixels/frame':>13} {'FPS':>7}")
+    print(f"{'full frame':>12} {'100%':>13} {full_fps:>7.1f}")
+    print(f"{'ROI':>12} {100 * roi.pixel_ratio:>12.0f}% {roi_fps:>7.1f}")
+    print(f"speed-up x{roi_fps / full_fps:.2f}, recall inside ROI {found / total if total else 1.0:.3f}")
+
+
+if __name__ == '__main__':
+    main()
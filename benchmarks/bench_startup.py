@@ -0,0 +1,93 @@
+"""
+Import time of the modules the app loads before any mode is opened.
+
+Runs `python -X importtime` in fresh interpreters, reports the cumulative
+import time and the slowest modules, and fails when the median is over the
+budget or when a mode-specific dependency is imported at startup. Run from
+the repository root:
+
+    python benchmarks/bench_startup.py [--runs 5] [--budget-ms 2500] [--json runs/startup.json]
+"""
+import argparse
+import json
+from pathlib import Path
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+import settings
+
+# What streamlit_detection_app.py imports at module level
+STARTUP_MODULES = ('streamlit', 'settings', 'helper', 'stage_metrics')
+# Loaded only by the mode or feature that needs them
+LAZY_MODULES = ('ultralytics', 'torch', 'pytube', 'pyarrow', 'pandas', 'pdf2image', 'http.server')
+
+
+def measure(modules):
+    """
+    Imports `modules` in a fresh interpreter with -X importtime.
+
+    Returns:
+        (wall seconds, {module: (self us, cumulative us)}, top-level module names in import order)
+    """
+    start = time.perf_counter()
+    completed = subprocess.run([sys.executable, '-X', 'importtime', '-c', f"import {', '.join(modules)}"],
+                               cwd=ROOT, capture_output=True, text=True)
+    wall = time.perf_counter() - start
+    if completed.returncode != 0:
+        raise RuntimeError(completed.stderr.strip().splitlines()[-1])
+    times, top_level = {}, []
+    for line in completed.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        times[name.strip()] = (int(self_us), int(cumulative_us))
+        # Nested imports are indented under the module that triggered them
+        if not name[1:].startswith(' '):
+            top_level.append(name.strip())
+    return wall, times, top_level
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--budget-ms', type=float, default=settings.STARTUP_IMPORT_BUDGET_MS)
+    parser.add_argument('--top', type=int, default=15, help='slowest modules to list')
+    parser.add_argument('--json', help='also write the results to this file')
+    args = parser.parse_args()
+
+    runs = [measure(STARTUP_MODULES) for _ in range(args.runs)]
+    # Interpreter start-up (site, encodings) is not counted, only what the app's imports add
+    totals = [sum(times[name][1] for name in STARTUP_MODULES if name in top_level) / 1000
+              for _, times, top_level in runs]
+    median_ms = statistics.median(totals)
+    _, times, _ = runs[totals.index(sorted(totals)[len(totals) // 2])]
+    leaked = [name for name in LAZY_MODULES if name in times]
+
+    print(f"{'module':>40} {'self ms':>9} {'cumulative ms':>14}")
+    for name, (self_us, cumulative_us) in sorted(times.items(), key=lambda item: -item[1][0])[:args.top]:
+        print(f"{name:>40} {self_us / 1000:>9.1f} {cumulative_us / 1000:>14.1f}")
+    print(f"import time: median {median_ms:.0f} ms over {args.runs} runs "
+          f"(min {min(totals):.0f}, max {max(totals):.0f}), budget {args.budget_ms:.0f} ms; "
+          f"interpreter wall time {statistics.median(wall for wall, _, _ in runs) * 1000:.0f} ms")
+    if leaked:
+        print(f"imported at startup but should be lazy: {', '.join(leaked)}")
+
+    passed = median_ms <= args.budget_ms and not leaked
+    if args.json:
+        Path(args.json).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.json).write_text(json.dumps({
+            'modules': STARTUP_MODULES, 'runs_ms': totals, 'median_ms': median_ms,
+            'budget_ms': args.budget_ms, 'leaked': leaked, 'passed': passed,
+            'slowest': {name: {'self_ms': s / 1000, 'cumulative_ms': c / 1000}
+                        for name, (s, c) in sorted(times.items(), key=lambda item: -item[1][0])[:args.top]},
+        }, indent=2))
+    sys.exit(0 if passed else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+"""
+Throughput of the stored-video path: one inference per frame versus the old
+loop that ran `_display_detected_frames` twice per frame.
+
+Run from the repository root:
+
+    python benchmarks/bench_stored_video.py [--video video_1] [--frames 150] [--track]
+"""
+import argparse
+from pathlib import Path
+import sys
+import time
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import cv2
+
+from _common import resolve_video
+import helper
+import settings
+
+
+def run(model, video_path, max_frames, calls_per_frame, track):
+    # A fresh predictor also means a fresh tracker state for every run
+    model = model.tracking_copy()
+    tracker = 'bytetrack.yaml' if track else None
+    vid_cap = cv2.VideoCapture(str(video_path))
+    frames = 0
+    start = time.perf_counter()
+    while frames < max_frames:
+        success, image = vid_cap.read()
+        if not success:
+            break
+        for _ in range(calls_per_frame):
+            helper.detect_frame(0.35, model, image, track, tracker, frames)
+        frames += 1
+    elapsed = time.perf_counter() - start
+    vid_cap.release()
+    return frames, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--video', default='video_1', help='key of settings.VIDEOS_DICT or a path')
+    parser.add_argument('--frames', type=int, default=150)
+    parser.add_argument('--track', action='store_true', help='use model.track instead of predict')
+    args = parser.parse_args()
+
+    model = helper.load_model(settings.DETECTION_MODEL)
+    video_path = resolve_video(args.video)
+
+    results = {}
+    for label, calls in (('two inferences/frame (old)', 2), ('one inference/frame', 1)):
+        frames, elapsed = run(model, video_path, args.frames, calls, args.track)
+        results[label] = frames / elapsed
+        print(f"{label:>28}: {frames} frames in {elapsed:.2f}s -> {frames / elapsed:.2f} FPS")
+
+    old, new = results.values()
+    print(f"{'speed-up':>28}: {new / old:.2f}x")
+
+
+if __name__ == '__main__':
+    main()
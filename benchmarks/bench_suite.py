@@ -0,0 +1,295 @@
+"""
+Throughput, latency and memory of the main detection paths, written to JSON.
+
+Cases (each runs in its own subprocess, so peak RSS and cold loads are per case):
+
+    load             helper.load_model cold (first load in the process) and warm (registry hit)
+    image            single-image predict on settings.DEFAULT_IMAGE
+    batch            helper.detect_images over generated images
+    video            the _display_detected_frames loop over --sample-video
+    synthetic_video  the same loop over a generated video, so the suite also runs without sample data
+
+Images and videos are generated from a fixed seed, so runs are comparable
+across commits. Cases named with --cases fail when their input is missing;
+without --cases, those cases are skipped with a note. Tail percentiles are
+left out of the results when a case has fewer than MIN_TAIL_SAMPLES timings.
+Run from the repository root:
+
+    python benchmarks/bench_suite.py [--cases image,video] [--frames 150] [--json runs/benchmarks/HEAD.json]
+    python benchmarks/bench_suite.py --compare runs/benchmarks/old.json runs/benchmarks/new.json
+"""
+import argparse
+import json
+from pathlib import Path
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+import cv2
+import numpy as np
+
+from _common import resolve_video
+import settings
+from overlay import OverlayRenderer
+
+CASES = ('load', 'image', 'batch', 'video', 'synthetic_video')
+SEED = 0
+# Lower is better for all of these; compared by --compare
+METRICS = ('cold_s', 'warm_ms', 'p50_ms', 'p95_ms', 'p99_ms', 'peak_rss_mb', 'py_alloc_peak_mb')
+MIN_TAIL_SAMPLES = 20  # fewer timings than this give no p95/p99
+BATCH_REPEAT = 20  # timed detect_images passes in the batch case
+
+
+def synthetic_frames(count, size=(1280, 720), seed=SEED):
+    """Frames of textured water with drifting bright blobs, the same for every run."""
+    rng = np.random.default_rng(seed)
+    width, height = size
+    background = cv2.GaussianBlur(rng.integers(40, 120, (height, width, 3), dtype=np.uint8), (0, 0), 3)
+    blobs = rng.uniform([0, 0, 8, -4, -4], [width, height, 40, 4, 4], (12, 5))
+    colors = rng.integers(120, 256, (12, 3)).tolist()
+    for index in range(count):
+        frame = background.copy()
+        for (x, y, radius, dx, dy), color in zip(blobs, colors):
+            center = (int((x + dx * index) % width), int((y + dy * index) % height))
+            cv2.ellipse(frame, center, (int(radius), int(radius * 0.6)), 0, 0, 360, color, -1, cv2.LINE_AA)
+        yield frame
+
+
+def write_synthetic_images(folder, count):
+    folder.mkdir(parents=True, exist_ok=True)
+    paths = []
+    for index, frame in enumerate(synthetic_frames(count, size=(2000, 1500))):
+        path = folder / f"synthetic_{index:04d}.jpg"
+        cv2.imwrite(str(path), frame)
+        paths.append(str(path))
+    return paths
+
+
+def write_synthetic_video(path, count, fps=25):
+    writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*'mp4v'), fps, (1280, 720))
+    for frame in synthetic_frames(count):
+        writer.write(frame)
+    writer.release()
+    return str(path)
+
+
+def latency(times_ms):
+    """Mean and percentiles of the timings; p95 and p99 are None below MIN_TAIL_SAMPLES timings."""
+    times_ms = np.asarray(times_ms)
+    p50, p95, p99 = np.percentile(times_ms, [50, 95, 99]).tolist()
+    if len(times_ms) < MIN_TAIL_SAMPLES:
+        p95 = p99 = None
+    return {'frames': len(times_ms), 'mean_ms': float(times_ms.mean()), 'p50_ms': p50, 'p95_ms': p95,
+            'p99_ms': p99, 'fps': 1000 / float(times_ms.mean())}
+
+
+def case_inputs(cases, sample_video):
+    """Returns {case: missing input} for the cases whose input file does not exist."""
+    inputs = {'image': Path(settings.DEFAULT_IMAGE), 'video': sample_video}
+    return {case: inputs[case] for case in cases if case in inputs and not inputs[case].exists()}
+
+
+def _allocations(func, repeat):
+    """Peak Python heap growth (tracemalloc) over `repeat` calls, measured apart from the timings."""
+    tracemalloc.start()
+    try:
+        for _ in range(repeat):
+            func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak / 1024 ** 2
+
+
+class _NullFrame:
+    """Stands in for the Streamlit placeholder; the frames are only produced, not shown."""
+
+    def image(self, *args, **kwargs):
+        pass
+
+
+def _video_loop(model, path, max_frames):
+    import helper
+
+    vid_cap = cv2.VideoCapture(path)
+    times, frame_index = [], 0
+    renderer = OverlayRenderer()
+    while frame_index < max_frames:
+        success, image = vid_cap.read()
+        if not success:
+            break
+        start = time.perf_counter()
+        helper._display_detected_frames(0.35, model, _NullFrame(), image, frame_index=frame_index,
+                                        renderer=renderer)
+        times.append(1000 * (time.perf_counter() - start))
+        frame_index += 1
+    vid_cap.release()
+    return times
+
+
+def run_case(case, args):
+    """Runs one case. Meant to run in its own process."""
+    import helper
+
+    start = time.perf_counter()
+    model = helper.load_model(settings.DETECTION_MODEL)
+    cold_s = time.perf_counter() - start
+    result = {'case': case}
+
+    if case == 'load':
+        warm = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            helper.load_model(settings.DETECTION_MODEL)
+            warm.append(1000 * (time.perf_counter() - start))
+        result.update({'cold_s': cold_s, 'warm_ms': float(np.median(warm))})
+    elif case == 'image':
+        image = cv2.imread(str(settings.DEFAULT_IMAGE))
+        if image is None:
+            raise RuntimeError(f"Could not read {settings.DEFAULT_IMAGE}")
+
+        def predict():
+            model.predict(image, conf=0.35, imgsz=settings.IMAGE_IMGSZ, verbose=False)
+
+        predict()
+        times = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            predict()
+            times.append(1000 * (time.perf_counter() - start))
+        result.update(latency(times))
+        result['py_alloc_peak_mb'] = _allocations(predict, 3)
+    elif case == 'batch':
+        def detect():
+            for _ in helper.detect_images(model, args.images, 0.35):
+                pass
+
+        detect()
+        times = []
+        for _ in range(args.batch_repeat):
+            start = time.perf_counter()
+            detect()
+            times.append(1000 * (time.perf_counter() - start) / len(args.images))
+        result.update(latency(times))
+        result['images'] = len(args.images)
+        result['py_alloc_peak_mb'] = _allocations(detect, 1)
+    else:
+        path = args.video if case == 'synthetic_video' else str(resolve_video(args.sample_video))
+        _video_loop(model, path, 3)
+        result.update(latency(_video_loop(model, path, args.frames)))
+        result['py_alloc_peak_mb'] = _allocations(lambda: _video_loop(model, path, 10), 1)
+
+    # ru_maxrss is in kilobytes on Linux
+    result['peak_rss_mb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return result
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(old_path, new_path):
+    old, new = json.loads(Path(old_path).read_text()), json.loads(Path(new_path).read_text())
+    print(f"{old.get('commit')} -> {new.get('commit')}")
+    print(f"{'case':>16} {'metric':>16} {'old':>10} {'new':>10} {'change':>8}")
+    for case, metrics in new['cases'].items():
+        for metric in METRICS:
+            before = old['cases'].get(case, {}).get(metric)
+            after = metrics.get(metric)
+            if before is None or after is None:
+                continue
+            change = 100 * (after - before) / before if before else 0.0
+            print(f"{case:>16} {metric:>16} {before:>10.2f} {after:>10.2f} {change:>+7.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--cases', help='comma-separated subset of: ' + ', '.join(CASES) + ' (default: all)')
+    parser.add_argument('--sample-video', default='video_1',
+                        help='key of settings.VIDEOS_DICT or a path, for the video case')
+    parser.add_argument('--frames', type=int, default=150, help='video frames per video case')
+    parser.add_argument('--repeat', type=int, default=50, help='predict calls in the image and load cases')
+    parser.add_argument('--batch-repeat', type=int, default=BATCH_REPEAT,
+                        help='timed passes over the generated images in the batch case')
+    parser.add_argument('--num-images', type=int, default=32, help='generated images in the batch case')
+    parser.add_argument('--json', help='results file (default: runs/benchmarks/<commit>.json)')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help='compare two results files')
+    parser.add_argument('--worker', choices=CASES, help=argparse.SUPPRESS)
+    parser.add_argument('--images', nargs='*', help=argparse.SUPPRESS)
+    parser.add_argument('--video', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+    if args.worker:
+        print(json.dumps(run_case(args.worker, args)))
+        return
+
+    cases = [case for case in (args.cases or ','.join(CASES)).split(',') if case]
+    unknown = set(cases) - set(CASES)
+    if unknown:
+        parser.error(f"unknown cases: {', '.join(sorted(unknown))}")
+    missing = case_inputs(cases, resolve_video(args.sample_video))
+    if missing and args.cases:
+        parser.error('; '.join(f"{case} case: {path} not found" for case, path in missing.items()))
+    for case, path in missing.items():
+        print(f"{path} not found, skipping the {case} case")
+        cases.remove(case)
+    scratch = Path(tempfile.mkdtemp(prefix='bench-suite-'))
+    try:
+        images = write_synthetic_images(scratch / 'images', args.num_images)
+        video = write_synthetic_video(scratch / 'synthetic.mp4', args.frames + 10)
+        results = {}
+        for case in cases:
+            process = subprocess.run([sys.executable, __file__, '--worker', case, '--frames', str(args.frames),
+                                      '--repeat', str(args.repeat), '--batch-repeat', str(args.batch_repeat),
+                                      '--sample-video', args.sample_video, '--video', video,
+                                      '--images', *images], cwd=ROOT, capture_output=True, text=True)
+            if process.returncode != 0:
+                sys.exit(f"{case} case failed:\n{process.stderr}")
+            results[case] = json.loads(process.stdout.strip().splitlines()[-1])
+            results[case].pop('case')
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    commit = _git_commit()
+    report = {
+        'commit': commit,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'processor': platform.processor(),
+        'model': str(settings.DETECTION_MODEL),
+        'imgsz': {'image': settings.IMAGE_IMGSZ, 'video': settings.VIDEO_IMGSZ},
+        'cases': results,
+    }
+    print(f"{'case':>16} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'FPS':>7} {'peak RSS MB':>12}")
+    for case, r in results.items():
+        if case == 'load':
+            print(f"{case:>16} cold {r['cold_s']:.2f}s, warm {r['warm_ms']:.3f} ms, "
+                  f"peak RSS {r['peak_rss_mb']:.0f} MB")
+            continue
+        p95, p99 = (f"{r[key]:>8.1f}" if r[key] is not None else f"{'-':>8}" for key in ('p95_ms', 'p99_ms'))
+        print(f"{case:>16} {r['p50_ms']:>8.1f} {p95} {p99} {r['fps']:>7.1f} {r['peak_rss_mb']:>12.0f}")
+
+    path = Path(args.json) if args.json else ROOT / 'runs' / 'benchmarks' / f"{commit or 'results'}.json"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(report, indent=2))
+    print(f"results written to {path}")
+
+
+if __name__ == '__main__':
+    main()
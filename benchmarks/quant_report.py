@@ -0,0 +1,111 @@
+"""
+Accuracy/speed report of the INT8 quantized model against FP32.
+
+Each variant runs in its own subprocess so its peak RSS is measured on its
+own. Recall is the share of FP32 boxes that the INT8 model finds with
+IoU >= 0.5. Run from the repository root:
+
+    python benchmarks/quant_report.py [--images images/sample_images] [--calibration-dir DIR] [--json out.json]
+"""
+import argparse
+import json
+from pathlib import Path
+import resource
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import numpy as np
+
+import backends
+import settings
+
+
+VARIANTS = ('fp32', 'int8')
+
+
+def _load(variant, calibration_dir):
+    from ultralytics import YOLO
+
+    if variant == 'int8':
+        artifact = backends.export_model(settings.DETECTION_MODEL, settings.BACKEND_OPENVINO, verify=False,
+                                         int8=True, calibration_dir=calibration_dir)
+    else:
+        artifact = backends.export_model(settings.DETECTION_MODEL, settings.BACKEND_OPENVINO, verify=False)
+    return YOLO(str(artifact), task='detect')
+
+
+def run_variant(variant, images, calibration_dir, conf, warmup=3):
+    """Runs one model variant over the images. Meant to run in its own process."""
+    model = _load(variant, calibration_dir)
+    for image in images[:warmup]:
+        model.predict(str(image), conf=conf, verbose=False)
+    boxes, times = [], []
+    for image in images:
+        start = time.perf_counter()
+        result = model.predict(str(image), conf=conf, verbose=False)[0]
+        times.append(1000 * (time.perf_counter() - start))
+        boxes.append(result.boxes.xyxy.cpu().numpy().tolist())
+    return {
+        'variant': variant,
+        'ms_per_frame': float(np.mean(times)),
+        'p95_ms': float(np.percentile(times, 95)),
+        # ru_maxrss is in kilobytes on Linux
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        'boxes': boxes,
+    }
+
+
+def recall(reference_boxes, candidate_boxes, iou_threshold=0.5):
+    found = total = 0
+    for ref, cand in zip(reference_boxes, candidate_boxes):
+        ref = np.array(ref, dtype=float).reshape(-1, 4)
+        cand = np.array(cand, dtype=float).reshape(-1, 4)
+        found += len(backends.match_boxes(ref, cand, iou_threshold)[0])
+        total += len(ref)
+    return found / total if total else 1.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare FP32 and INT8 detection models.")
+    parser.add_argument('--images', default=str(settings.IMAGES_DIR), help='folder of evaluation images')
+    parser.add_argument('--calibration-dir', default=str(settings.INT8_CALIBRATION_DIR))
+    parser.add_argument('--conf', type=float, default=0.35)
+    parser.add_argument('--json', help='also write the report to this file')
+    parser.add_argument('--worker', choices=VARIANTS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    images = backends.list_images(args.images)
+    if args.worker:
+        print(json.dumps(run_variant(args.worker, images, args.calibration_dir, args.conf)))
+        return
+
+    results = {}
+    for variant in VARIANTS:
+        output = subprocess.run([sys.executable, __file__, '--worker', variant, '--images', args.images,
+                                 '--calibration-dir', args.calibration_dir, '--conf', str(args.conf)],
+                                check=True, capture_output=True, text=True).stdout
+        results[variant] = json.loads(output.strip().splitlines()[-1])
+
+    report = {
+        'images': len(images),
+        'recall_at_iou50': recall(results['fp32']['boxes'], results['int8']['boxes']),
+    }
+    for variant in VARIANTS:
+        report[variant] = {k: v for k, v in results[variant].items() if k not in ('variant', 'boxes')}
+    report['speedup'] = report['fp32']['ms_per_frame'] / report['int8']['ms_per_frame']
+
+    print(f"{'':>6} {'ms/frame':>9} {'p95 ms':>8} {'peak RSS MB':>12}")
+    for variant in VARIANTS:
+        r = report[variant]
+        print(f"{variant:>6} {r['ms_per_frame']:>9.1f} {r['p95_ms']:>8.1f} {r['peak_rss_mb']:>12.0f}")
+    print(f"INT8 speed-up: {report['speedup']:.2f}x, box recall vs FP32 at IoU 0.5: "
+          f"{report['recall_at_iou50']:.3f} over {len(images)} images")
+    if args.json:
+        Path(args.json).write_text(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
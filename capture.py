@@ -0,0 +1,184 @@
+"""
+Low-latency, self-healing capture for live sources.
+
+OpenCV buffers frames inside VideoCapture, so a reader that is slower than
+the camera gets older and older frames. ResilientCapture grabs frames in a
+background thread as fast as the source delivers them and only decodes the
+newest one when the consumer asks for a frame. When the source fails it is
+reopened with exponential backoff; the source address is resolved again on
+every attempt, which is how expired YouTube stream URLs are renewed.
+
+Recorded sources (a YouTube video is a progressive MP4) can be decoded much
+faster than real time, which would fast-forward them: with `live=False`
+frames are grabbed at their presentation time instead, so playback runs at
+the source's speed and only frames the consumer is too slow for are skipped.
+"""
+from dataclasses import dataclass
+import threading
+import time
+
+import cv2
+
+import settings
+
+
+@dataclass
+class CaptureMetrics:
+    status: str  # 'connecting', 'live', 'reconnecting', 'ended' or 'closed'
+    reconnects: int
+    staleness_s: float  # time since the source last delivered a frame
+    frame_age_ms: float  # mean time from grab to hand-over to the consumer
+    frames_grabbed: int
+    frames_served: int
+
+
+class ResilientCapture:
+    """
+    Drop-in for a live cv2.VideoCapture: `read()` returns the freshest frame.
+
+    `read()` blocks while the source reconnects and returns (False, None)
+    once the capture is released, the source ends (files and recorded
+    videos) or `max_reconnects` attempts in a row have failed.
+    """
+
+    def __init__(self, resolve, backoff_initial=settings.CAPTURE_BACKOFF_INITIAL,
+                 backoff_max=settings.CAPTURE_BACKOFF_MAX, max_reconnects=settings.CAPTURE_MAX_RECONNECTS,
+                 live=True):
+        """
+        Parameters:
+            resolve: Callable returning what cv2.VideoCapture should open
+                (URL, path or device index). Called again before every reconnect.
+            live (bool): The source delivers frames in real time (RTSP, webcam).
+                False for recorded videos, whose grabs are paced to their timestamps.
+            backoff_initial (float): Seconds to wait before the first reconnect.
+            backoff_max (float): Longest wait between reconnects.
+            max_reconnects (int): Failed attempts in a row before giving up, None retries forever.
+        """
+        self.resolve = resolve
+        self.backoff_initial = backoff_initial
+        self.backoff_max = backoff_max
+        self.max_reconnects = max_reconnects
+        self.live = live
+        self.status = 'connecting'
+        self.reconnects = 0
+        self.frames_grabbed = 0
+        self.frames_served = 0
+        self.last_error = None
+        self.last_captured = None  # grab time of the frame read() returned last
+        self._frame_age_s = 0.0
+        self._last_grab = None
+        self._frame = None
+        self._captured = None
+        self._wanted = False
+        self._cond = threading.Condition()
+        self._closed = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _open(self, position_ms):
+        vid_cap = cv2.VideoCapture(self.resolve())
+        vid_cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        if position_ms and vid_cap.isOpened():
+            # A recorded stream whose URL expired: continue where it stopped
+            vid_cap.set(cv2.CAP_PROP_POS_MSEC, position_ms)
+        return vid_cap
+
+    @staticmethod
+    def _position_s(vid_cap):
+        """Timestamp of the frame just grabbed, or None when the source does not report one."""
+        position_ms = vid_cap.get(cv2.CAP_PROP_POS_MSEC)
+        if position_ms > 0:
+            return position_ms / 1000
+        fps = vid_cap.get(cv2.CAP_PROP_FPS)
+        return vid_cap.get(cv2.CAP_PROP_POS_FRAMES) / fps if fps > 0 else None
+
+    @staticmethod
+    def _at_end(vid_cap):
+        """True for sources with a known length that have been read to the end."""
+        total = vid_cap.get(cv2.CAP_PROP_FRAME_COUNT)
+        return total > 0 and vid_cap.get(cv2.CAP_PROP_POS_FRAMES) >= total
+
+    def _run(self):
+        backoff, failures, position_ms = self.backoff_initial, 0, 0.0
+        while not self._closed.is_set():
+            try:
+                vid_cap = self._open(position_ms)
+            except Exception as e:
+                self.last_error = e
+                vid_cap = None
+            ended = False
+            # Wall-clock time at which the video's timeline started, continued after a reconnect
+            clock_start = time.perf_counter() - position_ms / 1000
+            while vid_cap is not None and vid_cap.isOpened() and not self._closed.is_set():
+                if not vid_cap.grab():
+                    ended = self._at_end(vid_cap)
+                    break
+                if not self.live:
+                    position_s = self._position_s(vid_cap)
+                    if position_s is not None and self._closed.wait(
+                            max(0.0, position_s - (time.perf_counter() - clock_start))):
+                        break
+                captured = time.perf_counter()
+                self._last_grab = captured
+                self.frames_grabbed += 1
+                self.status = 'live'
+                backoff, failures = self.backoff_initial, 0
+                position_ms = vid_cap.get(cv2.CAP_PROP_POS_MSEC)
+                with self._cond:
+                    wanted = self._wanted
+                if not wanted:
+                    continue
+                success, frame = vid_cap.retrieve()
+                if success:
+                    with self._cond:
+                        self._frame, self._captured, self._wanted = frame, captured, False
+                        self._cond.notify_all()
+            if vid_cap is not None:
+                vid_cap.release()
+            if ended or self._closed.is_set():
+                break
+            failures += 1
+            if self.max_reconnects is not None and failures > self.max_reconnects:
+                break
+            self.status = 'reconnecting'
+            if self._closed.wait(backoff):
+                break
+            backoff = min(backoff * 2, self.backoff_max)
+            self.reconnects += 1
+        self.status = 'ended' if not self._closed.is_set() else 'closed'
+        with self._cond:
+            self._cond.notify_all()
+
+    def read(self):
+        """Waits for the next frame grabbed after this call and returns (success, frame)."""
+        with self._cond:
+            self._wanted = True
+            while self._frame is None:
+                if self._closed.is_set() or not self._thread.is_alive():
+                    return False, None
+                self._cond.wait(timeout=0.1)
+            frame, captured = self._frame, self._captured
+            self._frame = None
+        self.frames_served += 1
+        self.last_captured = captured
+        self._frame_age_s += time.perf_counter() - captured
+        return True, frame
+
+    def isOpened(self):
+        return not self._closed.is_set() and self._thread.is_alive()
+
+    def release(self):
+        self._closed.set()
+        with self._cond:
+            self._cond.notify_all()
+        self._thread.join(timeout=1)
+
+    def metrics(self):
+        return CaptureMetrics(
+            status=self.status,
+            reconnects=self.reconnects,
+            staleness_s=time.perf_counter() - self._last_grab if self._last_grab is not None else float('inf'),
+            frame_age_ms=1000 * self._frame_age_s / self.frames_served if self.frames_served else 0.0,
+            frames_grabbed=self.frames_grabbed,
+            frames_served=self.frames_served,
+        )
@@ -0,0 +1,218 @@
+"""
+Append-only detection store backed by a Parquet file.
+
+Video loops append one result per inferred frame. Results are buffered until
+a row group is full and then written out, so memory stays bounded however
+long the video runs. Exports (CSV, Parquet, COCO JSON) read the file back one
+record batch at a time instead of loading the whole table.
+"""
+import json
+from pathlib import Path
+import threading
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+import detection_table
+import settings
+from result_cache import Detections
+
+SCHEMA = pa.schema([
+    ('File_name', pa.string()),
+    ('frame', pa.int64()),
+    ('object_id', pa.int64()),
+    ('X1', pa.float32()),
+    ('Y1', pa.float32()),
+    ('X2', pa.float32()),
+    ('Y2', pa.float32()),
+    ('Width', pa.float32()),
+    ('Height', pa.float32()),
+    ('class', pa.string()),
+    ('confidence', pa.float32()),
+    ('image_width', pa.int32()),
+    ('image_height', pa.int32()),
+])
+
+EXPORT_FORMATS = {'CSV': '.csv', 'Parquet': '.parquet', 'COCO JSON': '.coco.json'}
+
+
+class DetectionStore:
+    """
+    Writes detections to a Parquet file in row groups of `row_group_rows` boxes.
+
+    Thread-safe, so the inference thread can append while the script thread
+    closes the store; appends after close() are ignored.
+    """
+
+    def __init__(self, path, names=None, row_group_rows=settings.STORE_ROW_GROUP_ROWS):
+        """
+        Parameters:
+            path (str or Path): Parquet file to create (an existing file is replaced).
+            names (dict): Class index -> name, used for results that carry no names.
+            row_group_rows (int): Boxes buffered before a row group is written.
+        """
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.names = dict(names or {})
+        self.row_group_rows = row_group_rows
+        self.rows = 0
+        self._pending = []
+        self._pending_rows = 0
+        self._lock = threading.Lock()
+        self._writer = pq.ParquetWriter(str(self.path), SCHEMA, compression='zstd')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def append(self, result, file_name, frame=0):
+        """
+        Buffers the boxes of one image or frame.
+
+        Parameters:
+            result: A Detections or FrameResult. Only the box arrays are kept,
+                not the frame itself.
+            file_name (str): Source the result belongs to.
+            frame (int): Frame index within the source.
+        """
+        if not isinstance(result, Detections):
+            result = Detections(result.boxes, result.conf, result.cls, result.image.shape[:2],
+                                self.names, result.track_ids)
+        with self._lock:
+            if self._writer is None:
+                return
+            self._pending.append((result, file_name, frame))
+            self._pending_rows += len(result.conf)
+            if self._pending_rows >= self.row_group_rows or len(self._pending) >= self.row_group_rows:
+                self._flush()
+
+    def flush(self):
+        """Writes the buffered results as one row group."""
+        with self._lock:
+            if self._writer is not None:
+                self._flush()
+
+    def _flush(self):
+        if not self._pending:
+            return
+        results, file_names, frames = zip(*self._pending)
+        columns = detection_table.build_columns(results, file_names, frames, names=self.names or None)
+        table = detection_table.to_arrow(columns)
+        counts = [len(result.conf) for result in results]
+        shapes = np.repeat(np.array([result.orig_shape[:2] for result in results], dtype=np.int32), counts, axis=0)
+        table = table.append_column('image_width', pa.array(shapes[:, 1]))
+        table = table.append_column('image_height', pa.array(shapes[:, 0]))
+        if table.num_rows:
+            self._writer.write_table(table.cast(SCHEMA))
+        self.rows += table.num_rows
+        self._pending, self._pending_rows = [], 0
+
+    def close(self):
+        with self._lock:
+            if self._writer is not None:
+                self._flush()
+                self._writer.close()
+                self._writer = None
+
+
+def iter_batches(path, batch_size=settings.STORE_READ_BATCH_ROWS, columns=None):
+    """Yields pyarrow RecordBatches of a store file."""
+    yield from pq.ParquetFile(str(path)).iter_batches(batch_size=batch_size, columns=columns)
+
+
+def concat(paths, output):
+    """Streams several store files, in order, into one new store file. Missing files are skipped."""
+    with pq.ParquetWriter(str(output), SCHEMA, compression='zstd') as writer:
+        for path in paths:
+            if Path(path).exists():
+                for batch in iter_batches(path):
+                    writer.write_batch(batch)
+    return Path(output)
+
+
+def export_csv(path, output):
+    """Writes the detection columns of a store file as CSV, one record batch at a time."""
+    with open(output, 'wb') as f:
+        f.write((','.join(detection_table.COLUMNS) + '\n').encode())
+        for batch in iter_batches(path, columns=detection_table.COLUMNS):
+            f.write(detection_table.to_csv(batch.to_pandas(), header=False))
+
+
+def export_parquet(path, output):
+    """Copies the detection columns of a store file into a new Parquet file, row group by row group."""
+    schema = pa.schema([SCHEMA.field(name) for name in detection_table.COLUMNS])
+    with pq.ParquetWriter(str(output), schema, compression='zstd') as writer:
+        for batch in iter_batches(path, columns=detection_table.COLUMNS):
+            writer.write_batch(batch)
+
+
+def export_coco(path, output):
+    """
+    Writes a store file as COCO detection JSON.
+
+    Every (file name, frame) with at least one box becomes a COCO image;
+    video frames are named `<file name>#<frame>`. Boxes are converted back to
+    pixels. Two streaming passes are made: the first collects images and
+    categories, the second writes the annotations.
+    """
+    images, categories = {}, {}
+    with open(output, 'w') as f:
+        f.write('{"images": [')
+        for batch in iter_batches(path, columns=['File_name', 'frame', 'class', 'image_width', 'image_height']):
+            frame = batch.to_pandas().drop_duplicates(['File_name', 'frame'])
+            for file_name, index, width, height in zip(frame['File_name'], frame['frame'],
+                                                       frame['image_width'], frame['image_height']):
+                if (file_name, index) in images:
+                    continue
+                image_id = images[file_name, index] = len(images) + 1
+                name = file_name if index == 0 else f"{file_name}#{index}"
+                f.write((',' if image_id > 1 else '') +
+                        json.dumps({'id': image_id, 'file_name': name, 'width': int(width), 'height': int(height)}))
+            for label in batch.column('class').unique().to_pylist():
+                categories.setdefault(label, len(categories) + 1)
+
+        f.write('], "annotations": [')
+        annotation_id = 0
+        for batch in iter_batches(path):
+            frame = batch.to_pandas()
+            width, height = frame['image_width'].to_numpy(), frame['image_height'].to_numpy()
+            bbox = np.column_stack([frame['X1'] * width, frame['Y1'] * height,
+                                    frame['Width'] * width, frame['Height'] * height]).round(2)
+            image_ids = [images[key] for key in zip(frame['File_name'], frame['frame'])]
+            for i, (image_id, label, score) in enumerate(zip(image_ids, frame['class'], frame['confidence'])):
+                annotation_id += 1
+                box = bbox[i].tolist()
+                f.write((',' if annotation_id > 1 else '') + json.dumps({
+                    'id': annotation_id, 'image_id': image_id, 'category_id': categories[label],
+                    'bbox': box, 'area': round(box[2] * box[3], 2), 'iscrowd': 0,
+                    'score': round(float(score), 4)}))
+
+        f.write('], "categories": ')
+        f.write(json.dumps([{'id': category_id, 'name': label} for label, category_id in categories.items()]))
+        f.write('}')
+
+
+_EXPORTERS = {'CSV': export_csv, 'Parquet': export_parquet, 'COCO JSON': export_coco}
+
+
+def export(path, fmt):
+    """
+    Exports a store file next to it, reusing an export that is newer than the store.
+
+    Parameters:
+        path (Path): Store file.
+        fmt (str): A key of EXPORT_FORMATS.
+
+    Returns:
+        Path of the exported file.
+    """
+    path = Path(path)
+    output = path.with_suffix(EXPORT_FORMATS[fmt])
+    if output == path:
+        output = path.with_name(f"{path.stem}.export.parquet")
+    if not output.exists() or output.stat().st_mtime_ns < path.stat().st_mtime_ns:
+        _EXPORTERS[fmt](path, output)
+    return output
@@ -0,0 +1,106 @@
+"""
+Columnar detection tables.
+
+Builds one table for a whole batch of results without per-box Python work:
+box data of every result is concatenated and copied to the host in a single
+transfer, and file names are stored as categorical codes. The same columns
+feed the results table in the UI, the CSV download and batch outputs.
+"""
+import numpy as np
+import pandas as pd
+
+COLUMNS = ['File_name', 'frame', 'object_id', 'X1', 'Y1', 'X2', 'Y2', 'Width', 'Height', 'class', 'confidence']
+
+
+def _stack_ultralytics(results):
+    """(N, 7) xyxy, id, conf, cls rows and (N, 2) image sizes for a batch of ultralytics Results."""
+    import torch
+
+    parts = []
+    for result in results:
+        data = result.boxes.data
+        if data.shape[1] == 6:
+            # Untracked boxes have no id column
+            data = torch.cat([data[:, :4], torch.full_like(data[:, :1], float('nan')), data[:, 4:]], dim=1)
+        parts.append(data)
+    data = torch.cat(parts).cpu().numpy() if parts else np.zeros((0, 7), np.float32)
+    counts = np.array([len(p) for p in parts], dtype=int)
+    sizes = np.array([result.orig_shape for result in results], dtype=np.float32).reshape(-1, 2)
+    return data, counts, sizes
+
+
+def _stack_arrays(items):
+    """Same as _stack_ultralytics for Detections and FrameResult objects, which are already on the host."""
+    parts, sizes = [], []
+    for item in items:
+        ids = getattr(item, 'track_ids', None)
+        ids = np.full(len(item.conf), np.nan) if ids is None else ids
+        parts.append(np.column_stack([item.boxes, ids, item.conf, item.cls]).reshape(-1, 7))
+        shape = item.orig_shape if hasattr(item, 'orig_shape') else item.image.shape[:2]
+        sizes.append(shape[:2])
+    data = np.concatenate(parts) if parts else np.zeros((0, 7), np.float32)
+    counts = np.array([len(p) for p in parts], dtype=int)
+    return data, counts, np.array(sizes, dtype=np.float32).reshape(-1, 2)
+
+
+def build_columns(items, file_names, frames=None, names=None):
+    """
+    Builds detection columns for a batch of results.
+
+    Parameters:
+        items (list): ultralytics Results, or Detections/FrameResult objects (not mixed).
+        file_names (list): Source name per item.
+        frames (list): Frame index per item, for video sources.
+        names (dict): Class index -> name, defaults to the names of the results.
+
+    Returns:
+        A dict of column name -> numpy array (or pandas Categorical), one row per box.
+        Coordinates are normalized to the image size.
+    """
+    items = list(items)
+    if items and not isinstance(items[0].boxes, np.ndarray):
+        data, counts, sizes = _stack_ultralytics(items)
+    else:
+        data, counts, sizes = _stack_arrays(items)
+    if names is None:
+        names = getattr(items[0], 'names', {}) if items else {}
+
+    row_item = np.repeat(np.arange(len(items)), counts)
+    height, width = sizes[row_item, 0], sizes[row_item, 1]
+    x1, y1 = data[:, 0] / width, data[:, 1] / height
+    x2, y2 = data[:, 2] / width, data[:, 3] / height
+    file_codes, file_categories = pd.factorize(pd.Index(file_names))
+    classes, class_codes = np.unique(data[:, 6].astype(int), return_inverse=True)
+    ids = data[:, 4]
+    missing_id = np.isnan(ids)
+    return {
+        'File_name': pd.Categorical.from_codes(file_codes[row_item], categories=file_categories),
+        'frame': np.asarray(frames if frames is not None else np.zeros(len(items), int))[row_item],
+        'object_id': pd.arrays.IntegerArray(np.where(missing_id, 0, ids).astype(np.int64), missing_id),
+        'X1': x1, 'Y1': y1, 'X2': x2, 'Y2': y2,
+        'Width': x2 - x1, 'Height': y2 - y1,
+        'class': pd.Categorical.from_codes(class_codes.reshape(-1),
+                                           categories=[str(names.get(c, c)) for c in classes]),
+        'confidence': data[:, 5],
+    }
+
+
+def to_dataframe(columns, include=None):
+    """
+    Parameters:
+        columns (dict): Output of build_columns.
+        include (list): Column names to keep, in order (default: all of COLUMNS).
+    """
+    return pd.DataFrame(columns, columns=include or COLUMNS)
+
+
+def to_arrow(columns, include=None):
+    """Same as to_dataframe, as a pyarrow Table."""
+    import pyarrow as pa
+
+    return pa.Table.from_pandas(to_dataframe(columns, include), preserve_index=False)
+
+
+def to_csv(frame, header=True):
+    """CSV bytes of a detection table, with coordinates and confidences rounded."""
+    return frame.to_csv(index=False, header=header, float_format='%.5g').encode()
@@ -1,25 +1,730 @@
-from ultralytics import YOLO
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+import copy
+from dataclasses import dataclass, field
+import hashlib
+import io
+import os
+from pathlib import Path
+import queue
+import threading
+import uuid
+
 import streamlit as st
 import cv2
-from pytube import YouTube
-import pandas as pd
+import numpy as np
+import PIL.Image
 import time
 
 import settings
+import backends
+from backends import weights_digest
+from capture import ResilientCapture
+from inference_server import InferenceClient
+from keyframes import BoxPropagator, KeyframeScheduler, grab_reader
+from multistream import MultiStreamDetector, StreamWorker
+from overlay import MODES as OVERLAY_MODES, OverlayRenderer
+from resolution import ResolutionPolicy
+from roi import RoiConfig, format_polygons, parse_polygons, roi_predict
+from result_cache import DetectionCache, Detections, cache_key, digest
+import stage_metrics
+from stage_metrics import ProfileCapture
+from tiling import TileConfig, tiled_predict
+from video_export import AnnotatedVideoWriter
+from viewer import FrameViewer, StatsPanel
+
+
+# Dependencies of a single source or feature (ultralytics, pytube, pyarrow,
+# pandas) are imported where they are used, so starting the app and opening a
+# mode only pays for what that mode needs; see benchmarks/bench_startup.py.
 
+# Process-wide model registry. Streamlit re-runs the app script on every
+# widget interaction, but this module is imported once per process, so models
+# kept here survive reruns and are shared between sessions.
+_model_registry = OrderedDict()
+_model_registry_lock = threading.Lock()
+# Backend exports running right now, by export key. Exports (INT8 calibration
+# above all) take minutes, so they run outside the registry lock; a second
+# caller for the same export waits on the first one's Future instead of
+# exporting again
+_exports_in_flight = {}
+
+
+class SharedModel:
+    """
+    A registry model as handed to sessions, pipeline threads and workers.
 
-def load_model(model_path):
+    ultralytics models are not thread-safe, so predict and track calls hold a
+    lock per cached model. Tracker state lives on the model's predictor, so
+    every tracked run works on its own tracking_copy() instead of the shared
+    instance. Everything else is passed through to the YOLO model.
+    """
+
+    def __init__(self, model, lock=None):
+        self.__dict__['_model'] = model
+        self.__dict__['_lock'] = lock or threading.RLock()
+
+    def __getattr__(self, name):
+        return getattr(self._model, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._model, name, value)
+
+    def predict(self, *args, **kwargs):
+        with self._lock:
+            return self._model.predict(*args, **kwargs)
+
+    def track(self, *args, **kwargs):
+        with self._lock:
+            return self._model.track(*args, **kwargs)
+
+    def __call__(self, *args, **kwargs):
+        with self._lock:
+            return self._model(*args, **kwargs)
+
+    def tracking_copy(self):
+        """
+        A model for one tracked run: the same weights and lock, but its own
+        predictor, so it starts with a fresh tracker and no other run or
+        session sees its track IDs.
+        """
+        model = copy.copy(self._model)
+        model.predictor = None
+        # Trackers register their callbacks on the model; keep them off the shared one
+        model.callbacks = {event: list(functions) for event, functions in self._model.callbacks.items()}
+        return SharedModel(model, self._lock)
+
+
+def _model_key(model_path, device):
+    path = Path(model_path).resolve()
+    return str(path), path.stat().st_mtime_ns, str(device)
+
+
+def _model_nbytes(model, model_path):
+    try:
+        return sum(p.numel() * p.element_size() for p in model.model.parameters())
+    except Exception:
+        # Non-torch backends: the size of the exported files is a good enough estimate
+        return backends.artifact_nbytes(model_path)
+
+
+def _warmup_model(model, device, imgsz=settings.MODEL_WARMUP_IMGSZ):
+    dummy = np.zeros((imgsz, imgsz, 3), dtype=np.uint8)
+    model.predict(dummy, imgsz=imgsz, device=device, verbose=False)
+
+
+def _evict_models(keep_key):
+    """Drops least recently used models until the registry fits the memory budget."""
+    total = sum(entry['nbytes'] for entry in _model_registry.values())
+    for key in list(_model_registry):
+        if total <= settings.MODEL_CACHE_MAX_BYTES:
+            break
+        if key == keep_key:
+            continue
+        total -= _model_registry.pop(key)['nbytes']
+
+
+def _export_once(key, export, *args, **kwargs):
+    """Runs backends.export_model once per key at a time; concurrent callers share the result."""
+    with _model_registry_lock:
+        pending = _exports_in_flight.get(key)
+        owner = pending is None
+        if owner:
+            pending = _exports_in_flight[key] = Future()
+    if owner:
+        try:
+            pending.set_result(export(*args, **kwargs))
+        except Exception as e:
+            pending.set_exception(e)
+        finally:
+            with _model_registry_lock:
+                del _exports_in_flight[key]
+    return pending.result()
+
+
+def load_model(model_path, device=settings.DEVICE, warmup=True, backend=settings.MODEL_BACKEND,
+               int8=False, calibration_dir=settings.INT8_CALIBRATION_DIR):
     """
     Loads a YOLO object detection model from the specified model_path.
 
+    Models are loaded once per process and cached by path, file modification
+    time and device, so Streamlit reruns reuse the same instance. A freshly
+    loaded model is warmed up with a dummy frame before it is returned.
+    Sessions share it through a SharedModel, which serializes inference;
+    tracked runs must use model.tracking_copy().
+
+    With an ONNX or OpenVINO backend the PyTorch weights are exported on
+    first use and the cached export is loaded instead. `int8` loads an
+    OpenVINO model quantized with images from `calibration_dir`.
+
     Parameters:
         model_path (str): The path to the YOLO model file.
+        device (str): Device to run the model on, e.g. 'cpu' or 'cuda:0'.
+        warmup (bool): Run a dummy inference right after loading.
+        backend (str): settings.BACKEND_TORCH, BACKEND_ONNX or BACKEND_OPENVINO.
+        int8 (bool): Use the INT8 post-training quantized model (OpenVINO).
+        calibration_dir (str): Folder of images to calibrate the INT8 model on.
+
+    Returns:
+        A SharedModel wrapping the YOLO object detection model.
+    """
+    parity = None
+    if int8:
+        # Quantization error is judged with benchmarks/quant_report.py rather than the parity check
+        backend = settings.BACKEND_OPENVINO
+        model_path = _export_once((str(model_path), backend, True, str(calibration_dir)), backends.export_model,
+                                  model_path, backend, verify=False, int8=True, calibration_dir=calibration_dir)
+    elif backend != settings.BACKEND_TORCH:
+        model_path = _export_once((str(model_path), backend, False, None), backends.export_model,
+                                  model_path, backend, verify=settings.BACKEND_PARITY_CHECK)
+        parity = backends.load_parity_report(model_path)
+    with _model_registry_lock:
+        key = _model_key(model_path, device)
+        entry = _model_registry.get(key)
+        if entry is None:
+            # An older version of the same weights file can never be hit again
+            for stale in [k for k in _model_registry if k[0] == key[0] and k[2] == key[2]]:
+                del _model_registry[stale]
+
+            start = time.perf_counter()
+            # Imports torch; deferred until a model is needed (not at all with an inference server)
+            from ultralytics import YOLO
+
+            if backend == settings.BACKEND_TORCH:
+                model = YOLO(str(model_path))
+                if device:
+                    model.to(device)
+            else:
+                model = YOLO(str(model_path), task='detect')
+            load_s = time.perf_counter() - start
+
+            warmup_s = 0.0
+            if warmup:
+                start = time.perf_counter()
+                _warmup_model(model, device)
+                warmup_s = time.perf_counter() - start
+
+            entry = {
+                'model': SharedModel(model),
+                'path': key[0],
+                'device': device,
+                'backend': backend,
+                'parity': parity,
+                'nbytes': _model_nbytes(model, model_path),
+                'load_s': load_s,
+                'warmup_s': warmup_s,
+                'hits': 0,
+            }
+            _model_registry[key] = entry
+            _evict_models(key)
+        else:
+            entry['hits'] += 1
+            _model_registry.move_to_end(key)
+        entry['last_used'] = time.time()
+        return entry['model']
+
+
+def display_precision_options():
+    """
+    Sidebar choice between the full-precision and the INT8 quantized model.
+
+    Returns:
+        settings.PRECISION_FP32 or settings.PRECISION_INT8.
+    """
+    return st.sidebar.radio("Model precision", (settings.PRECISION_FP32, settings.PRECISION_INT8),
+                            horizontal=True,
+                            help="INT8 runs a quantized OpenVINO model: faster on CPU, slightly less accurate.")
+
+
+def model_cache_stats():
+    """
+    Returns load and warm-up timings of every model held in the registry.
+
+    Returns:
+        A list of dicts, most recently used model last.
+    """
+    with _model_registry_lock:
+        return [{k: v for k, v in entry.items() if k != 'model'}
+                for entry in _model_registry.values()]
+
+
+_inference_client = None
+_inference_client_lock = threading.Lock()
+
+
+def connect_inference_server(address=settings.INFERENCE_SERVER_ADDRESS):
+    """
+    Returns the process-wide client of the shared inference server.
+
+    All sessions of this Streamlit process share one connection, so their
+    requests can end up in the same server-side batch. A closed connection
+    is replaced on the next call.
+
+    Parameters:
+        address (str): Unix socket path or 'host:port' of `python -m inference_server`.
+
+    Returns:
+        An InferenceClient, usable in place of a model for detection (not tracking).
+    """
+    global _inference_client
+    with _inference_client_lock:
+        if _inference_client is None or _inference_client.closed:
+            _inference_client = InferenceClient(address)
+        return _inference_client
+
+
+def _decode_upload(upload, max_side=None):
+    """Decodes an uploaded file (or path) into an RGB PIL image, optionally downscaled."""
+    data = io.BytesIO(upload.getvalue()) if hasattr(upload, 'getvalue') else upload
+    image = PIL.Image.open(data)
+    if max_side:
+        # Lets the JPEG decoder skip straight to a reduced scale
+        image.draft('RGB', (max_side, max_side))
+        image = image.convert('RGB')
+        image.thumbnail((max_side, max_side))
+        return image
+    return image.convert('RGB')
+
+
+_detection_cache = DetectionCache(settings.RESULT_CACHE_MAX_BYTES, settings.RESULT_CACHE_SPILL_DIR)
+_upload_digests = OrderedDict()  # Streamlit file_id -> content hash
+
+
+def model_digest(model):
+    """Returns a hash of the weights file (or exported model) the model was loaded from."""
+    if isinstance(model, InferenceClient):
+        return model.weights_digest
+    return weights_digest(getattr(model, 'ckpt_path', None) or model.model_name)
+
+
+def _upload_digest(upload):
+    file_id = getattr(upload, 'file_id', None)
+    if file_id is not None and file_id in _upload_digests:
+        return _upload_digests[file_id]
+    if hasattr(upload, 'getvalue'):
+        value = digest(upload.getvalue())
+    else:
+        value = digest(Path(upload).read_bytes())
+    if file_id is not None:
+        _upload_digests[file_id] = value
+        while len(_upload_digests) > 4096:
+            _upload_digests.popitem(last=False)
+    return value
+
+
+def display_viewer_options():
+    """
+    Sidebar controls for the video preview.
+
+    Returns:
+        A dict of FrameViewer keyword arguments.
+    """
+    with st.sidebar.expander("Preview"):
+        max_fps = st.slider("Preview refresh cap (FPS)", 1, 30, settings.VIEWER_MAX_FPS)
+        max_width = st.select_slider("Preview width", (480, 640, 960, 1280), value=settings.VIEWER_MAX_WIDTH)
+        quality = st.slider("Preview quality", 30, 95, settings.VIEWER_QUALITY)
+        encoding = st.radio("Preview encoding", ('jpeg', 'webp'), horizontal=True,
+                            index=('jpeg', 'webp').index(settings.VIEWER_ENCODING))
+    return {'max_fps': max_fps, 'max_width': max_width, 'quality': quality, 'encoding': encoding}
+
+
+def display_keyframe_options():
+    """
+    Sidebar controls for keyframe inference.
+
+    Returns:
+        A KeyframeScheduler, or None to run the model on every frame.
+    """
+    mode = st.sidebar.radio("Run detection on", ("Every frame", "Every N frames", "Frames with motion"))
+    if mode == "Every frame":
+        return None
+    every_n = st.sidebar.slider("N (longest gap between detections)", 2, 30, settings.KEYFRAME_INTERVAL)
+    if mode == "Every N frames":
+        return KeyframeScheduler(every_n)
+    threshold = st.sidebar.slider("Motion threshold (%)", 1, 30, int(settings.KEYFRAME_MOTION_THRESHOLD * 100))
+    return KeyframeScheduler(every_n, motion_threshold=threshold / 100)
+
+
+def display_roi_options(source_key):
+    """
+    Sidebar controls for region-of-interest inference.
+
+    Parameters:
+        source_key (str): Key of the source in settings.ROI_POLYGONS.
+
+    Returns:
+        A RoiConfig, or None to infer whole frames.
+    """
+    configured = settings.ROI_POLYGONS.get(source_key, [])
+    if not st.sidebar.checkbox("Only detect inside a region of interest", value=bool(configured)):
+        return None
+    text = st.sidebar.text_area("ROI polygons (one per line, normalized x,y points)",
+                                value=format_polygons(configured) or "0,0.4 1,0.4 1,1 0,1",
+                                key=f"roi-{source_key}")
+    try:
+        polygons = parse_polygons(text)
+    except ValueError as e:
+        st.sidebar.error(f"Write each point as x,y with values between 0 and 1, at least 3 per polygon ({e}).")
+        return None
+    return RoiConfig(polygons) if polygons else None
+
+
+def display_resolution_options():
+    """
+    Sidebar controls for the model input size of video frames.
+
+    Returns:
+        A ResolutionPolicy.
+    """
+    with st.sidebar.expander("Input resolution"):
+        # The same range adaptive mode moves within, so a picked size is never clamped
+        sizes = tuple(range(settings.RESOLUTION_MIN_IMGSZ, settings.RESOLUTION_MAX_IMGSZ + 1,
+                            settings.RESOLUTION_STEP))
+        imgsz = st.select_slider("Input size (long side)", sizes, value=settings.VIDEO_IMGSZ)
+        adaptive = st.checkbox("Adapt to keep up with the source",
+                               help="Lower the input size when frames take longer than the source frame "
+                                    "interval, raise it again when there is headroom.")
+    return ResolutionPolicy(imgsz, adaptive=adaptive)
+
+
+def display_overlay_options():
+    """
+    Sidebar control for how detections are drawn.
+
+    Returns:
+        An overlay mode, see overlay.MODES.
+    """
+    return st.sidebar.radio("Overlay", tuple(OVERLAY_MODES), format_func=OVERLAY_MODES.get, horizontal=True)
+
+
+def display_profiling_options(source_name):
+    """
+    Sidebar controls for profiling the detection loop.
+
+    Returns:
+        A ProfileCapture, or None when profiling is off.
+    """
+    with st.sidebar.expander("Profiling"):
+        frames = st.number_input("cProfile the next N inferred frames", 0, 10_000, 0, step=50,
+                                 help="0 turns profiling off. The stats file opens with `python -m pstats` "
+                                      "or snakeviz.")
+        st.caption(f"For a whole-process view run `py-spy top --pid {os.getpid()}`; "
+                   f"pipeline threads are named after their stage.")
+    if not frames:
+        return None
+    name = "".join(c if c.isalnum() else '_' for c in str(source_name))[:40] or 'source'
+    return ProfileCapture(frames, settings.PROFILE_DIR / f"{name}-{time.strftime('%Y%m%d-%H%M%S')}.prof")
+
+
+def display_export_options():
+    """
+    Sidebar controls for exporting the annotated video.
+
+    Returns:
+        A dict of AnnotatedVideoWriter keyword arguments, or None when not exporting.
+    """
+    with st.sidebar.expander("Export annotated video"):
+        enabled = st.checkbox("Save the annotated video")
+        width = st.selectbox("Output width", (None, 1920, 1280, 960, 640),
+                             format_func=lambda w: "Source size" if w is None else f"{w} px")
+        bitrate = st.select_slider("Bitrate", ('1M', '2M', '4M', '8M', '16M'), value=settings.EXPORT_BITRATE,
+                                   help="Used when ffmpeg is installed")
+        segments_only = st.checkbox("Only segments with detections",
+                                    help=f"Keeps {settings.EXPORT_SEGMENT_PADDING} frames before and after "
+                                         f"each stretch with detections")
+    if not enabled:
+        return None
+    return {'width': width, 'bitrate': bitrate, 'segments_only': segments_only}
+
+
+def display_export_result(exporter):
+    """Export counters and a download button for a finished AnnotatedVideoWriter."""
+    stats = exporter.stats()
+    caption = f"Exported {stats['written']} frames"
+    if exporter.segments_only:
+        caption += f" in {stats['segments']} segments"
+    if stats['dropped']:
+        caption += f", {stats['dropped']} dropped while the encoder was busy"
+    st.sidebar.caption(caption)
+    if stats['written'] and exporter.path.exists():
+        with open(exporter.path, 'rb') as f:
+            st.sidebar.download_button("Download annotated video", f, file_name=exporter.path.name,
+                                       mime="video/mp4", key=f"video-export-{exporter.path.name}")
+
+
+def display_tiling_options():
+    """
+    Sidebar controls for tiled inference.
+
+    Returns:
+        A TileConfig, or None when tiling is off.
+    """
+    if not st.sidebar.checkbox("Tiled inference (high-resolution images)"):
+        return None
+    tile_size = st.sidebar.select_slider("Tile size", (320, 480, 640, 960, 1280), value=settings.TILE_SIZE)
+    overlap = st.sidebar.slider("Tile overlap (%)", 0, 50, int(settings.TILE_OVERLAP * 100)) / 100
+    merge = st.sidebar.radio("Merge boxes across tiles", ('nms', 'wbf'),
+                             format_func=lambda m: {'nms': 'NMS', 'wbf': 'Weighted box fusion'}[m])
+    return TileConfig(tile_size=tile_size, overlap=overlap, merge=merge)
+
+
+def _detect_uploads_tiled(model, uploads, conf, tiling, progress=None):
+    """Yields tiled Detections per upload, decoding the next image while the current one runs."""
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        pending = pool.submit(_decode_upload, uploads[0]) if uploads else None
+        for i in range(len(uploads)):
+            image = pending.result()
+            if i + 1 < len(uploads):
+                pending = pool.submit(_decode_upload, uploads[i + 1])
+            frame = np.asarray(image)[:, :, ::-1]
+            yield tiled_predict(model, frame, conf, tiling)
+            del image, frame
+            if progress is not None:
+                progress(i + 1, len(uploads))
+
+
+def _detect_uploads_remote(client, uploads, conf, progress=None, imgsz=settings.IMAGE_IMGSZ,
+                           batch_size=settings.IMAGE_BATCH_SIZE):
+    """Yields Detections per upload from the inference server, one request per batch of uploads."""
+    with ThreadPoolExecutor(max_workers=settings.DECODE_WORKERS) as pool:
+        for start in range(0, len(uploads), batch_size):
+            images = pool.map(_decode_upload, uploads[start:start + batch_size])
+            yield from client.detect([np.asarray(image)[:, :, ::-1] for image in images], conf, imgsz)
+            if progress is not None:
+                progress(min(start + batch_size, len(uploads)), len(uploads))
+
+
+def detect_uploads_cached(model, uploads, conf, progress=None, imgsz=settings.IMAGE_IMGSZ, tiling=None):
+    """
+    Detects objects in uploaded images, running the model only on images not seen before.
+
+    Predictions are cached at settings.RESULT_CACHE_CONF_FLOOR, so moving the
+    confidence slider re-filters cached boxes instead of re-running inference.
+
+    Parameters:
+        model (YOLO): A YOLOv8 object detection model.
+        uploads (list): Streamlit UploadedFile objects or image paths.
+        conf (float): Confidence threshold for object detection.
+        progress: Optional callable `(done, total)` for the uncached images.
+        imgsz (int): Inference size.
+        tiling (TileConfig): Run tiled inference at full resolution instead.
+
+    Returns:
+        A list of (upload, cache key, Detections filtered at `conf`) tuples in upload order.
+    """
+    uploads = list(uploads)
+    conf_floor = min(conf, settings.RESULT_CACHE_CONF_FLOOR)
+    weights = model_digest(model)
+    variant = tiling.tag if tiling else imgsz
+    keys = [cache_key(_upload_digest(upload), weights, variant, conf_floor) for upload in uploads]
+    detections = [_detection_cache.get(key) for key in keys]
+    missing = [i for i, d in enumerate(detections) if d is None]
+    if missing:
+        if tiling:
+            batch = _detect_uploads_tiled(model, [uploads[i] for i in missing], conf_floor, tiling,
+                                          progress=progress)
+        elif isinstance(model, InferenceClient):
+            batch = _detect_uploads_remote(model, [uploads[i] for i in missing], conf_floor,
+                                           progress=progress, imgsz=imgsz)
+        else:
+            batch = (Detections.from_result(result) for _, _, result in
+                     detect_images(model, [uploads[i] for i in missing], conf_floor,
+                                   progress=progress, imgsz=imgsz))
+        for i, found in zip(missing, batch):
+            detections[i] = found
+            _detection_cache.put(keys[i], found)
+    return [(upload, key, d.filter(conf)) for upload, key, d in zip(uploads, keys, detections)]
+
+
+def session_gallery():
+    """
+    This session's LRU of encoded previews.
+
+    Only JPEG previews are kept, never decoded images, and the total is
+    capped at settings.GALLERY_MAX_BYTES, so a session's memory does not grow
+    with the number of uploads. Evicted previews are re-encoded from the
+    upload and its cached boxes when they are shown again.
+    """
+    if 'gallery' not in st.session_state:
+        st.session_state['gallery'] = DetectionCache(settings.GALLERY_MAX_BYTES)
+    return st.session_state['gallery']
+
+
+def _encode_jpeg(rgb, quality):
+    buffer = io.BytesIO()
+    PIL.Image.fromarray(rgb).save(buffer, format='JPEG', quality=quality)
+    return buffer.getvalue()
+
+
+def annotated_thumbnail(upload, key, detections, conf, mode='labels', cache=None):
+    """
+    Returns a JPEG-encoded preview of an upload, with its detections drawn on if given.
+
+    Parameters:
+        upload: The Streamlit UploadedFile (or path) the detections belong to.
+        key (str): Cache key returned by detect_uploads_cached.
+        detections (Detections): Detections already filtered at `conf`, or
+            None for a preview of the original image.
+        conf (float): Confidence threshold the detections were filtered at.
+        mode (str): Overlay mode, see overlay.MODES.
+        cache (DetectionCache): Where previews are kept; defaults to session_gallery().
+
+    Returns:
+        JPEG bytes, at most settings.THUMBNAIL_MAX_SIDE pixels on the long side.
+    """
+    cache = cache if cache is not None else session_gallery()
+    thumb_key = f"{key}-thumb-{conf:.2f}-{mode}" if detections is not None else f"{key}-thumb"
+    data = cache.get(thumb_key)
+    if data is None:
+        image = _decode_upload(upload, max_side=settings.THUMBNAIL_MAX_SIDE)
+        # Drawn and encoded in the decoder's RGB order, so no channel swap copy is needed
+        canvas = np.array(image)
+        del image
+        if detections is not None:
+            scale = canvas.shape[1] / detections.orig_shape[1]
+            OverlayRenderer(mode, channels='RGB').draw(canvas, detections.boxes * scale, detections.conf,
+                                                       detections.cls, detections.names, in_place=True)
+        data = _encode_jpeg(canvas, settings.THUMBNAIL_JPEG_QUALITY)
+        cache.put(thumb_key, data)
+    return data
+
+
+def annotated_full_resolution(upload, key, detections, conf, mode='labels'):
+    """
+    Renders an upload at full resolution with its detections, from the cached boxes.
+
+    Only the latest rendering is kept, in the session and keyed by upload,
+    confidence and overlay mode, so reruns reuse its bytes instead of decoding
+    and encoding the image again, and a session holds at most one of them.
+
+    Parameters:
+        upload: The Streamlit UploadedFile (or path) the detections belong to.
+        key (str): Cache key returned by detect_uploads_cached.
+        detections (Detections): Detections already filtered at `conf`.
+        conf (float): Confidence threshold the detections were filtered at.
+        mode (str): Overlay mode, see overlay.MODES.
+
+    Returns:
+        JPEG bytes.
+    """
+    full_key = (key, f"{conf:.2f}", mode)
+    cached = st.session_state.get('full_resolution')
+    if cached is not None and cached[0] == full_key:
+        return cached[1]
+    canvas = np.array(_decode_upload(upload))
+    OverlayRenderer(mode, channels='RGB').draw(canvas, detections.boxes, detections.conf, detections.cls,
+                                               detections.names, in_place=True)
+    data = _encode_jpeg(canvas, settings.FULL_RESOLUTION_JPEG_QUALITY)
+    st.session_state['full_resolution'] = (full_key, data)
+    return data
+
+
+def display_gallery_pager(count, uploads_key):
+    """
+    Sidebar paging through the uploads, kept in the session across reruns.
+
+    Parameters:
+        count (int): Number of uploads.
+        uploads_key: Identifies the set of uploads; a new set starts at the first image.
 
     Returns:
-        A YOLO object detection model.
+        Index of the upload to show.
     """
-    model = YOLO(model_path)
-    return model
+    state = st.session_state
+    if state.get('gallery_uploads') != uploads_key or state.get('gallery_position', 1) > count:
+        state['gallery_uploads'] = uploads_key
+        state['gallery_position'] = 1
+
+    def step(delta):
+        state['gallery_position'] = (state['gallery_position'] - 1 + delta) % count + 1
+
+    previous_column, next_column = st.sidebar.columns(2)
+    previous_column.button("Previous Image", on_click=step, args=(-1,))
+    next_column.button("Next Image", on_click=step, args=(1,))
+    st.sidebar.number_input(f"Image (of {count})", min_value=1, max_value=count, key='gallery_position')
+    return state['gallery_position'] - 1
+
+
+def display_unique_objects(results, uploads_key):
+    """
+    Counts objects that appear in several overlapping uploads only once (survey_dedup).
+
+    Parameters:
+        results (list): (upload, cache key, detections) per upload, as returned by detect_uploads_cached.
+        uploads_key: Identifies the uploads and confidence; objects are only merged again when it changes.
+    """
+    if len(results) < 2:
+        return
+    with st.expander("Unique objects"):
+        if not st.checkbox("Merge objects seen in overlapping images",
+                           help="Places the images by their DJI geotags when all have one, otherwise by "
+                                "matching each image to the previous one in file name order"):
+            return
+        import survey_dedup
+
+        state = st.session_state
+        if state.get('dedup_key') != uploads_key:
+            progress_bar = st.progress(0.0)
+
+            def show_progress(done, total):
+                progress_bar.progress(done / total, text=f"Registering images... {done}/{total}")
+
+            # DJI file names follow the flight, so neighbours in name order overlap
+            ordered = sorted(results, key=lambda result: getattr(result[0], 'name', str(result[0])))
+            try:
+                dedup = survey_dedup.deduplicate_images([upload for upload, _, _ in ordered],
+                                                        [detections for _, _, detections in ordered],
+                                                        progress=show_progress)
+            finally:
+                progress_bar.empty()
+            table = dedup.to_dataframe()
+            state['dedup_key'] = uploads_key
+            state['dedup_result'] = (dedup.detections, dedup.counts(), table, table.to_csv(index=False).encode())
+        detections, counts, table, csv_data = state['dedup_result']
+        detections_column, objects_column = st.columns(2)
+        detections_column.metric("Detections", detections)
+        objects_column.metric("Unique objects", len(table))
+        st.write(", ".join(f"{label}: {count}" for label, count in counts.items()))
+        st.dataframe(table)
+        st.download_button("Download objects", csv_data, file_name="objects.csv", key="download-objects")
+
+
+def detect_images(model, uploads, conf, batch_size=settings.IMAGE_BATCH_SIZE,
+                  workers=settings.DECODE_WORKERS, progress=None, imgsz=settings.IMAGE_IMGSZ):
+    """
+    Runs detection on many images with one `predict` call per batch.
+
+    Uploads are decoded in a thread pool; the next batch is decoded while the
+    current one is in the model. Results are yielded in upload order as soon
+    as their batch finishes.
+
+    Parameters:
+        model (YOLO): A YOLOv8 object detection model.
+        uploads (list): Streamlit UploadedFile objects or image paths.
+        conf (float): Confidence threshold for object detection.
+        batch_size (int): Number of images per predict call.
+        workers (int): Number of decoding threads.
+        progress: Optional callable `(done, total)` called after each batch.
+        imgsz (int): Inference size.
+
+    Yields:
+        (upload, PIL image, ultralytics Results) tuples.
+    """
+    uploads = list(uploads)
+    batches = [uploads[i:i + batch_size] for i in range(0, len(uploads), batch_size)]
+    done = 0
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = [pool.submit(_decode_upload, upload) for upload in batches[0]] if batches else []
+        for i, batch in enumerate(batches):
+            images = [future.result() for future in pending]
+            if i + 1 < len(batches):
+                pending = [pool.submit(_decode_upload, upload) for upload in batches[i + 1]]
+            results = model.predict(images, conf=conf, imgsz=imgsz, verbose=False)
+            for upload, image, result in zip(batch, images, results):
+                yield upload, image, result
+            done += len(batch)
+            if progress is not None:
+                progress(done, len(uploads))
 
 
 def display_tracker_options():
@@ -31,7 +736,200 @@ def display_tracker_options():
     return is_display_tracker, None
 
 
-def _display_detected_frames(conf, model, st_frame, image, is_display_tracking=None, tracker=None):
+def run_suffix():
+    """`<run timestamp>-<nonce>`, which keeps the output files of concurrent and repeated runs apart."""
+    return f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
+
+
+def detection_store_path(source, source_id=None):
+    """
+    A new store file for one run: `<source>[-<id digest>]-<run timestamp>-<nonce>.parquet`.
+
+    Parameters:
+        source (str): 'youtube', 'rtsp', 'webcam' or the video's stem.
+        source_id (str): URL or device that tells apart sources of the same
+            kind; only a digest of it goes into the file name.
+    """
+    name = source
+    if source_id:
+        name += '-' + hashlib.sha1(str(source_id).encode()).hexdigest()[:8]
+    return settings.DETECTION_STORE_DIR / f"{name}-{run_suffix()}.parquet"
+
+
+def open_detection_store(source, model, source_id=None):
+    """
+    Starts a DetectionStore for this run of a source.
+
+    Each run writes its own file, so sessions playing the same source (or
+    RTSP streams with different URLs) never replace each other's results; the
+    session remembers its latest file for display_store_exports.
+    """
+    from detection_store import DetectionStore
+
+    path = detection_store_path(source, source_id)
+    st.session_state[f"detection-store-{source}"] = path
+    return DetectionStore(path, names=model.names)
+
+
+def display_store_exports(source):
+    """
+    Offers the detections stored by this session's last run of a source for download.
+
+    The export is streamed from the store to a file the first time a format
+    is picked and reused until the store changes.
+    """
+    path = st.session_state.get(f"detection-store-{source}")
+    if path is None or not path.exists():
+        return
+    import detection_store
+
+    with st.sidebar.expander("Export detections"):
+        fmt = st.selectbox("Format", list(detection_store.EXPORT_FORMATS), key=f"export-format-{source}")
+        try:
+            output = detection_store.export(path, fmt)
+        except Exception as e:
+            st.error(f"Could not export {path.name}: {e}")
+            return
+        with open(output, 'rb') as f:
+            st.download_button("Download", f, file_name=output.name, key=f"export-{source}")
+
+
+@dataclass
+class FrameResult:
+    """Everything the display and the stats need from one processed frame."""
+    image: np.ndarray  # the frame the boxes belong to, BGR, not annotated (see annotate_frame)
+    boxes: np.ndarray  # (N, 4) xyxy in pixels of `image`
+    conf: np.ndarray
+    cls: np.ndarray
+    track_ids: np.ndarray = None  # only set when tracking
+    speed: dict = field(default_factory=dict)  # per-stage timings in ms, ultralytics' plus 'resize'
+    names: dict = field(default_factory=dict)  # class index -> name
+    frame_index: int = 0
+    keyframe: bool = True  # False when the boxes were propagated instead of inferred
+
+    @property
+    def inference_ms(self):
+        return self.speed.get('inference', 0.0)
+
+    @property
+    def num_boxes(self):
+        return len(self.boxes)
+
+
+def _frame_result(res, frame_index=0, speed=None):
+    result = res[0]
+    # One device->host transfer: columns are xyxy, [track id], conf, cls
+    data = result.boxes.data.cpu().numpy()
+    track_ids = data[:, 4].astype(int) if result.boxes.is_track else None
+    return FrameResult(image=result.orig_img,
+                       boxes=data[:, :4],
+                       conf=data[:, -2],
+                       cls=data[:, -1].astype(int),
+                       track_ids=track_ids,
+                       speed={**(speed or {}), **result.speed},
+                       frame_index=frame_index,
+                       names=dict(result.names))
+
+
+def annotate_frame(renderer, frame_result, roi=None):
+    """
+    Draws a FrameResult's detections (and the ROI outline) with an OverlayRenderer.
+
+    Returns:
+        The renderer's buffer, valid until its next call.
+    """
+    canvas = renderer.draw(frame_result.image, frame_result.boxes, frame_result.conf, frame_result.cls,
+                           frame_result.names, frame_result.track_ids)
+    if roi is not None:
+        roi.outline(canvas)
+    return canvas
+
+
+def propagated_frame(model, image, propagator, frame_index, tiling=None):
+    """
+    Builds the FrameResult of a frame that skipped inference.
+
+    Parameters:
+        model (YOLO): The model, for its class names.
+        image (numpy array): The BGR video frame.
+        propagator (BoxPropagator): Holds the boxes of the recent keyframes.
+        frame_index (int): Position of the frame in its source.
+        tiling (TileConfig): Whether keyframes ran tiled (full-resolution coordinates).
+
+    Returns:
+        A FrameResult with keyframe=False.
+    """
+    if not tiling and propagator.frame_shape is not None:
+        # Same size as the keyframe the boxes come from
+        height, width = propagator.frame_shape
+        image = cv2.resize(image, (width, height), interpolation=cv2.INTER_AREA)
+    boxes, conf, cls, track_ids = propagator.propagate(frame_index)
+    return FrameResult(image=image, boxes=boxes, conf=conf, cls=cls, track_ids=track_ids,
+                       frame_index=frame_index, keyframe=False, names=dict(model.names))
+
+
+def detect_frame(conf, model, image, is_display_tracking=None, tracker=None, frame_index=0, tiling=None,
+                 roi=None, resolution=None):
+    """
+    Runs detection (or tracking) exactly once on a video frame.
+
+    Parameters:
+        conf (float): Confidence threshold for object detection.
+        model (YOLO): A YOLOv8 object detection model.
+        image (numpy array): The BGR video frame.
+        is_display_tracking (bool): Track objects across frames instead of plain detection.
+        tracker (str): Tracker config, e.g. 'bytetrack.yaml'.
+        frame_index (int): Position of the frame in its source.
+        tiling (TileConfig): Run tiled inference on the full-resolution frame (no tracking).
+        roi (RoiConfig): Only infer the regions of interest of the frame.
+        resolution (ResolutionPolicy): Input size; defaults to a fixed settings.VIDEO_IMGSZ.
+
+    Returns:
+        A FrameResult, not annotated yet (see annotate_frame).
+    """
+    if tiling:
+        start = time.perf_counter()
+        detections = tiled_predict(model, image, conf, tiling)
+        elapsed_ms = 1000 * (time.perf_counter() - start)
+        return FrameResult(image=image, boxes=detections.boxes, conf=detections.conf, cls=detections.cls,
+                           speed={'inference': elapsed_ms}, frame_index=frame_index, names=detections.names)
+
+    # One aspect-preserving resize straight to the model input size; the
+    # model's letterbox then only pads
+    resolution = resolution or ResolutionPolicy()
+    imgsz = resolution.imgsz
+    start = time.perf_counter()
+    image = resolution.prepare(image)
+    resize_ms = 1000 * (time.perf_counter() - start)
+
+    if roi is not None:
+        start = time.perf_counter()
+        detections = roi_predict(model, image, conf, roi, imgsz, tracker=tracker if is_display_tracking else None)
+        elapsed_ms = 1000 * (time.perf_counter() - start)
+        return FrameResult(image=image, boxes=detections.boxes, conf=detections.conf, cls=detections.cls,
+                           track_ids=detections.track_ids, speed={'resize': resize_ms, 'inference': elapsed_ms},
+                           frame_index=frame_index, names=detections.names)
+
+    if isinstance(model, InferenceClient):
+        start = time.perf_counter()
+        detections = model.detect([image], conf, imgsz)[0]
+        elapsed_ms = 1000 * (time.perf_counter() - start)
+        return FrameResult(image=image, boxes=detections.boxes, conf=detections.conf, cls=detections.cls,
+                           speed={'resize': resize_ms, 'inference': elapsed_ms}, frame_index=frame_index,
+                           names=detections.names)
+
+    # Display object tracking, if specified
+    if is_display_tracking:
+        res = model.track(image, conf=conf, imgsz=imgsz, persist=True, tracker=tracker, verbose=False)
+    else:
+        # Predict the objects in the image using the YOLOv8 model
+        res = model.predict(image, conf=conf, imgsz=imgsz, verbose=False)
+
+    return _frame_result(res, frame_index, {'resize': resize_ms})
+
+
+def _display_detected_frames(conf, model, st_frame, image, is_display_tracking=None, tracker=None,
+                             frame_index=0, tiling=None, renderer=None):
     """
     Display the detected objects on a video frame using the YOLOv8 model.
 
@@ -41,70 +939,380 @@ def _display_detected_frames(conf, model, st_frame, image, is_display_tracking=N
     - st_frame (Streamlit object): A Streamlit object to display the detected video.
     - image (numpy array): A numpy array representing the video frame.
     - is_display_tracking (bool): A flag indicating whether to display object tracking (default=None).
+    - frame_index (int): Position of the frame in its source.
+    - tiling (TileConfig): Run tiled inference on the full-resolution frame.
+    - renderer (OverlayRenderer): Draws the detections; reuse one across frames.
 
     Returns:
-    None
+    The FrameResult of the frame, for callers that report stats.
     """
+    frame_result = detect_frame(conf, model, image, is_display_tracking, tracker, frame_index, tiling)
 
-    # Resize the image to a standard size
-    image = cv2.resize(image, (720, int(720*(9/16))))
-
-    # Display object tracking, if specified
-    if is_display_tracking:
-        res = model.track(image, conf=conf, persist=True, tracker=tracker)
-    else:
-        # Predict the objects in the image using the YOLOv8 model
-        res = model.predict(image, conf=conf)
-
-    # # Plot the detected objects on the video frame
-    res_plotted = res[0].plot()
-    #global speed
-    speed=res[0].speed["inference"]
-    #global boxes_len
-    boxes_len=len(res[0].boxes)
-    # cls=[]
-    # confi=[]
-    # x=[]
-    # y=[]
-    # w=[]
-    # h=[]
-    # file_name=[]
-    # obj_id=[]
-    # for box in res[0].boxes:
-    #     file_name.append(f"frame_{count}")
-    #     cls.append("Plastic")
-    #     confi.append(round(box.conf.tolist()[0],2))
-    #     box_co=box.xyxyn.tolist()[0]
-    #     x.append(box_co[0])
-    #     y.append(box_co[1])
-    #     w.append(box_co[2])
-    #     h.append(box_co[3])
-    #     obj_id.append(box.id.tolist()[0])
-    # df=pd.DataFrame({'File_name':file_name,"object_id":obj_id,"X": x,"Y": y,"Width":w,"Height":h,"class":cls,"confidence":confi})
-
-    st_frame.image(res_plotted,
+    # The overlay keeps the frame's BGR order; Streamlit is told instead of converting
+    st_frame.image(annotate_frame(renderer or OverlayRenderer(), frame_result),
                    caption='Detected Video',
                    channels="BGR",
                    use_column_width=True
                    )
-    # col1, col2, col3 = st.columns(3)
+    return frame_result
+
+
+class StageStats:
+    """Per-stage counters of the video pipeline."""
+
+    def __init__(self, name):
+        self.name = name
+        self.count = 0
+        self.busy_s = 0.0
+        self.max_s = 0.0
+        self.dropped = 0
+
+    def add(self, seconds):
+        self.count += 1
+        self.busy_s += seconds
+        self.max_s = max(self.max_s, seconds)
 
-    # with col1:
-    #     st.header(" Inference time")
-    # #     st.write(f"{speed}s")
+    def as_dict(self):
+        mean_ms = 1000 * self.busy_s / self.count if self.count else 0.0
+        return {'stage': self.name, 'frames': self.count, 'mean_ms': mean_ms,
+                'max_ms': 1000 * self.max_s, 'dropped': self.dropped}
 
-    # with col2:
-    #     st.header("Object count")
-    # #     st.write(f"{boxes_len}")
 
-    # with col3:
-    #     #count=1
-    #     st.header("Frame number")
-    #     st.write(f"{count}")
-    #     count+=1
+_END = object()
+
+
+class FramePipeline:
+    """
+    Decode, inference and render stages joined by bounded queues.
+
+    Decoding and inference each run in their own thread so reading the next
+    frame overlaps with inference on the current one. Rendering runs in the
+    calling thread because Streamlit elements can only be updated from the
+    script thread.
+
+    With the 'block' drop policy a full queue stalls the upstream stage, so
+    every frame is processed (right for files). With 'latest' the oldest
+    queued item is discarded instead, so live sources never fall behind.
+    """
+
+    def __init__(self, read_frame, infer, render, queue_size=settings.PIPELINE_QUEUE_SIZE,
+                 drop_policy=settings.DROP_BLOCK):
+        """
+        Parameters:
+            read_frame: Callable returning `(success, frame)`, e.g. `VideoCapture.read`,
+                or `(success, frame, frame_index)` for readers that skip frames.
+            infer: Callable `(frame, frame_index) -> result`, run in the inference thread.
+            render: Callable `(result)`, run in the calling thread.
+            queue_size (int): Capacity of each inter-stage queue.
+            drop_policy (str): settings.DROP_BLOCK or settings.DROP_LATEST.
+        """
+        if drop_policy not in (settings.DROP_BLOCK, settings.DROP_LATEST):
+            raise ValueError(f"Unknown drop policy: {drop_policy}")
+        self.read_frame = read_frame
+        self.infer = infer
+        self.render = render
+        self.drop_policy = drop_policy
+        self.decode_stats = StageStats('decode')
+        self.infer_stats = StageStats('inference')
+        self.render_stats = StageStats('render')
+        self.latency_stats = StageStats('read to shown')
+        self._frames = queue.Queue(maxsize=queue_size)
+        self._results = queue.Queue(maxsize=queue_size)
+        self._stop = threading.Event()
+        self._error = None
+        self.started = None
+
+    def stats(self):
+        return [s.as_dict() for s in (self.decode_stats, self.infer_stats, self.render_stats, self.latency_stats)]
+
+    @property
+    def fps(self):
+        """Frames shown per second since the pipeline started."""
+        if self.started is None:
+            return 0.0
+        return self.render_stats.count / max(time.perf_counter() - self.started, 1e-9)
+
+    def stop(self):
+        self._stop.set()
+
+    def _put(self, q, item, stats, droppable=True):
+        if droppable and self.drop_policy == settings.DROP_LATEST:
+            while True:
+                try:
+                    q.put_nowait(item)
+                    return
+                except queue.Full:
+                    try:
+                        q.get_nowait()
+                        stats.dropped += 1
+                    except queue.Empty:
+                        pass
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def _get(self, q):
+        while not self._stop.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return _END
+
+    def _decode_loop(self):
+        try:
+            index = -1  # frames are numbered from 0, like grab_reader's
+            while not self._stop.is_set():
+                start = time.perf_counter()
+                item = self.read_frame()
+                if not item[0]:
+                    break
+                frame = item[1]
+                index = item[2] if len(item) > 2 else index + 1
+                read_at = time.perf_counter()
+                self.decode_stats.add(read_at - start)
+                self._put(self._frames, (index, frame, read_at), self.decode_stats)
+        except Exception as e:
+            self._error = e
+        finally:
+            self._put(self._frames, _END, self.decode_stats, droppable=False)
+
+    def _infer_loop(self):
+        try:
+            while True:
+                item = self._get(self._frames)
+                if item is _END:
+                    break
+                index, frame, read_at = item
+                start = time.perf_counter()
+                result = self.infer(frame, index)
+                self.infer_stats.add(time.perf_counter() - start)
+                self._put(self._results, (result, read_at), self.infer_stats)
+        except Exception as e:
+            self._error = e
+        finally:
+            self._put(self._results, _END, self.infer_stats, droppable=False)
+
+    def run(self):
+        """Runs the pipeline until the source is exhausted, an error occurs or stop() is called."""
+        self.started = time.perf_counter()
+        # Named so py-spy and thread dumps show which stage a stack belongs to
+        workers = [threading.Thread(target=self._decode_loop, name='pipeline-decode', daemon=True),
+                   threading.Thread(target=self._infer_loop, name='pipeline-inference', daemon=True)]
+        for worker in workers:
+            worker.start()
+        try:
+            while True:
+                item = self._get(self._results)
+                if item is _END:
+                    break
+                result, read_at = item
+                start = time.perf_counter()
+                self.render(result)
+                self.render_stats.add(time.perf_counter() - start)
+                self.latency_stats.add(time.perf_counter() - read_at)
+        finally:
+            # Also reached when Streamlit interrupts the script on a rerun. The
+            # stages exit at their next queue operation; waiting for them means
+            # a frame still in inference finishes before the next run uses the model
+            self.stop()
+            for worker in workers:
+                worker.join()
+        if self._error is not None:
+            raise self._error
+
+
+def _show_pipeline_stats(placeholder, pipeline, keyframes=None, viewer=None, capture=None, roi=None,
+                         resolution=None):
+    lines = [f"{s['stage']}: {s['mean_ms']:.1f} ms avg, {s['max_ms']:.1f} ms max, "
+             f"{s['frames']} frames, {s['dropped']} dropped"
+             for s in pipeline.stats()]
+    if keyframes is not None and keyframes.skipped:
+        # Only the decoded frames pass through the pipeline; count the grabbed ones too
+        decoded = keyframes.frames - keyframes.skipped
+        source_fps = pipeline.fps * keyframes.frames / decoded if decoded else 0.0
+        lines.append(f"effective FPS: {source_fps:.1f} source frames ({pipeline.fps:.1f} decoded)")
+    else:
+        lines.append(f"effective FPS: {pipeline.fps:.1f}")
+    if viewer is not None:
+        lines.append(f"previews: {viewer.shown} sent, {viewer.skipped} skipped, "
+                     f"{viewer.bytes_sent / 1024 ** 2:.1f} MB")
+    if keyframes is not None and keyframes.frames:
+        propagated = keyframes.frames - keyframes.keyframes - keyframes.skipped
+        lines.append(f"inferred frames: {100 * keyframes.keyframe_ratio:.0f}%, "
+                     f"propagated {100 * propagated / keyframes.frames:.0f}%, "
+                     f"skipped {100 * keyframes.skipped / keyframes.frames:.0f}%")
+    if resolution is not None:
+        mode = f"adaptive, {resolution.changes} changes" if resolution.adaptive else "fixed"
+        lines.append(f"input size: {resolution.imgsz} px long side ({mode})")
+    if roi is not None and roi.frames:
+        lines.append(f"inferred pixels: {100 * roi.pixel_ratio:.0f}% of each frame")
+    if capture is not None:
+        metrics = capture.metrics()
+        latency = metrics.frame_age_ms + pipeline.latency_stats.as_dict()['mean_ms']
+        lines.append(f"source: {metrics.status}, {metrics.reconnects} reconnects, "
+                     f"last frame {metrics.staleness_s:.1f}s ago")
+        if capture.last_error is not None and metrics.status != 'live':
+            lines.append(f"last error: {capture.last_error}")
+        lines.append(f"end-to-end latency: {latency:.0f} ms avg")
+    placeholder.caption("  \n".join(lines))
+
+
+def _show_stage_timings(placeholder, profiler):
+    rows = profiler.summary()
+    if rows:
+        import pandas as pd
+
+        placeholder.dataframe(pd.DataFrame(rows).set_index('stage').round(2))
+
+
+def _play_capture(vid_cap, conf, model, st_frame, is_display_tracking=None, tracker=None,
+                  drop_policy=settings.DROP_BLOCK, on_result=None, tiling=None, keyframes=None,
+                  seekable=False, viewer_options=None, store=None, source_name='', roi=None, resolution=None,
+                  renderer=None, profile=None, exporter=None):
+    """
+    Runs an opened cv2.VideoCapture through the decode/inference/render pipeline.
+
+    Parameters:
+        vid_cap (cv2.VideoCapture): The opened video source, released on return.
+            A ResilientCapture also reports its reconnects and frame latency.
+        conf (float): Confidence threshold for object detection.
+        model (YOLO): A YOLOv8 object detection model.
+        st_frame (Streamlit object): Placeholder the annotated frames are shown in.
+        is_display_tracking (bool): Track objects across frames.
+        tracker (str): Tracker config, e.g. 'bytetrack.yaml'.
+        drop_policy (str): settings.DROP_BLOCK for files, settings.DROP_LATEST for live sources.
+        on_result: Optional callable receiving each FrameResult that is shown.
+        tiling (TileConfig): Run tiled inference on the full-resolution frames.
+        keyframes (KeyframeScheduler): Only infer the frames it picks and
+            propagate boxes to the others.
+        seekable (bool): The source is a file, so with a fixed keyframe
+            interval the skipped frames are grabbed without being decoded or shown.
+        viewer_options (dict): FrameViewer settings, see display_viewer_options.
+        store (DetectionStore): Receives the boxes of every inferred frame,
+            closed on return.
+        source_name (str): File name recorded with the stored boxes.
+        roi (RoiConfig): Only infer the regions of interest (ignored with tiling).
+        resolution (ResolutionPolicy): Model input size; an adaptive policy is
+            fed the processing time of every inferred frame.
+        renderer (OverlayRenderer): Draws the detections of the frames that are shown.
+        profile (ProfileCapture): cProfile the inference of the first frames.
+        exporter (AnnotatedVideoWriter): Receives every processed frame, closed on return.
+
+    Returns:
+        The finished FramePipeline, for its stage timings.
+    """
+    if is_display_tracking and isinstance(model, InferenceClient):
+        st.sidebar.caption("Tracking is not available with the shared inference server.")
+        is_display_tracking, tracker = False, None
+    if is_display_tracking:
+        # A fresh tracker for this run that no other session or rerun shares
+        model = model.tracking_copy()
+    stats_placeholder = st.sidebar.empty()
+    timings_placeholder = st.sidebar.empty()
+    # This run's timings for the sidebar; the process-wide profiler behind it
+    # mixes every session and only feeds /metrics
+    profiler = stage_metrics.StageProfiler(parent=stage_metrics.profiler)
+    capture = vid_cap if isinstance(vid_cap, ResilientCapture) else None
+    last_stats = [0.0]
+    read_frame = vid_cap.read
+    propagator = BoxPropagator()
+    resolution = resolution or ResolutionPolicy()
+    source_fps = vid_cap.get(cv2.CAP_PROP_FPS) if hasattr(vid_cap, 'get') else 0
+    if source_fps > 0:
+        resolution.target_fps = source_fps
+    if keyframes is not None and keyframes.fixed and seekable:
+        # Every decoded frame is then a keyframe; the scheduler still counts the
+        # grabbed ones for the stats
+        read_frame = grab_reader(vid_cap, keyframes.every_n, keyframes)
+        # Only every n-th frame is inferred, so each one may take n frame intervals
+        resolution.target_fps /= keyframes.every_n
+        if exporter is not None:
+            exporter.fps /= keyframes.every_n
+    renderer = renderer or OverlayRenderer()
+    outline = roi if not tiling else None
+
+    def read_timed():
+        start = time.perf_counter()
+        item = read_frame()
+        profiler.observe('decode', time.perf_counter() - start)
+        return item
+
+    def infer(frame, frame_index):
+        if keyframes is None or keyframes.is_keyframe(frame, frame_index):
+            args = (conf, model, frame, is_display_tracking, tracker, frame_index, tiling, roi, resolution)
+            start = time.perf_counter()
+            frame_result = profile.run(detect_frame, *args) if profile is not None else detect_frame(*args)
+            resolution.update(time.perf_counter() - start)
+            profiler.observe_speed(frame_result.speed)
+            propagator.update(frame_result)
+            if store is not None:
+                store.append(frame_result, source_name, frame_index)
+        else:
+            frame_result = propagated_frame(model, frame, propagator, frame_index, tiling)
+        if exporter is not None:
+            # Exported at the source size; never waits for the encoder
+            exporter.write(frame_result, frame)
+        return frame_result
+
+    viewer = FrameViewer(st_frame, **(viewer_options or {}))
+    last_result = [None]
+
+    def render(frame_result):
+        last_result[0] = frame_result
+        # Frames arriving faster than the viewer's FPS cap are neither drawn nor sent to the browser
+        if not viewer.due():
+            viewer.skipped += 1
+            return
+        start = time.perf_counter()
+        canvas = annotate_frame(renderer, frame_result, outline)
+        drawn = time.perf_counter()
+        viewer.push(canvas, force=True)
+        profiler.observe('plot', drawn - start)
+        profiler.observe('ui_push', time.perf_counter() - drawn)
+        if on_result is not None:
+            on_result(frame_result)
+        if time.perf_counter() - last_stats[0] > 1:
+            _show_pipeline_stats(stats_placeholder, pipeline, keyframes, viewer, capture, roi,
+                                 None if tiling else resolution)
+            _show_stage_timings(timings_placeholder, profiler)
+            last_stats[0] = time.perf_counter()
+
+    pipeline = FramePipeline(read_timed, infer, render, drop_policy=drop_policy)
+    try:
+        pipeline.run()
+    finally:
+        vid_cap.release()
+        if store is not None:
+            store.close()
+        if exporter is not None:
+            try:
+                exporter.close()
+            except Exception as e:
+                st.sidebar.error(f"Video export failed: {e}")
+        _show_pipeline_stats(stats_placeholder, pipeline, keyframes, viewer, capture, roi,
+                             None if tiling else resolution)
+        _show_stage_timings(timings_placeholder, profiler)
+        if profile is not None:
+            profile.finish()
+            if profile.done:
+                st.sidebar.caption(f"Profile of {profile.frames} frames written to {profile.path} "
+                                   f"(`python -m pstats {profile.path}`)")
+    if last_result[0] is not None and viewer.skipped:
+        viewer.push(annotate_frame(renderer, last_result[0], outline), force=True)
+        if on_result is not None:
+            on_result(last_result[0])
+    return pipeline
+
+
+def _youtube_stream_url(url):
+    from pytube import YouTube
+
+    return YouTube(url).streams.filter(file_extension="mp4", res=720).first().url
 
-    # st.dataframe(df)
-    return [speed,boxes_len]
 
 def play_youtube_video(conf, model):
     """
@@ -123,29 +1331,29 @@ def play_youtube_video(conf, model):
     source_youtube = st.sidebar.text_input("YouTube Video url")
 
     is_display_tracker, tracker = display_tracker_options()
+    keyframes = display_keyframe_options()
+    roi = display_roi_options(source_youtube)
+    resolution = display_resolution_options()
+    renderer = OverlayRenderer(display_overlay_options())
+    viewer_options = display_viewer_options()
+    profile = display_profiling_options(source_youtube)
 
     if st.sidebar.button('Detect Objects'):
         try:
-            yt = YouTube(source_youtube)
-            stream = yt.streams.filter(file_extension="mp4", res=720).first()
-            vid_cap = cv2.VideoCapture(stream.url)
+            # Stream URLs expire; resolving again on every reconnect renews them. The
+            # stream is a recorded MP4, so it is paced to its timestamps rather than
+            # decoded as fast as possible
+            vid_cap = ResilientCapture(lambda: _youtube_stream_url(source_youtube), live=False)
 
             st_frame = st.empty()
-            while (vid_cap.isOpened()):
-                success, image = vid_cap.read()
-                if success:
-                    _display_detected_frames(conf,
-                                             model,
-                                             st_frame,
-                                             image,
-                                             is_display_tracker,
-                                             tracker
-                                             )
-                else:
-                    vid_cap.release()
-                    break
+            _play_capture(vid_cap, conf, model, st_frame, is_display_tracker, tracker,
+                          drop_policy=settings.LIVE_DROP_POLICY, keyframes=keyframes,
+                          viewer_options=viewer_options, store=open_detection_store('youtube', model),
+                          source_name=source_youtube, roi=roi, resolution=resolution,
+                          renderer=renderer, profile=profile)
         except Exception as e:
             st.sidebar.error("Error loading video: " + str(e))
+    display_store_exports('youtube')
 
 
 def play_rtsp_stream(conf, model):
@@ -164,25 +1372,24 @@ def play_rtsp_stream(conf, model):
     """
     source_rtsp = st.sidebar.text_input("rtsp stream url")
     is_display_tracker, tracker = display_tracker_options()
+    keyframes = display_keyframe_options()
+    roi = display_roi_options(source_rtsp)
+    resolution = display_resolution_options()
+    renderer = OverlayRenderer(display_overlay_options())
+    viewer_options = display_viewer_options()
+    profile = display_profiling_options(source_rtsp)
     if st.sidebar.button('Detect Objects'):
         try:
-            vid_cap = cv2.VideoCapture(source_rtsp)
+            vid_cap = ResilientCapture(lambda: source_rtsp)
             st_frame = st.empty()
-            while (vid_cap.isOpened()):
-                success, image = vid_cap.read()
-                if success:
-                    _display_detected_frames(conf,
-                                             model,
-                                             st_frame,
-                                             image,
-                                             is_display_tracker,
-                                             tracker
-                                             )
-                else:
-                    vid_cap.release()
-                    break
+            _play_capture(vid_cap, conf, model, st_frame, is_display_tracker, tracker,
+                          drop_policy=settings.LIVE_DROP_POLICY, keyframes=keyframes,
+                          viewer_options=viewer_options, store=open_detection_store('rtsp', model, source_rtsp),
+                          source_name=source_rtsp, roi=roi, resolution=resolution,
+                          renderer=renderer, profile=profile)
         except Exception as e:
             st.sidebar.error("Error loading RTSP stream: " + str(e))
+    display_store_exports('rtsp')
 
 
 def play_webcam(conf, model):
@@ -201,26 +1408,92 @@ def play_webcam(conf, model):
     """
     source_webcam = settings.WEBCAM_PATH
     is_display_tracker, tracker = display_tracker_options()
+    keyframes = display_keyframe_options()
+    roi = display_roi_options('webcam')
+    resolution = display_resolution_options()
+    renderer = OverlayRenderer(display_overlay_options())
+    viewer_options = display_viewer_options()
+    profile = display_profiling_options('webcam')
     if st.sidebar.button('Detect Objects'):
         try:
-            vid_cap = cv2.VideoCapture(source_webcam)
+            vid_cap = ResilientCapture(lambda: source_webcam)
             st_frame = st.empty()
-            while (vid_cap.isOpened()):
-                success, image = vid_cap.read()
-                if success:
-                    print(speed)
-                    _display_detected_frames(conf,
-                                             model,
-                                             st_frame,
-                                             image,
-                                             is_display_tracker,
-                                             tracker,
-                                             )
-                else:
-                    vid_cap.release()
-                    break
+            _play_capture(vid_cap, conf, model, st_frame, is_display_tracker, tracker,
+                          drop_policy=settings.LIVE_DROP_POLICY, keyframes=keyframes,
+                          viewer_options=viewer_options, store=open_detection_store('webcam', model),
+                          source_name='webcam', roi=roi, resolution=resolution,
+                          renderer=renderer, profile=profile)
         except Exception as e:
             st.sidebar.error("Error loading video: " + str(e))
+    display_store_exports('webcam')
+
+
+def play_multi_stream(conf, model):
+    """
+    Shows a grid of live cameras, all detected with the same model.
+
+    Each camera is decoded in its own thread and their fresh frames are
+    batched into shared inference calls, so a stalled camera only freezes its
+    own cell. Runs until the next interaction with the app.
+
+    Parameters:
+        conf: Confidence of YOLOv8 model.
+        model: An instance of the `YOLOv8` class containing the YOLOv8 model.
+
+    Returns:
+        None
+    """
+    urls = st.sidebar.text_area("RTSP stream urls (one per line)")
+    include_webcam = st.sidebar.checkbox("Include webcam")
+    num_columns = st.sidebar.slider("Grid columns", 1, 4, settings.MULTI_STREAM_COLUMNS)
+    overlay_mode = display_overlay_options()
+    sources = [url.strip() for url in urls.splitlines() if url.strip()]
+    if include_webcam:
+        sources.append(settings.WEBCAM_PATH)
+
+    if not st.sidebar.button('Detect Objects'):
+        return
+    if not sources:
+        st.sidebar.warning("Add at least one stream url or the webcam.")
+        return
+
+    resize = ResolutionPolicy().prepare
+    workers = [StreamWorker(f"Camera {i + 1}", source, prepare=resize) for i, source in enumerate(sources)]
+    detector = MultiStreamDetector(model, workers, conf)
+    error_placeholder = st.empty()
+    grid = st.columns(num_columns)
+    cells = []
+    for i, worker in enumerate(workers):
+        with grid[i % num_columns]:
+            viewer = FrameViewer(st.empty(), max_fps=settings.MULTI_STREAM_VIEW_FPS, max_width=640,
+                                 caption=worker.name)
+            cells.append((worker, viewer, st.empty(), OverlayRenderer(overlay_mode)))
+
+    shown = {}
+    last_stats = 0.0
+    detector.start()
+    try:
+        while True:
+            for worker, viewer, _, renderer in cells:
+                result = detector.latest(worker.name)
+                if result is None or shown.get(worker.name) == result.sequence or not viewer.due():
+                    continue
+                found = result.detections
+                viewer.push(renderer.draw(result.image, found.boxes, found.conf, found.cls, found.names))
+                shown[worker.name] = result.sequence
+            if time.perf_counter() - last_stats > 1:
+                for worker, _, caption, _ in cells:
+                    stats = detector.stats(worker)
+                    latency = f"{stats['latency_ms']:.0f} ms" if stats['latency_ms'] is not None else "-"
+                    caption.caption(f"{stats['status']} | {stats['fps']:.1f} FPS | latency {latency} | "
+                                    f"{stats['dropped']} dropped | {stats['reconnects']} reconnects")
+                if detector.error is not None:
+                    error_placeholder.warning(f"Inference error: {detector.error}")
+                last_stats = time.perf_counter()
+            time.sleep(0.01)
+    finally:
+        # Also reached when Streamlit interrupts the script on a rerun
+        detector.stop()
 
 
 def play_stored_video(conf, model):
@@ -241,6 +1514,17 @@ def play_stored_video(conf, model):
         "Choose a video...", settings.VIDEOS_DICT.keys())
 
     is_display_tracker, tracker = display_tracker_options()
+    keyframes = display_keyframe_options()
+    tiling = display_tiling_options()
+    roi = None if tiling else display_roi_options(source_vid)
+    resolution = display_resolution_options()
+    renderer = OverlayRenderer(display_overlay_options())
+    viewer_options = display_viewer_options()
+    profile = display_profiling_options(source_vid)
+    export_options = display_export_options()
+    if tiling and is_display_tracker:
+        st.sidebar.caption("Tracking is not available with tiled inference.")
+        is_display_tracker, tracker = False, None
 
 
     col1, col2 = st.columns(2)
@@ -257,45 +1541,37 @@ def play_stored_video(conf, model):
                 vid_cap = cv2.VideoCapture(
                     str(settings.VIDEOS_DICT.get(source_vid)))
                 st_frame = st.empty()
-                count=0
-                #start_time=0
-                while (vid_cap.isOpened()):
-                    count+=1
-                    #current_time=time.time()
-                    #fps=1/(current_time-start_time)
-                    #start_time=current_time
-                    success, image = vid_cap.read()
-                    if success:
-                        obj_s=round(_display_detected_frames(conf,
-                                                model,
-                                                st_frame,
-                                                image,
-                                                is_display_tracker,
-                                                tracker
-                                                )[0],1)
-                        obj=_display_detected_frames(conf,
-                                                model,
-                                                st_frame,
-                                                image,
-                                                is_display_tracker,
-                                                tracker
-                                                )[1]
-                        # Add custom CSS to remove column spacing
-                        st.empty()
-                        col1, col2, col3 = st.columns(3)
-                        col1.write(f"Inference time: {obj_s}ms")
-                        col2.write(f"object count: {obj}")
-                        col3.write(f"Frame number: {count}")
-                         # Create three columns and apply custom headings
-                    else:
-                        vid_cap.release()
-                        break
-                for i in obj_s:
-                    print(i)
-            except Exception as e:
-                #st.sidebar.error("Error loading video: " + str(e))
+
+                # Created once; every shown frame updates the same four metrics
+                stats_panel = StatsPanel(("Inference time", "Object count", "Frame number", "Input size"))
+
+                def show_stats(frame_result):
+                    height, width = frame_result.image.shape[:2]
+                    stats_panel.update({
+                        "Inference time": f"{frame_result.inference_ms:.1f}ms",
+                        "Object count": frame_result.num_boxes,
+                        "Frame number": frame_result.frame_index,
+                        "Input size": f"{width}x{height}",
+                    })
+
+                video_path = Path(settings.VIDEOS_DICT.get(source_vid))
+                exporter = None
+                if export_options is not None:
+                    # One file per run, like the detection store, so sessions never share one
+                    export_path = settings.VIDEO_EXPORT_DIR / f"{video_path.stem}_detected-{run_suffix()}.mp4"
+                    exporter = AnnotatedVideoWriter(export_path, vid_cap.get(cv2.CAP_PROP_FPS), mode=renderer.mode,
+                                                    **export_options)
+                _play_capture(vid_cap, conf, model, st_frame, is_display_tracker, tracker,
+                              on_result=show_stats, tiling=tiling, keyframes=keyframes, seekable=True,
+                              viewer_options=viewer_options, store=open_detection_store(video_path.stem, model),
+                              source_name=video_path.name, roi=roi, resolution=resolution,
+                              renderer=renderer, profile=profile, exporter=exporter)
                 st.sidebar.write("video processed successfully")
-                
+                if exporter is not None:
+                    display_export_result(exporter)
+            except Exception as e:
+                st.sidebar.error("Error loading video: " + str(e))
+
             col1, col2, col3 = st.columns(3)
 
             with col1:
@@ -311,6 +1587,8 @@ def play_stored_video(conf, model):
                 st.header(" ")
                 #st.write(f"{count}")
 
+    display_store_exports(Path(settings.VIDEOS_DICT.get(source_vid)).stem)
+
 
     
    
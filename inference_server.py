@@ -0,0 +1,391 @@
+"""
+Shared local inference server.
+
+    python -m inference_server --address /tmp/plastic-detection.sock --max-batch 16 --max-latency-ms 10
+
+One process owns the model. Streamlit sessions (and any other client) connect
+over a Unix socket or a localhost TCP port and send frames; the server queues
+the images of all clients and runs them through the model in dynamic batches.
+A batch is started as soon as it is full or the oldest queued image has
+waited `max_latency_ms`, so a single client is never held back for long while
+many clients share each predict call.
+
+Set settings.INFERENCE_SERVER_ADDRESS to the same address to make the app a
+client instead of loading its own model.
+
+Messages are pickled, so anyone who can connect and knows the authkey can run
+code in the server. The key is therefore read from the environment (or a key
+file) on both sides rather than shipped in settings, the Unix socket is only
+accessible to its owner, and TCP is limited to loopback unless --allow-remote
+is given.
+"""
+import argparse
+from collections import Counter
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+import itertools
+from multiprocessing.connection import Client, Listener
+import ipaddress
+import os
+import queue
+import socket
+import stat
+import threading
+import time
+
+import numpy as np
+
+import settings
+from result_cache import Detections
+
+
+def parse_address(address):
+    """'host:port' -> (host, port) for TCP, anything else is a Unix socket path."""
+    if isinstance(address, tuple):
+        return address
+    host, sep, port = str(address).rpartition(':')
+    if sep and port.isdigit() and '/' not in host:
+        return host or 'localhost', int(port)
+    return str(address)
+
+
+# The key that used to be hard-coded in settings; it is public, so never accepted
+_DEFAULT_AUTHKEY = b'plastic-detection'
+
+
+def load_authkey(env=settings.INFERENCE_SERVER_AUTHKEY_ENV, path=settings.INFERENCE_SERVER_AUTHKEY_FILE):
+    """
+    The shared secret from the environment variable `env`, else from the file at `path`.
+
+    Raises:
+        RuntimeError: No key is configured, or it is the old built-in default.
+    """
+    key = os.environ.get(env, '').strip().encode()
+    if not key and path is not None:
+        key = open(path, 'rb').read().strip()
+    if not key:
+        raise RuntimeError(f"No inference server authkey: set ${env} or settings.INFERENCE_SERVER_AUTHKEY_FILE")
+    if key == _DEFAULT_AUTHKEY:
+        raise RuntimeError("The inference server authkey is the old public default; generate a new one")
+    return key
+
+
+def check_address(address, allow_remote=settings.INFERENCE_SERVER_ALLOW_REMOTE):
+    """
+    Raises ValueError for a TCP address that is not loopback, unless `allow_remote`.
+
+    Unix socket paths are always accepted.
+    """
+    if not isinstance(address, tuple) or allow_remote:
+        return address
+    host = address[0]
+    try:
+        loopback = all(ipaddress.ip_address(info[4][0]).is_loopback
+                       for info in socket.getaddrinfo(host, address[1], proto=socket.IPPROTO_TCP))
+    except (socket.gaierror, ValueError):
+        loopback = False
+    if not loopback:
+        raise ValueError(f"{host} is not a loopback address; pass --allow-remote to serve other hosts")
+    return address
+
+
+def _remove_stale_socket(path):
+    """Deletes the socket a crashed server left at `path`; anything else there is an error."""
+    try:
+        mode = os.lstat(path).st_mode
+    except FileNotFoundError:
+        return
+    if not stat.S_ISSOCK(mode):
+        raise FileExistsError(f"{path} exists and is not a socket; refusing to replace it")
+    with socket.socket(socket.AF_UNIX) as probe:
+        try:
+            probe.connect(path)
+        except ConnectionRefusedError:
+            os.unlink(path)  # nobody is listening
+            return
+    raise OSError(f"Another server is already listening on {path}")
+
+
+@dataclass
+class _Job:
+    """One detect request: several images whose results go back in a single reply."""
+    conn: object
+    send_lock: object
+    request_id: int
+    conf: float
+    imgsz: int
+    results: list
+    remaining: int
+    received: float = field(default_factory=time.perf_counter)
+
+
+class InferenceServer:
+    """Accepts client connections and batches their images through one model."""
+
+    def __init__(self, model, address, max_batch=settings.SERVER_MAX_BATCH,
+                 max_latency_ms=settings.SERVER_MAX_LATENCY_MS, authkey=None,
+                 allow_remote=settings.INFERENCE_SERVER_ALLOW_REMOTE):
+        """
+        Parameters:
+            model (YOLO): The model every client shares.
+            address (str or tuple): Unix socket path or (host, port).
+            max_batch (int): Most images per predict call.
+            max_latency_ms (float): Longest an image waits for its batch to fill.
+            authkey (bytes): Shared secret clients must present; load_authkey() if None.
+            allow_remote (bool): Accept a TCP address that is not loopback.
+        """
+        self.model = model
+        self.address = check_address(parse_address(address), allow_remote)
+        self.max_batch = max_batch
+        self.max_latency = max_latency_ms / 1000
+        self.authkey = authkey if authkey is not None else load_authkey()
+        self.info = {'names': dict(model.names),
+                     'weights_digest': _model_digest(model),
+                     'max_batch': max_batch, 'max_latency_ms': max_latency_ms}
+        self._queue = queue.Queue()
+        self._stats_lock = threading.Lock()
+        self._batch_sizes = Counter()
+        self._requests = 0
+        self._images = 0
+        self._clients = 0
+        self._wait_s = 0.0
+        self._infer_s = 0.0
+
+    def stats(self):
+        """Queue depth, batch size distribution and timings since start."""
+        with self._stats_lock:
+            batches = sum(self._batch_sizes.values())
+            return {
+                'queue_depth': self._queue.qsize(),
+                'clients': self._clients,
+                'requests': self._requests,
+                'images': self._images,
+                'batches': batches,
+                'mean_batch_size': self._images / batches if batches else 0.0,
+                'batch_sizes': dict(sorted(self._batch_sizes.items())),
+                'mean_wait_ms': 1000 * self._wait_s / self._images if self._images else 0.0,
+                'mean_infer_ms': 1000 * self._infer_s / batches if batches else 0.0,
+            }
+
+    def _next_batch(self):
+        """Blocks for the first image, then gathers more until the batch is full or the deadline passes."""
+        batch = [self._queue.get()]
+        deadline = batch[0][3] + self.max_latency
+        while len(batch) < self.max_batch:
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return batch
+
+    def _batch_loop(self):
+        while True:
+            batch = self._next_batch()
+            # One predict call per input size; the lowest confidence of the
+            # group is used and each job filters to its own threshold
+            for imgsz in {item[0].imgsz for item in batch}:
+                group = [item for item in batch if item[0].imgsz == imgsz]
+                start = time.perf_counter()
+                try:
+                    results = self.model.predict([item[2] for item in group], imgsz=imgsz, verbose=False,
+                                                 conf=min(item[0].conf for item in group))
+                    detections = [Detections.from_result(result) for result in results]
+                except Exception as e:
+                    for job in {id(item[0]): item[0] for item in group}.values():
+                        _send(job.conn, job.send_lock, (job.request_id, 'error', str(e)))
+                    continue
+                elapsed = time.perf_counter() - start
+                with self._stats_lock:
+                    self._batch_sizes[len(group)] += 1
+                    self._images += len(group)
+                    self._infer_s += elapsed
+                    self._wait_s += sum(start - item[3] for item in group)
+                for (job, index, _, _), found in zip(group, detections):
+                    job.results[index] = found.filter(job.conf)
+                    job.remaining -= 1
+                    if not job.remaining:
+                        _send(job.conn, job.send_lock, (job.request_id, 'ok', job.results))
+
+    def _serve_client(self, conn):
+        send_lock = threading.Lock()
+        with self._stats_lock:
+            self._clients += 1
+        try:
+            while True:
+                try:
+                    message = conn.recv()
+                except (EOFError, OSError):
+                    break
+                op, request_id = message[0], message[1]
+                if op == 'info':
+                    _send(conn, send_lock, (request_id, 'ok', self.info))
+                elif op == 'stats':
+                    _send(conn, send_lock, (request_id, 'ok', self.stats()))
+                elif op == 'detect':
+                    images, conf, imgsz = message[2:]
+                    if not images:
+                        _send(conn, send_lock, (request_id, 'ok', []))
+                        continue
+                    job = _Job(conn, send_lock, request_id, conf, imgsz, [None] * len(images), len(images))
+                    with self._stats_lock:
+                        self._requests += 1
+                    for index, image in enumerate(images):
+                        self._queue.put((job, index, image, job.received))
+                else:
+                    _send(conn, send_lock, (request_id, 'error', f"Unknown operation: {op}"))
+        finally:
+            with self._stats_lock:
+                self._clients -= 1
+            conn.close()
+
+    def serve_forever(self):
+        threading.Thread(target=self._batch_loop, daemon=True).start()
+        if isinstance(self.address, str):
+            _remove_stale_socket(self.address)
+            # Bind under a umask so the socket is 0600 from the start
+            umask = os.umask(0o177)
+            try:
+                listener = Listener(self.address, authkey=self.authkey)
+            finally:
+                os.umask(umask)
+        else:
+            listener = Listener(self.address, authkey=self.authkey)
+        with listener:
+            print(f"Serving {self.info['weights_digest'][:12]} on {self.address} "
+                  f"(batches of up to {self.max_batch}, {1000 * self.max_latency:.0f} ms deadline)")
+            while True:
+                try:
+                    conn = listener.accept()
+                except (OSError, EOFError) as e:
+                    # A client that failed authentication or hung up during the handshake
+                    print(f"Rejected connection: {e}")
+                    continue
+                threading.Thread(target=self._serve_client, args=(conn,), daemon=True).start()
+
+
+def _send(conn, lock, message):
+    with lock:
+        try:
+            conn.send(message)
+        except (OSError, EOFError):
+            pass  # the client went away; its reader thread cleans up
+
+
+def _model_digest(model):
+    from backends import weights_digest
+
+    return weights_digest(getattr(model, 'ckpt_path', None) or model.model_name)
+
+
+class InferenceClient:
+    """
+    Connection to an InferenceServer, safe to share between threads.
+
+    Requests from several threads are in flight at the same time; a reader
+    thread hands every reply to the request it belongs to. `names` and
+    `weights_digest` mirror the server's model so the client can stand in for
+    a model where only detection is needed.
+    """
+
+    def __init__(self, address=settings.INFERENCE_SERVER_ADDRESS, authkey=None,
+                 timeout=settings.SERVER_REQUEST_TIMEOUT):
+        self.address = parse_address(address)
+        self.timeout = timeout
+        self._conn = Client(self.address, authkey=authkey if authkey is not None else load_authkey())
+        self._send_lock = threading.Lock()
+        self._pending = {}
+        self._pending_lock = threading.Lock()
+        self._ids = itertools.count()
+        self.closed = False
+        threading.Thread(target=self._read_loop, daemon=True).start()
+        info = self._call('info')
+        self.names = info['names']
+        self.weights_digest = info['weights_digest']
+
+    def _read_loop(self):
+        try:
+            while True:
+                request_id, status, payload = self._conn.recv()
+                with self._pending_lock:
+                    future = self._pending.pop(request_id, None)
+                if future is None:
+                    continue
+                if status == 'ok':
+                    future.set_result(payload)
+                else:
+                    future.set_exception(RuntimeError(f"Inference server error: {payload}"))
+        except (EOFError, OSError):
+            pass
+        finally:
+            self.closed = True
+            with self._pending_lock:
+                pending, self._pending = self._pending, {}
+            for future in pending.values():
+                future.set_exception(ConnectionError("Inference server connection closed"))
+
+    def _call(self, op, *args):
+        if self.closed:
+            raise ConnectionError("Inference server connection closed")
+        request_id = next(self._ids)
+        future = Future()
+        with self._pending_lock:
+            self._pending[request_id] = future
+        try:
+            with self._send_lock:
+                self._conn.send((op, request_id) + args)
+            return future.result(timeout=self.timeout)
+        finally:
+            # Gone already when the reply arrived; left behind by a failed send or a timeout
+            with self._pending_lock:
+                self._pending.pop(request_id, None)
+
+    def detect(self, images, conf, imgsz=settings.IMAGE_IMGSZ):
+        """
+        Parameters:
+            images (list): BGR numpy arrays.
+            conf (float): Confidence threshold.
+            imgsz (int): Inference size.
+
+        Returns:
+            A list of Detections, one per image.
+        """
+        return self._call('detect', [np.ascontiguousarray(image) for image in images], conf, imgsz)
+
+    def stats(self):
+        return self._call('stats')
+
+    def close(self):
+        self.closed = True
+        self._conn.close()
+
+
+def main(argv=None):
+    import helper
+
+    parser = argparse.ArgumentParser(description="Serve the detection model to every app session.")
+    parser.add_argument('--address', default=settings.INFERENCE_SERVER_ADDRESS or '/tmp/plastic-detection.sock',
+                        help="Unix socket path or host:port")
+    parser.add_argument('--weights', default=str(settings.DETECTION_MODEL))
+    parser.add_argument('--backend', default=settings.MODEL_BACKEND,
+                        choices=(settings.BACKEND_TORCH, settings.BACKEND_ONNX, settings.BACKEND_OPENVINO))
+    parser.add_argument('--int8', action='store_true', help='use the INT8 quantized model')
+    parser.add_argument('--device', default=settings.DEVICE)
+    parser.add_argument('--max-batch', type=int, default=settings.SERVER_MAX_BATCH)
+    parser.add_argument('--max-latency-ms', type=float, default=settings.SERVER_MAX_LATENCY_MS)
+    parser.add_argument('--allow-remote', action='store_true', default=settings.INFERENCE_SERVER_ALLOW_REMOTE,
+                        help='accept a TCP address that is not loopback')
+    args = parser.parse_args(argv)
+
+    # Checked before the model is loaded, so a bad setup fails fast
+    authkey = load_authkey()
+    address = check_address(parse_address(args.address), args.allow_remote)
+    model = helper.load_model(args.weights, device=args.device, backend=args.backend, int8=args.int8)
+    InferenceServer(model, address, args.max_batch, args.max_latency_ms, authkey=authkey,
+                    allow_remote=args.allow_remote).serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,150 @@
+"""
+Keyframe inference: run the detector on a subset of frames only.
+
+A KeyframeScheduler decides which frames go through the model, either every
+n-th frame or whenever a cheap motion score against the last keyframe crosses
+a threshold. Boxes for the frames in between come from a BoxPropagator, which
+moves each tracked box along its velocity between the last two keyframes.
+"""
+import cv2
+import numpy as np
+
+MOTION_SIZE = (64, 36)  # frames are compared at this size
+
+
+def motion_small(frame):
+    """Downscaled grayscale copy of a frame used for motion scores."""
+    small = cv2.resize(frame, MOTION_SIZE, interpolation=cv2.INTER_AREA)
+    return cv2.cvtColor(small, cv2.COLOR_BGR2GRAY).astype(np.float32)
+
+
+def motion_score(previous_small, small):
+    """Mean absolute difference of two motion_small frames, scaled to 0..1."""
+    return float(np.abs(small - previous_small).mean()) / 255
+
+
+class KeyframeScheduler:
+    """
+    Picks the frames that go through the model.
+
+    With `motion_threshold` None every `every_n`-th frame is a keyframe.
+    Otherwise a frame is a keyframe when it differs from the last keyframe by
+    more than the threshold, or `every_n` frames have passed since it.
+    """
+
+    def __init__(self, every_n=1, motion_threshold=None):
+        self.every_n = max(1, every_n)
+        self.motion_threshold = motion_threshold
+        self.frames = 0
+        self.keyframes = 0
+        self.skipped = 0  # frames grab_reader passed over without decoding, included in `frames`
+        self._last_index = None
+        self._last_small = None
+
+    @property
+    def fixed(self):
+        return self.motion_threshold is None
+
+    @property
+    def keyframe_ratio(self):
+        return self.keyframes / self.frames if self.frames else 0.0
+
+    def is_keyframe(self, frame, frame_index):
+        self.frames += 1
+        due = self._last_index is None or frame_index - self._last_index >= self.every_n
+        if self.fixed:
+            key = due
+        else:
+            small = motion_small(frame)
+            key = due or motion_score(self._last_small, small) > self.motion_threshold
+            if key:
+                self._last_small = small
+        if key:
+            self._last_index = frame_index
+            self.keyframes += 1
+        return key
+
+
+def grab_reader(vid_cap, every_n, scheduler=None):
+    """
+    A FramePipeline reader that decodes only every n-th frame of a stored video.
+
+    Frames in between are skipped with `grab()`, so they are demuxed but never
+    decoded into images.
+
+    Parameters:
+        vid_cap (cv2.VideoCapture): The opened video.
+        every_n (int): Decode one frame in this many.
+        scheduler (KeyframeScheduler): Counts the skipped frames, so its
+            ratios cover every source frame.
+
+    Returns:
+        A callable returning (success, frame, frame_index), with the 0-based
+        index of the decoded frame in the video.
+    """
+    position = [0]
+
+    def read():
+        # Decode the current frame first, so frames 0, n, 2n, ... are the ones inferred
+        index = position[0]
+        success, frame = vid_cap.read()
+        if not success:
+            return False, None, index
+        position[0] += 1
+        for _ in range(every_n - 1):
+            if not vid_cap.grab():
+                break
+            position[0] += 1
+            if scheduler is not None:
+                scheduler.frames += 1
+                scheduler.skipped += 1
+        return True, frame, index
+
+    return read
+
+
+def _velocity(previous, last):
+    """Per-box velocity (pixels per frame) of `last`'s boxes, zero where the track is new."""
+    velocity = np.zeros_like(last.boxes)
+    if previous is None or previous.track_ids is None or last.track_ids is None:
+        return velocity
+    if previous.image.shape != last.image.shape:
+        # The input size changed between the keyframes; the boxes are not comparable
+        return velocity
+    gap = last.frame_index - previous.frame_index
+    if gap <= 0:
+        return velocity
+    _, last_idx, prev_idx = np.intersect1d(last.track_ids, previous.track_ids, return_indices=True)
+    velocity[last_idx] = (last.boxes[last_idx] - previous.boxes[prev_idx]) / gap
+    return velocity
+
+
+class BoxPropagator:
+    """Carries keyframe boxes forward to the frames that were not inferred."""
+
+    def __init__(self):
+        self._previous = None
+        self._last = None
+        self._velocity = None
+
+    @property
+    def frame_shape(self):
+        """(height, width) of the last keyframe, which propagated boxes are relative to."""
+        return self._last.image.shape[:2] if self._last is not None else None
+
+    def update(self, frame_result):
+        self._previous, self._last = self._last, frame_result
+        self._velocity = _velocity(self._previous, self._last)
+
+    def propagate(self, frame_index):
+        """
+        Returns (boxes, conf, cls, track_ids) estimated for a non-keyframe.
+
+        Tracked boxes move at their velocity between the last two keyframes;
+        untracked boxes stay where they were last seen.
+        """
+        last = self._last
+        if last is None:
+            return np.zeros((0, 4), np.float32), np.zeros(0, np.float32), np.zeros(0, int), None
+        boxes = last.boxes + self._velocity * (frame_index - last.frame_index)
+        return boxes, last.conf, last.cls, last.track_ids
@@ -0,0 +1,204 @@
+"""
+Many live cameras sharing one model.
+
+Every stream is decoded by its own StreamWorker thread, which keeps only the
+newest frame, so a slow or stalled camera never holds up the others. Lost
+cameras are reconnected by their ResilientCapture. A single
+MultiStreamDetector thread visits the streams round-robin, takes every fresh
+frame it finds (up to `max_batch`) and runs them through the model in one
+batched call. The UI thread only reads the latest result of each stream.
+"""
+from collections import deque
+from dataclasses import dataclass
+import threading
+import time
+
+import settings
+from capture import ResilientCapture
+from result_cache import detect_batch
+
+
+class StreamWorker:
+    """Decodes one source in its own thread, keeping only the newest frame."""
+
+    def __init__(self, name, source, prepare=None):
+        """
+        Parameters:
+            name (str): Label shown in the grid.
+            source: Anything cv2.VideoCapture opens (RTSP URL, webcam index, file).
+            prepare: Optional callable applied to each frame in this thread, e.g. a resize.
+        """
+        self.name = name
+        self.source = source
+        self.prepare = prepare
+        self.decoded = 0
+        self.dropped = 0  # frames replaced by a newer one before inference took them
+        self.last_frame_time = None
+        self._capture = None
+        self._frame = None
+        self._captured = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        # Reconnects with backoff happen inside the capture; read() only fails once it gives up
+        self._capture = ResilientCapture(lambda: self.source)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._capture is not None:
+            self._capture.release()
+
+    def join(self, timeout=1):
+        self._thread.join(timeout)
+
+    @property
+    def reconnects(self):
+        return self._capture.reconnects if self._capture is not None else 0
+
+    def _run(self):
+        while not self._stop.is_set():
+            success, frame = self._capture.read()
+            if not success:
+                break
+            captured = self._capture.last_captured
+            if self.prepare is not None:
+                frame = self.prepare(frame)
+            with self._lock:
+                if self._frame is not None:
+                    self.dropped += 1
+                self._frame, self._captured = frame, captured
+                self.decoded += 1
+                self.last_frame_time = captured
+        self._capture.release()
+
+    def take(self):
+        """Returns (frame, capture time) of the newest unseen frame, or (None, None)."""
+        with self._lock:
+            frame, captured = self._frame, self._captured
+            self._frame = None
+        return frame, captured
+
+    def status(self, stall_seconds=settings.STREAM_STALL_SECONDS):
+        if self._capture is None:
+            return 'connecting'
+        if self.last_frame_time is not None and time.perf_counter() - self.last_frame_time > stall_seconds:
+            return self._capture.status if self._capture.status != 'live' else 'stalled'
+        return self._capture.status
+
+
+@dataclass
+class StreamResult:
+    """Latest inference output of one stream."""
+    image: object  # the frame the boxes belong to, BGR, not annotated
+    detections: object  # Detections
+    captured: float
+    finished: float
+    sequence: int  # increases with every new result
+
+    @property
+    def latency_ms(self):
+        """Capture to detection time."""
+        return 1000 * (self.finished - self.captured)
+
+
+class MultiStreamDetector:
+    """Runs the fresh frames of all streams through one model in round-robin batches."""
+
+    def __init__(self, model, workers, conf, max_batch=settings.MULTI_STREAM_MAX_BATCH,
+                 imgsz=settings.VIDEO_IMGSZ):
+        """
+        Parameters:
+            model: A YOLO model or an InferenceClient, shared by every stream.
+            workers (list): StreamWorker per stream.
+            conf (float): Confidence threshold.
+            max_batch (int): Most frames per inference call.
+            imgsz (int): Inference size.
+        """
+        self.model = model
+        self.workers = workers
+        self.conf = conf
+        self.max_batch = max_batch
+        self.imgsz = imgsz
+        self.batches = 0
+        self.error = None
+        self._results = {}
+        self._times = {worker.name: deque(maxlen=30) for worker in workers}
+        self._next = 0
+        self._sequence = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        for worker in self.workers:
+            worker.start()
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        for worker in self.workers:
+            worker.stop()
+        self._thread.join(timeout=1)
+        for worker in self.workers:
+            worker.join(timeout=0.1)
+
+    def _collect(self):
+        """Fresh frames, starting after the stream served first last time so no stream is favoured."""
+        count = len(self.workers)
+        batch = []
+        for offset in range(count):
+            worker = self.workers[(self._next + offset) % count]
+            frame, captured = worker.take()
+            if frame is not None:
+                batch.append((worker, frame, captured))
+                if len(batch) == self.max_batch:
+                    self._next = (self._next + offset + 1) % count
+                    return batch
+        self._next = (self._next + 1) % count
+        return batch
+
+    def _run(self):
+        while not self._stop.is_set():
+            batch = self._collect()
+            if not batch:
+                time.sleep(0.005)
+                continue
+            try:
+                found = detect_batch(self.model, [frame for _, frame, _ in batch], self.conf, self.imgsz)
+            except Exception as e:
+                # Keep serving; the UI shows the last error
+                self.error = e
+                time.sleep(0.1)
+                continue
+            finished = time.perf_counter()
+            self.batches += 1
+            with self._lock:
+                for (worker, frame, captured), detections in zip(batch, found):
+                    self._sequence += 1
+                    self._results[worker.name] = StreamResult(frame, detections, captured, finished,
+                                                              self._sequence)
+                    self._times[worker.name].append(finished)
+
+    def latest(self, name):
+        with self._lock:
+            return self._results.get(name)
+
+    def stats(self, worker):
+        """Per-stream counters for the grid captions."""
+        with self._lock:
+            times = list(self._times[worker.name])
+            result = self._results.get(worker.name)
+        fps = (len(times) - 1) / (times[-1] - times[0]) if len(times) > 1 and times[-1] > times[0] else 0.0
+        return {
+            'status': worker.status(),
+            'fps': fps,
+            'latency_ms': result.latency_ms if result is not None else None,
+            'dropped': worker.dropped,
+            'decoded': worker.decoded,
+            'reconnects': worker.reconnects,
+        }
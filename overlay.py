@@ -0,0 +1,150 @@
+"""
+Detection overlays drawn without ultralytics' Results.plot().
+
+plot() copies the frame and draws every box through its Annotator, and the
+app then copied it again to swap colour channels. OverlayRenderer draws into
+one buffer that is reused while the frame size stays the same, outlines all
+boxes with a single polylines call, fills all label backgrounds with a single
+fillPoly call and caches label text sizes. The output keeps the channel order
+of the input; callers tell Streamlit or the encoder which order that is
+instead of converting.
+"""
+import cv2
+import numpy as np
+
+import settings
+
+MODES = {
+    'labels': "Boxes and labels",
+    'boxes': "Boxes only",
+    'heat': "Heat map",
+}
+
+
+def _thickness(shape):
+    return max(round(sum(shape[:2]) / 2 * 0.003), 2)
+
+
+class OverlayRenderer:
+    """Draws detections onto frames, reusing its output buffer."""
+
+    def __init__(self, mode='labels', color=settings.BOX_COLOR, channels='BGR',
+                 heat_alpha=settings.OVERLAY_HEAT_ALPHA, heat_decay=settings.OVERLAY_HEAT_DECAY):
+        """
+        Parameters:
+            mode (str): 'labels' (boxes, track IDs and confidences), 'boxes' or 'heat'.
+            color (tuple): BGR box colour.
+            channels (str): Channel order of the frames, 'BGR' or 'RGB'.
+            heat_alpha (float): Opacity of the heat map at its hottest.
+            heat_decay (float): Share of the previous heat kept per frame, so
+                video heat maps show where objects have been recently.
+        """
+        if mode not in MODES:
+            raise ValueError(f"Unknown overlay mode: {mode}")
+        self.mode = mode
+        self.channels = channels
+        self.color = tuple(color) if channels == 'BGR' else tuple(color[::-1])
+        self.heat_alpha = heat_alpha
+        self.heat_decay = heat_decay
+        self._buffer = None
+        self._heat = None
+        self._text_sizes = {}
+
+    def _canvas(self, image, in_place):
+        if in_place:
+            return image
+        if self._buffer is None or self._buffer.shape != image.shape or self._buffer.dtype != image.dtype:
+            self._buffer = np.empty_like(image)
+        np.copyto(self._buffer, image)
+        return self._buffer
+
+    def _text_size(self, label, font_scale, thickness):
+        key = (label, font_scale, thickness)
+        size = self._text_sizes.get(key)
+        if size is None:
+            if len(self._text_sizes) > 4096:
+                self._text_sizes.clear()
+            size = self._text_sizes[key] = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, font_scale,
+                                                           thickness)[0]
+        return size
+
+    def draw(self, image, boxes, conf=None, cls=None, names=None, track_ids=None, in_place=False):
+        """
+        Draws detections onto a frame.
+
+        Parameters:
+            image (numpy array): Frame in the renderer's channel order.
+            boxes (numpy array): (N, 4) xyxy boxes in pixels of `image`.
+            conf (numpy array): Confidence per box (labels mode).
+            cls (numpy array): Class index per box (labels mode).
+            names (dict): Class index -> name (labels mode).
+            track_ids (numpy array): Optional track ID per box.
+            in_place (bool): Draw on `image` itself instead of the reused buffer.
+
+        Returns:
+            The annotated frame. Unless `in_place`, it is overwritten by the
+            next call, so encode or copy it before drawing the next frame.
+        """
+        canvas = self._canvas(image, in_place)
+        if self.mode == 'heat':
+            self._draw_heat(canvas, boxes)
+            return canvas
+        if not len(boxes):
+            return canvas
+        thickness = _thickness(canvas.shape)
+        corners = np.round(boxes).astype(np.int32)
+        outlines = corners[:, [0, 1, 2, 1, 2, 3, 0, 3]].reshape(-1, 4, 2)
+        cv2.polylines(canvas, outlines, True, self.color, thickness, cv2.LINE_AA)
+        if self.mode == 'labels':
+            self._draw_labels(canvas, corners, conf, cls, names or {}, track_ids, thickness)
+        return canvas
+
+    def _draw_labels(self, canvas, corners, conf, cls, names, track_ids, thickness):
+        font_scale = thickness / 3
+        text_thickness = max(thickness - 1, 1)
+        labels = [f"{names.get(int(c), c)} {p:.2f}" for c, p in zip(cls, conf)]
+        if track_ids is not None:
+            labels = [f"id:{t} {label}" for t, label in zip(track_ids, labels)]
+        sizes = np.array([self._text_size(label, font_scale, text_thickness) for label in labels],
+                         dtype=np.int32).reshape(-1, 2)
+        x1, y1 = corners[:, 0], corners[:, 1]
+        # Labels sit above the box, or inside it when the box touches the top edge
+        above = y1 - sizes[:, 1] - 3 >= 0
+        top = np.where(above, y1 - sizes[:, 1] - 3, y1 + sizes[:, 1] + 3)
+        backgrounds = np.stack([x1, y1, x1 + sizes[:, 0], y1, x1 + sizes[:, 0], top, x1, top],
+                               axis=1).reshape(-1, 4, 2)
+        cv2.fillPoly(canvas, backgrounds, self.color)
+        baselines = np.where(above, y1 - 2, y1 + sizes[:, 1] + 2)
+        for label, x, y in zip(labels, x1.tolist(), baselines.tolist()):
+            cv2.putText(canvas, label, (x, y), cv2.FONT_HERSHEY_SIMPLEX, font_scale, (255, 255, 255),
+                        text_thickness, cv2.LINE_AA)
+
+    def _draw_heat(self, canvas, boxes):
+        """Blends a density map of the box centres onto the frame."""
+        height, width = canvas.shape[:2]
+        scale = settings.OVERLAY_HEAT_SCALE
+        grid_h, grid_w = max(1, height // scale), max(1, width // scale)
+        if self._heat is None or self._heat.shape != (grid_h, grid_w):
+            self._heat = np.zeros((grid_h, grid_w), np.float32)
+        self._heat *= self.heat_decay
+        if len(boxes):
+            cx = np.clip(((boxes[:, 0] + boxes[:, 2]) / (2 * scale)).astype(int), 0, grid_w - 1)
+            cy = np.clip(((boxes[:, 1] + boxes[:, 3]) / (2 * scale)).astype(int), 0, grid_h - 1)
+            np.add.at(self._heat, (cy, cx), 1.0)
+            # Spread each centre over roughly the size of a typical box
+            sigma = max(float(np.median(boxes[:, 2:] - boxes[:, :2])) / (2 * scale), 1.0)
+        else:
+            sigma = 1.0
+        density = cv2.GaussianBlur(self._heat, (0, 0), sigma)
+        peak = density.max()
+        if peak <= 0:
+            return
+        # Colour and threshold at grid resolution, then scale both up once
+        density /= peak
+        colored = cv2.applyColorMap((255 * density).astype(np.uint8), cv2.COLORMAP_JET)
+        if self.channels == 'RGB':
+            colored = cv2.cvtColor(colored, cv2.COLOR_BGR2RGB)
+        colored = cv2.resize(colored, (width, height), interpolation=cv2.INTER_LINEAR)
+        mask = cv2.resize((density > 0.05).astype(np.uint8), (width, height), interpolation=cv2.INTER_NEAREST)
+        blended = cv2.addWeighted(canvas, 1 - self.heat_alpha, colored, self.heat_alpha, 0)
+        cv2.copyTo(blended, mask, canvas)
@@ -0,0 +1,73 @@
+"""
+Input resolution policy for video frames.
+
+Frames are resized once, keeping their aspect ratio, so that the long side
+equals the model input size. The model's own letterbox then only pads and
+never resizes a second time. In adaptive mode the input size follows the
+processing time: it steps down when frames take longer than the source frame
+interval and steps back up when there is headroom.
+"""
+import cv2
+
+import settings
+
+
+class ResolutionPolicy:
+    """Picks the model input size and resizes frames to it."""
+
+    def __init__(self, imgsz=settings.VIDEO_IMGSZ, adaptive=False, target_fps=30.0,
+                 min_imgsz=settings.RESOLUTION_MIN_IMGSZ, max_imgsz=settings.RESOLUTION_MAX_IMGSZ,
+                 step=settings.RESOLUTION_STEP):
+        """
+        Parameters:
+            imgsz (int): Input size (long side, multiple of 32); the start size in adaptive mode.
+            adaptive (bool): Follow the processing time instead of keeping `imgsz`.
+            target_fps (float): Frame rate to keep up with, usually the source's.
+            min_imgsz (int): Smallest size adaptive mode goes down to.
+            max_imgsz (int): Largest size adaptive mode goes up to.
+            step (int): Size change per adjustment.
+        """
+        self.imgsz = imgsz
+        self.adaptive = adaptive
+        self.target_fps = target_fps or 30.0
+        self.min_imgsz = min_imgsz
+        self.max_imgsz = max_imgsz
+        self.step = step
+        self.changes = 0
+        self._average = None
+        self._since_change = 0
+
+    def prepare(self, image):
+        """Resizes a frame so its long side is the current input size, keeping the aspect ratio."""
+        height, width = image.shape[:2]
+        scale = self.imgsz / max(height, width)
+        if scale == 1:
+            return image
+        size = (max(1, round(width * scale)), max(1, round(height * scale)))
+        return cv2.resize(image, size, interpolation=cv2.INTER_AREA if scale < 1 else cv2.INTER_LINEAR)
+
+    def update(self, seconds):
+        """
+        Records the processing time of an inferred frame and adapts the input size.
+
+        Returns:
+            True when the input size changed.
+        """
+        if not self.adaptive:
+            return False
+        self._average = seconds if self._average is None else 0.8 * self._average + 0.2 * seconds
+        self._since_change += 1
+        if self._since_change < settings.RESOLUTION_COOLDOWN_FRAMES:
+            return False
+        budget = 1 / self.target_fps
+        if self._average > budget and self.imgsz > self.min_imgsz:
+            self.imgsz = max(self.imgsz - self.step, self.min_imgsz)
+        elif self._average < budget * settings.RESOLUTION_HEADROOM and self.imgsz < self.max_imgsz:
+            self.imgsz = min(self.imgsz + self.step, self.max_imgsz)
+        else:
+            return False
+        # The next measurements belong to the new size
+        self._average = None
+        self._since_change = 0
+        self.changes += 1
+        return True
@@ -0,0 +1,140 @@
+"""
+Content-addressed cache of detection results.
+
+Entries are keyed by the hash of the image bytes, the hash of the model
+weights, the inference size and the confidence floor the model was run at.
+Predictions are stored at that floor, so a higher confidence threshold is a
+cheap filter over cached boxes rather than a new inference.
+"""
+from collections import OrderedDict
+from dataclasses import dataclass
+import hashlib
+from pathlib import Path
+import pickle
+import threading
+
+import numpy as np
+
+
+@dataclass
+class Detections:
+    """Raw predictions for one image."""
+    boxes: np.ndarray  # (N, 4) xyxy in pixels of the original image
+    conf: np.ndarray
+    cls: np.ndarray
+    orig_shape: tuple  # (height, width)
+    names: dict
+    track_ids: np.ndarray = None
+
+    @classmethod
+    def from_result(cls, result):
+        # One device->host transfer: columns are xyxy, [track id], conf, cls
+        data = result.boxes.data.cpu().numpy()
+        return cls(boxes=data[:, :4].copy(),
+                   conf=data[:, -2].copy(),
+                   cls=data[:, -1].astype(int),
+                   orig_shape=tuple(result.orig_shape),
+                   names=dict(result.names),
+                   track_ids=data[:, 4].astype(int) if result.boxes.is_track else None)
+
+    @property
+    def boxesn(self):
+        height, width = self.orig_shape
+        return self.boxes / np.array([width, height, width, height], dtype=self.boxes.dtype)
+
+    @property
+    def nbytes(self):
+        return self.boxes.nbytes + self.conf.nbytes + self.cls.nbytes + \
+            (0 if self.track_ids is None else self.track_ids.nbytes)
+
+    def filter(self, conf):
+        """Returns the detections at or above the confidence threshold."""
+        keep = self.conf >= conf
+        return Detections(self.boxes[keep], self.conf[keep], self.cls[keep], self.orig_shape, self.names,
+                          None if self.track_ids is None else self.track_ids[keep])
+
+
+def detect_batch(model, images, conf, imgsz):
+    """
+    Detections for a list of BGR images in one call.
+
+    Parameters:
+        model: A YOLO model, or an InferenceClient (anything with `detect`).
+        images (list): BGR numpy arrays.
+        conf (float): Confidence threshold.
+        imgsz (int): Inference size.
+    """
+    if hasattr(model, 'detect'):
+        return model.detect(images, conf, imgsz)
+    return [Detections.from_result(result) for result in model.predict(images, conf=conf, imgsz=imgsz, verbose=False)]
+
+
+def digest(data):
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def cache_key(image_digest, weights_digest, imgsz, conf_floor):
+    return f"{image_digest}-{weights_digest[:16]}-{imgsz}-{conf_floor:.2f}"
+
+
+def _nbytes(value):
+    return len(value) if isinstance(value, bytes) else value.nbytes
+
+
+class DetectionCache:
+    """
+    Thread-safe in-memory LRU of Detections and encoded thumbnails.
+
+    When `spill_dir` is set, entries evicted from memory are written there
+    and read back on a later miss instead of being recomputed.
+    """
+
+    def __init__(self, max_bytes, spill_dir=None):
+        self.max_bytes = max_bytes
+        self.spill_dir = Path(spill_dir) if spill_dir else None
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def _spill_path(self, key):
+        return self.spill_dir / f"{key}.pkl"
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+        if self.spill_dir is not None and self._spill_path(key).exists():
+            with open(self._spill_path(key), 'rb') as f:
+                value = pickle.load(f)
+            self.put(key, value)
+            self.hits += 1
+            return value
+        self.misses += 1
+        return None
+
+    def put(self, key, value):
+        evicted = []
+        with self._lock:
+            if key in self._entries:
+                self._size -= _nbytes(self._entries.pop(key))
+            self._entries[key] = value
+            self._size += _nbytes(value)
+            while self._size > self.max_bytes and len(self._entries) > 1:
+                old_key, old_value = self._entries.popitem(last=False)
+                self._size -= _nbytes(old_value)
+                evicted.append((old_key, old_value))
+        if self.spill_dir is not None:
+            self.spill_dir.mkdir(parents=True, exist_ok=True)
+            for old_key, old_value in evicted:
+                with open(self._spill_path(old_key), 'wb') as f:
+                    pickle.dump(old_value, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'bytes': self._size,
+                    'hits': self.hits, 'misses': self.misses}
@@ -0,0 +1,174 @@
+"""
+Region-of-interest inference for fixed cameras.
+
+A source's ROI is a list of polygons in normalized frame coordinates. Only
+the bounding rectangles of the polygons are cropped and sent through the
+model (batched, at the same pixel scale a full frame would get), boxes are
+shifted back to frame coordinates, and boxes whose centre falls outside every
+polygon are dropped. Sky, banks and burnt-in overlays never reach the model.
+"""
+from dataclasses import dataclass, field
+import math
+
+import cv2
+import numpy as np
+
+import settings
+from result_cache import Detections, detect_batch
+
+
+def parse_polygons(text):
+    """
+    Parses one polygon per line, written as normalized `x,y` points separated by spaces.
+
+    Example: "0,0.4 1,0.4 1,1 0,1" is the lower 60% of the frame. Blank lines
+    are skipped.
+
+    Raises:
+        ValueError: A point is not two numbers between 0 and 1, or a polygon
+            has fewer than 3 points.
+    """
+    polygons = []
+    for number, line in enumerate(text.splitlines(), 1):
+        if not line.strip():
+            continue
+        points = [tuple(float(v) for v in point.split(',')) for point in line.split()]
+        for point in points:
+            if len(point) != 2 or not all(0 <= v <= 1 for v in point):
+                raise ValueError(f"line {number}: {','.join(f'{v:g}' for v in point)} is not an x,y point in 0..1")
+        if len(points) < 3:
+            raise ValueError(f"line {number}: a polygon needs at least 3 points")
+        polygons.append(points)
+    return polygons
+
+
+def format_polygons(polygons):
+    return '\n'.join(' '.join(f"{x:g},{y:g}" for x, y in polygon) for polygon in polygons)
+
+
+def _merge_rects(rects):
+    """Merges overlapping (x0, y0, x1, y1) rectangles until none overlap, so no area is inferred twice."""
+    rects = [list(r) for r in rects]
+    merged = True
+    while merged:
+        merged = False
+        for i in range(len(rects)):
+            for j in range(i + 1, len(rects)):
+                a, b = rects[i], rects[j]
+                if a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]:
+                    rects[i] = [min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3])]
+                    del rects[j]
+                    merged = True
+                    break
+            if merged:
+                break
+    return [tuple(r) for r in rects]
+
+
+@dataclass
+class RoiConfig:
+    """ROI polygons of one source plus counters of the pixels actually inferred."""
+    polygons: list  # [[(x, y), ...], ...] normalized to 0..1
+    frames: int = 0
+    roi_pixels: int = 0
+    frame_pixels: int = 0
+    _geometry: dict = field(default_factory=dict, repr=False)
+
+    def geometry(self, width, height):
+        """(crop rectangles in pixels, polygon mask) for a frame size, computed once per size."""
+        key = (width, height)
+        if key not in self._geometry:
+            mask = np.zeros((height, width), np.uint8)
+            rects = []
+            for polygon in self.polygons:
+                points = np.round(np.array(polygon) * [width, height]).astype(np.int32)
+                cv2.fillPoly(mask, [points], 255)
+                x, y, w, h = cv2.boundingRect(points)
+                x0, y0 = max(x, 0), max(y, 0)
+                x1, y1 = min(x + w, width), min(y + h, height)
+                if x1 > x0 and y1 > y0:
+                    rects.append((x0, y0, x1, y1))
+            self._geometry[key] = (_merge_rects(rects), mask)
+        return self._geometry[key]
+
+    @property
+    def pixel_ratio(self):
+        """Share of frame pixels that were inferred."""
+        return self.roi_pixels / self.frame_pixels if self.frame_pixels else 1.0
+
+    def outline(self, image, color=(0, 255, 255)):
+        """Draws the ROI polygons onto a BGR frame in place."""
+        height, width = image.shape[:2]
+        for polygon in self.polygons:
+            points = np.round(np.array(polygon) * [width, height]).astype(np.int32)
+            cv2.polylines(image, [points], True, color, 1, cv2.LINE_AA)
+        return image
+
+
+def _crop_imgsz(rects, frame_shape, imgsz):
+    """Inference size that keeps the crops at the scale the full frame would be inferred at."""
+    scale = imgsz / max(frame_shape[:2])
+    longest = max(max(x1 - x0, y1 - y0) for x0, y0, x1, y1 in rects)
+    return max(32, math.ceil(longest * scale / 32) * 32)
+
+
+def _inside(boxes, mask):
+    """True for boxes whose centre lies inside the ROI mask."""
+    height, width = mask.shape
+    cx = np.clip(((boxes[:, 0] + boxes[:, 2]) / 2).astype(int), 0, width - 1)
+    cy = np.clip(((boxes[:, 1] + boxes[:, 3]) / 2).astype(int), 0, height - 1)
+    return mask[cy, cx] > 0
+
+
+def roi_predict(model, image, conf, roi, imgsz=settings.IMAGE_IMGSZ, tracker=None):
+    """
+    Detects objects inside the ROI of a frame.
+
+    Without tracking every ROI rectangle is a crop and all crops go through
+    the model in one batch. With a tracker the frame is cropped once to the
+    rectangle around all ROIs, which stays fixed for the source, so the
+    tracker sees a consistent view from frame to frame.
+
+    Parameters:
+        model: A YOLO model, or an InferenceClient when not tracking.
+        image (numpy array): BGR frame.
+        conf (float): Confidence threshold.
+        roi (RoiConfig): Polygons of the source; its pixel counters are updated.
+        imgsz (int): Inference size a full frame would use.
+        tracker (str): Tracker config to track with, e.g. 'bytetrack.yaml'.
+
+    Returns:
+        Detections in frame coordinates (with track IDs when tracking).
+    """
+    height, width = image.shape[:2]
+    rects, mask = roi.geometry(width, height)
+    if tracker and rects:
+        rects = [(min(r[0] for r in rects), min(r[1] for r in rects),
+                  max(r[2] for r in rects), max(r[3] for r in rects))]
+    roi.frames += 1
+    roi.frame_pixels += width * height
+    roi.roi_pixels += sum((x1 - x0) * (y1 - y0) for x0, y0, x1, y1 in rects)
+    if not rects:
+        return Detections(np.zeros((0, 4), np.float32), np.zeros(0, np.float32), np.zeros(0, int),
+                          (height, width), dict(model.names))
+
+    crops = [np.ascontiguousarray(image[y0:y1, x0:x1]) for x0, y0, x1, y1 in rects]
+    crop_imgsz = _crop_imgsz(rects, image.shape, imgsz)
+    if tracker:
+        result = model.track(crops[0], conf=conf, imgsz=crop_imgsz, persist=True, tracker=tracker, verbose=False)
+        found = [Detections.from_result(result[0])]
+    else:
+        found = detect_batch(model, crops, conf, crop_imgsz)
+
+    boxes, scores, classes, track_ids = [], [], [], []
+    for (x0, y0, _, _), detections in zip(rects, found):
+        boxes.append(detections.boxes + np.array([x0, y0, x0, y0], dtype=detections.boxes.dtype))
+        scores.append(detections.conf)
+        classes.append(detections.cls)
+        if detections.track_ids is not None:
+            track_ids.append(detections.track_ids)
+    boxes = np.concatenate(boxes)
+    keep = _inside(boxes, mask)
+    return Detections(boxes[keep], np.concatenate(scores)[keep], np.concatenate(classes)[keep],
+                      (height, width), dict(found[0].names),
+                      np.concatenate(track_ids)[keep] if track_ids else None)
@@ -20,13 +20,41 @@ VIDEO = 'Video'
 WEBCAM = 'Webcam'
 RTSP = 'RTSP'
 YOUTUBE = 'YouTube'
+MULTI_STREAM = 'Multi-camera'
 
-SOURCES_LIST = [IMAGE, VIDEO,]
+SOURCES_LIST = [IMAGE, VIDEO, MULTI_STREAM]
 
 # Images config
 IMAGES_DIR = ROOT / 'images/sample_images'
 DEFAULT_IMAGE = 'images/DJI_0255.jpg'
 DEFAULT_DETECT_IMAGE = 'images/DJI_0023_detected.jpg'
+IMAGE_BATCH_SIZE = 8  # uploads per predict call
+DECODE_WORKERS = 4  # threads decoding uploads
+IMAGE_IMGSZ = 640  # inference size for uploaded images
+THUMBNAIL_MAX_SIDE = 1280
+THUMBNAIL_JPEG_QUALITY = 85
+FULL_RESOLUTION_JPEG_QUALITY = 95
+GALLERY_MAX_BYTES = 64 * 1024 ** 2  # encoded previews kept per session, least recently shown evicted first
+BOX_COLOR = (4, 42, 255)  # BGR
+OVERLAY_HEAT_ALPHA = 0.5  # heat map opacity at its hottest
+OVERLAY_HEAT_DECAY = 0.8  # share of the previous frames' heat kept in video heat maps
+OVERLAY_HEAT_SCALE = 8  # heat map cells are this many pixels wide
+
+# Tiled inference
+TILE_SIZE = 640
+TILE_OVERLAP = 0.2
+TILE_MAX_BATCH_BYTES = 64 * 1024 ** 2  # tile pixels sent to the model per predict call
+TILE_MAX_IMAGE_PIXELS = 64_000_000  # larger frames are downscaled (after decoding) before tiling
+
+# Detection result cache
+RESULT_CACHE_MAX_BYTES = 256 * 1024 ** 2
+RESULT_CACHE_SPILL_DIR = None  # e.g. ROOT / '.cache' / 'detections' to keep evicted results on disk
+RESULT_CACHE_CONF_FLOOR = 0.20  # lowest confidence the sidebar slider allows
+
+# Detection store
+DETECTION_STORE_DIR = ROOT / 'runs' / 'detections'  # one Parquet file per run of a video source
+STORE_ROW_GROUP_ROWS = 50_000  # boxes buffered in memory before a row group is written
+STORE_READ_BATCH_ROWS = 65_536  # rows per batch when exporting
 
 # Videos config
 VIDEO_DIR = ROOT / 'data/sample_videos'
@@ -40,5 +68,108 @@ MODEL_DIR = ROOT / 'models'
 DETECTION_MODEL = MODEL_DIR / 'vision_giant.pt'
 SEGMENTATION_MODEL = MODEL_DIR / 'yolov8n-seg.pt'
 
+# Model cache
+DEVICE = None  # e.g. 'cpu' or 'cuda:0', None lets ultralytics pick
+MODEL_CACHE_MAX_BYTES = 2 * 1024 ** 3  # evict least recently used models above this
+MODEL_WARMUP_IMGSZ = 640
+
+# Inference backend
+BACKEND_TORCH = 'torch'
+BACKEND_ONNX = 'onnx'  # ONNX Runtime
+BACKEND_OPENVINO = 'openvino'  # OpenVINO IR
+MODEL_BACKEND = BACKEND_TORCH
+EXPORT_DIR = MODEL_DIR / 'exported'  # exports are keyed by weights hash and input size
+MODEL_EXPORT_IMGSZ = 640
+BACKEND_PARITY_CHECK = True  # compare exported boxes with PyTorch after exporting
+BACKEND_PARITY_IOU = 0.9  # matched boxes must overlap at least this much
+BACKEND_PARITY_CONF = 0.05  # and differ in confidence by at most this much
+
+# INT8 quantization (OpenVINO)
+PRECISION_FP32 = 'FP32'
+PRECISION_INT8 = 'INT8'
+INT8_CALIBRATION_DIR = IMAGES_DIR  # any folder of representative site images
+INT8_CALIBRATION_IMAGES = 300  # at most this many calibration images are used
+
+# Shared inference server (python -m inference_server)
+INFERENCE_SERVER_ADDRESS = None  # e.g. '/tmp/plastic-detection.sock' or 'localhost:8765'; None runs the model in-app
+# The server unpickles what clients send, so the shared secret must not be a
+# checked-in constant: it is read from this environment variable, or else from
+# the file below (e.g. `python -c "import secrets; print(secrets.token_hex(32))"`)
+INFERENCE_SERVER_AUTHKEY_ENV = 'PLASTIC_DETECTION_AUTHKEY'
+INFERENCE_SERVER_AUTHKEY_FILE = None  # e.g. Path.home() / '.plastic-detection-authkey'
+INFERENCE_SERVER_ALLOW_REMOTE = False  # TCP addresses other than loopback are refused unless True
+SERVER_MAX_BATCH = 16  # most images per predict call
+SERVER_MAX_LATENCY_MS = 10  # longest an image waits for its batch to fill
+SERVER_REQUEST_TIMEOUT = 60  # seconds
+
+# Video pipeline
+PIPELINE_QUEUE_SIZE = 4
+DROP_BLOCK = 'block'  # wait for the next stage, every frame is processed
+DROP_LATEST = 'latest'  # discard the oldest queued frame, live sources stay current
+LIVE_DROP_POLICY = DROP_LATEST
+
+# Regions of interest: source (VIDEOS_DICT key, 'webcam', or stream url) -> polygons of
+# normalized (x, y) points. Only these areas are sent through the model, e.g.
+# {'video_1': [[(0, 0.4), (1, 0.4), (1, 1), (0, 1)]]} skips the top 40% of the frame.
+ROI_POLYGONS = {}
+
+# Live capture
+CAPTURE_BACKOFF_INITIAL = 0.5  # seconds before the first reconnect, doubled after every failure
+CAPTURE_BACKOFF_MAX = 30.0
+CAPTURE_MAX_RECONNECTS = None  # failed attempts in a row before giving up, None retries forever
+
+# Multi-camera dashboard
+MULTI_STREAM_MAX_BATCH = 8  # frames from different cameras per inference call
+MULTI_STREAM_COLUMNS = 3  # grid columns
+MULTI_STREAM_VIEW_FPS = 5  # grid refreshes per second per camera
+STREAM_STALL_SECONDS = 5  # a camera without frames for this long is shown as stalled
+
+# Video input resolution
+VIDEO_IMGSZ = 640  # long side frames are resized to before inference
+RESOLUTION_MIN_IMGSZ = 320  # adaptive mode stays within these sizes
+RESOLUTION_MAX_IMGSZ = 960
+RESOLUTION_STEP = 64
+RESOLUTION_COOLDOWN_FRAMES = 15  # inferred frames between two size changes
+RESOLUTION_HEADROOM = 0.6  # step up when frames take less than this share of the frame interval
+
+# Video preview
+VIEWER_MAX_FPS = 10  # browser refreshes per second, independent of the inference rate
+VIEWER_MAX_WIDTH = 960
+VIEWER_QUALITY = 80
+VIEWER_ENCODING = 'jpeg'  # or 'webp'
+
+# Stage timings and profiling
+PROFILE_WINDOW = 300  # frames in the rolling window of the sidebar panel
+PROFILE_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)  # seconds
+METRICS_PORT = None  # e.g. 9108 serves Prometheus metrics on http://127.0.0.1:9108/metrics
+METRICS_HOST = '127.0.0.1'
+PROFILE_DIR = ROOT / 'runs' / 'profiles'
+STARTUP_IMPORT_BUDGET_MS = 2500  # benchmarks/bench_startup.py fails above this
+
+# Annotated video export
+VIDEO_EXPORT_DIR = ROOT / 'runs' / 'exports'
+# Frames waiting for the encoder, by size rather than count: one queued 4K frame
+# and its resized copy take about 30 MB. More are dropped rather than stalling inference
+EXPORT_QUEUE_BYTES = 512 * 1024 ** 2
+EXPORT_BITRATE = '4M'  # used with ffmpeg
+EXPORT_FOURCC = 'mp4v'  # cv2.VideoWriter codec when ffmpeg is not installed
+EXPORT_SEGMENT_PADDING = 15  # frames kept before and after detections in segments-only exports
+
+# Keyframe inference
+KEYFRAME_INTERVAL = 5  # default N for "every N frames"
+KEYFRAME_MOTION_THRESHOLD = 0.04  # mean absolute pixel change (0..1) that triggers a detection
+
+# Offline video sharding
+SHARD_OVERLAP_FRAMES = 30  # frames tracked by both neighbouring segments to stitch track IDs
+
+# Survey de-duplication (python -m survey_dedup, batch_detect --dedup)
+DEDUP_IOU = 0.3  # projected boxes of one object overlap at least this much across frames
+DEDUP_CELL_SCALE = 2.0  # spatial index cells are this many median box sizes wide
+DEDUP_FEATURE_MAX_SIDE = 1024  # frames are registered at this size
+DEDUP_MOTION = 'similarity'  # nadir frames; 'homography' for oblique footage
+DEDUP_ORB_FEATURES = 3000
+DEDUP_MIN_INLIERS = 25  # fewer RANSAC inliers starts a new chain instead of registering the frame
+DEDUP_VIDEO_REGISTER_EVERY = 5  # video frames between registrations when no detection forces one
+
 # Webcam
 WEBCAM_PATH = 0
@@ -0,0 +1,179 @@
+"""
+Per-stage timings of the detection loop.
+
+Every processed frame records how long each stage took (decode, resize,
+preprocess, inference, postprocess, plot and UI push) into a StageProfiler of
+its own run, whose rolling window feeds that session's sidebar panel, and
+through it into the process-wide `profiler`, whose cumulative histogram
+buckets are what Prometheus scrapes.
+`serve_metrics` exposes the histograms on a local HTTP endpoint, and
+ProfileCapture runs cProfile over a given number of frames and writes the
+stats to a file (open with `python -m pstats` or snakeviz).
+"""
+from bisect import bisect_left
+from collections import deque
+import cProfile
+import threading
+
+import numpy as np
+
+import settings
+
+STAGES = ('decode', 'resize', 'preprocess', 'inference', 'postprocess', 'plot', 'ui_push')
+
+
+class StageHistogram:
+    """Timings of one stage: a rolling window plus cumulative Prometheus buckets."""
+
+    def __init__(self, window=settings.PROFILE_WINDOW, buckets=settings.PROFILE_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # last one is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.recent = deque(maxlen=window)
+
+    def observe(self, seconds):
+        self.counts[bisect_left(self.buckets, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        self.recent.append(seconds)
+
+    def summary(self):
+        """p50/p95/max in ms over the rolling window."""
+        if not self.recent:
+            return {'frames': self.count, 'p50_ms': 0.0, 'p95_ms': 0.0, 'max_ms': 0.0}
+        p50, p95 = np.percentile(self.recent, [50, 95]).tolist()
+        return {'frames': self.count, 'p50_ms': 1000 * p50, 'p95_ms': 1000 * p95,
+                'max_ms': 1000 * max(self.recent)}
+
+
+class StageProfiler:
+    """Thread-safe set of StageHistograms, one per stage name."""
+
+    def __init__(self, parent=None):
+        """
+        Parameters:
+            parent (StageProfiler): Also receives every observation, e.g. the
+                process-wide `profiler` for a single run's profiler.
+        """
+        self.parent = parent
+        self._stages = {}
+        self._lock = threading.Lock()
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            histogram = self._stages.get(stage)
+            if histogram is None:
+                histogram = self._stages[stage] = StageHistogram()
+            histogram.observe(seconds)
+        if self.parent is not None:
+            self.parent.observe(stage, seconds)
+
+    def observe_speed(self, speed):
+        """Records a FrameResult's per-stage timings, given in ms as in ultralytics' `Results.speed`."""
+        for stage, ms in speed.items():
+            if ms is not None:
+                self.observe(stage, ms / 1000)
+
+    def _ordered(self):
+        return sorted(self._stages.items(),
+                      key=lambda item: STAGES.index(item[0]) if item[0] in STAGES else len(STAGES))
+
+    def summary(self):
+        """One row per stage, in loop order, for the sidebar panel."""
+        with self._lock:
+            return [{'stage': stage, **histogram.summary()} for stage, histogram in self._ordered()]
+
+    def prometheus(self):
+        """The histograms in the Prometheus text exposition format."""
+        name = 'detection_stage_seconds'
+        lines = [f"# HELP {name} Time spent on one frame in each stage of the detection loop.",
+                 f"# TYPE {name} histogram"]
+        with self._lock:
+            for stage, histogram in self._ordered():
+                cumulative = 0
+                for bound, count in zip(histogram.buckets + (float('inf'),), histogram.counts):
+                    cumulative += count
+                    le = '+Inf' if bound == float('inf') else repr(bound)
+                    lines.append(f'{name}_bucket{{stage="{stage}",le="{le}"}} {cumulative}')
+                lines.append(f'{name}_sum{{stage="{stage}"}} {histogram.sum!r}')
+                lines.append(f'{name}_count{{stage="{stage}"}} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+
+# Process-wide, like the model registry: shared by all sessions and scraped by /metrics
+profiler = StageProfiler()
+
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def serve_metrics(port=settings.METRICS_PORT, host=settings.METRICS_HOST):
+    """
+    Starts the /metrics endpoint in a daemon thread, once per process.
+
+    Returns:
+        The running ThreadingHTTPServer.
+    """
+    # http.server pulls in the email package; only imported when the endpoint is enabled
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] != '/metrics':
+                self.send_error(404)
+                return
+            body = profiler.prometheus().encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    global _server
+    with _server_lock:
+        if _server is None:
+            _server = ThreadingHTTPServer((host, port), MetricsHandler)
+            threading.Thread(target=_server.serve_forever, name='metrics-endpoint', daemon=True).start()
+    return _server
+
+
+class ProfileCapture:
+    """
+    Runs cProfile around the next `frames` calls of `run` and writes the stats to `path`.
+
+    Only the calling thread is profiled. For the whole process, including
+    the decode and render threads, attach py-spy to the app's pid instead;
+    the pipeline threads are named after their stage.
+    """
+
+    def __init__(self, frames, path):
+        self.limit = frames
+        self.path = path
+        self.frames = 0
+        self.done = False
+        self._profile = cProfile.Profile()
+
+    def run(self, func, *args):
+        if self.done or self.frames >= self.limit:
+            return func(*args)
+        self._profile.enable()
+        try:
+            return func(*args)
+        finally:
+            self._profile.disable()
+            self.frames += 1
+            if self.frames == self.limit:
+                self.finish()
+
+    def finish(self):
+        """Writes the stats now, e.g. when the source ended before `frames` were profiled."""
+        if self.done or not self.frames:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._profile.dump_stats(str(self.path))
+        self.done = True
@@ -1,17 +1,16 @@
 # Python In-built packages
 from pathlib import Path
-import PIL
-import cv2
 
 # External packages
 import streamlit as st
 
 # Local Modules
+# Mode-specific dependencies (ultralytics, pandas, pyarrow, pytube) are
+# imported inside the branch or helper function that needs them, so a cold
+# start only pays for the mode that is opened; see benchmarks/bench_startup.py
 import settings
 import helper
-import pandas as pd
-from pdf2image import convert_from_path
-import io
+import stage_metrics
 
 # Setting page layout
 st.set_page_config(
@@ -35,6 +34,7 @@ st.sidebar.header("Features and configurations")
 
 # if model_type=="View-training-Data-profiling-Report":
 #     # Convert the PDF to images
+#     from pdf2image import convert_from_path
 #     images = convert_from_path(pdf_path)
     
 #     # Display each page as an image
@@ -46,18 +46,56 @@ st.sidebar.header("Features and configurations")
 # elif model_type == 'Segmentation':
 #     model_path = Path(settings.SEGMENTATION_MODEL)
 
-# Load Pre-trained ML Model
-try:
-    model_path = Path(settings.DETECTION_MODEL)
-    model = helper.load_model(model_path)
-except Exception as ex:
-    st.error(f"Unable to load model. Check the specified path: {model_path}")
-    st.error(ex)
-
 #st.sidebar.header("Image/Video Config")"Select Source"
 source_radio = st.sidebar.radio(
     "select media type", settings.SOURCES_LIST)
 
+confidence = float(st.sidebar.slider(
+    "Select Model Confidence", 20, 100, 35)) / 100
+if settings.INFERENCE_SERVER_ADDRESS:
+    # The model lives in the shared inference server process
+    try:
+        model = helper.connect_inference_server()
+    except Exception as ex:
+        st.error(f"Unable to reach the inference server at {settings.INFERENCE_SERVER_ADDRESS}")
+        st.error(ex)
+
+    with st.sidebar.expander("Inference server"):
+        try:
+            server_stats = model.stats()
+            st.caption(f"queue depth {server_stats['queue_depth']}, {server_stats['clients']} clients, "
+                       f"{server_stats['images']} images in {server_stats['batches']} batches "
+                       f"(mean size {server_stats['mean_batch_size']:.1f}), "
+                       f"wait {server_stats['mean_wait_ms']:.1f} ms, "
+                       f"inference {server_stats['mean_infer_ms']:.1f} ms per batch")
+        except Exception as ex:
+            st.caption(f"No stats: {ex}")
+else:
+    precision = helper.display_precision_options()
+
+    # Load Pre-trained ML Model
+    try:
+        model_path = Path(settings.DETECTION_MODEL)
+        model = helper.load_model(model_path, int8=precision == settings.PRECISION_INT8)
+    except Exception as ex:
+        st.error(f"Unable to load model. Check the specified path: {model_path}")
+        st.error(ex)
+
+    with st.sidebar.expander("Model cache"):
+        for entry in helper.model_cache_stats():
+            st.caption(f"{Path(entry['path']).name} ({entry['backend']}, {entry['device'] or 'auto'}): "
+                       f"load {entry['load_s']:.2f}s, warm-up {entry['warmup_s']:.2f}s, "
+                       f"{entry['nbytes'] / 1024 ** 2:.0f} MB, {entry['hits']} reuses")
+            if entry['parity'] is not None and not entry['parity']['passed']:
+                st.warning(f"{Path(entry['path']).name} does not match the PyTorch model: {entry['parity']}")
+
+if settings.METRICS_PORT:
+    # Once per process; later reruns reuse the running endpoint
+    try:
+        stage_metrics.serve_metrics(settings.METRICS_PORT)
+    except OSError as ex:
+        st.sidebar.warning(f"Metrics endpoint not started on port {settings.METRICS_PORT}: {ex}")
+
 # Create a list to store uploaded images
 
 
@@ -65,18 +103,16 @@ source_radio = st.sidebar.radio(
 source_img = None
 # If image is selected
 if source_radio == settings.IMAGE:
-    confidence = float(st.sidebar.slider(
-    "Select Model Confidence", 20, 100, 35)) / 100
     source_img = st.sidebar.file_uploader(
         "Choose an image...", type=("jpg", "jpeg", "png", 'bmp', 'webp'), accept_multiple_files=True)
+    tiling = helper.display_tiling_options()
+    overlay_mode = helper.display_overlay_options()
     
     try:
             col1, col2 = st.columns(2)
             if not source_img:
                 default_image_path = str(settings.DEFAULT_IMAGE)
-                default_image = PIL.Image.open(default_image_path)
                 default_detected_image_path = str(settings.DEFAULT_DETECT_IMAGE)
-                default_detected_image = PIL.Image.open(default_detected_image_path)
                 with col1: 
                     st.image(default_image_path, caption="Default Image",
                          use_column_width=True)
@@ -84,78 +120,55 @@ if source_radio == settings.IMAGE:
                     st.image(default_detected_image_path, caption='Detected Image',
                      use_column_width=True)
             else:
-    
-                # Create a button to change images
-                change_button = st.sidebar.button("Next Image")
-                
-
-                #col1, col2 = st.columns(2)
-
-                num_images = len(source_img)
-
-                # Initialize an index to keep track of the current image
-                image_index = 0
-                uploaded_images=[]
-                detected_images = []
-                cls=[]
-                conf=[]
-                x=[]
-                y=[]
-                w=[]
-                h=[]
-                file_name=[]
-                img_name_up=[]
-                for uploaded_image in source_img:
-                    uploaded_image = PIL.Image.open(uploaded_image)
-                    uploaded_images.append(uploaded_image)
-                # Function to run YOLOv5 inference and display the results
-                for source_image in source_img:
-                    uploaded_image = PIL.Image.open(source_image)
-                    img_name_up.append(source_image.name)
-                    res = model.predict(uploaded_image,conf=confidence)
-                    res_plotted = res[0].plot()[:, :, ::-1]
-                    detected_images.append(res_plotted)
-                    boxes = res[0].boxes
-                    for box in boxes:
-                        cls.append("Plastic")
-                        file_name.append(source_image.name)
-                        conf.append(round(box.conf.tolist()[0],3))
-                        box_co=box.xyxyn.tolist()[0]
-                        x.append(box_co[0])
-                        y.append(box_co[1])
-                        w.append(box_co[2])
-                        h.append(box_co[3])
-                df=pd.DataFrame({'File_name':file_name,"X": x,"Y": y,"Width":w,"Height":h,"class":cls,"confidence":conf})
-                # Display the original and detected images
-                def display_images(original_image_path, detected_image_path,image_name):
-                    with col1:
-                        st.image(original_image_path, caption=f"Original Image:{image_name}", use_column_width=True)
-                    
-                    with col2:
-                        st.image(detected_image_path, caption=f"Detected Image:{image_name}", use_column_width=True)
-                        with st.expander("Detection Results"):
-                            st.dataframe(df)   
-                            csv_file = df.to_csv(index=False)
-                            st.download_button(
-                                label="Download",
-                                data=csv_file,
-                                file_name="data.csv",
-                                key="download-csv"
-                            )
-                # Display the initial images
-                # original_image_path = uploaded_images[image_index]
-                # detected_image_path = detected_images[image_index]
-                # display_images(original_image_path, detected_image_path)
-                # When the button is clicked, increment the index to change images
-                if change_button:
-                    image_index += 1
-                    if image_index >= num_images:
-                        image_index = 0  # Start over if we've reached the end of the list
-                        # Get paths for the new images and update the display
-                original_image_path = uploaded_images[image_index]
-                detected_image_path = detected_images[image_index]
-                image_name=img_name_up[image_index]
-                display_images(original_image_path, detected_image_path,image_name)
+                # Pulls in pandas; only needed once images are uploaded
+                import detection_table
+
+                progress_bar = st.empty()
+
+                def show_progress(done, total):
+                    progress_bar.progress(done / total, text=f"Detecting objects... {done}/{total}")
+
+                # Only images that are not in the result cache go through the model
+                results = helper.detect_uploads_cached(model, source_img, confidence, progress=show_progress,
+                                                       tiling=tiling)
+                progress_bar.empty()
+                img_name_up = [source_image.name for source_image, _, _ in results]
+                # One vectorized pass over all boxes instead of per-box list appends
+                columns = detection_table.build_columns([detections for _, _, detections in results], img_name_up)
+                df = detection_table.to_dataframe(
+                    columns, ['File_name', 'X1', 'Y1', 'X2', 'Y2', 'Width', 'Height', 'class', 'confidence'])
+                # Serialize the download once per set of results, not on every rerun
+                csv_key = (tuple(cache_key for _, cache_key, _ in results), confidence)
+                if st.session_state.get('csv_key') != csv_key:
+                    st.session_state['csv_key'] = csv_key
+                    st.session_state['csv_data'] = detection_table.to_csv(df)
+
+                # Only the page shown is decoded, into JPEG previews kept in the
+                # session's size-capped gallery
+                image_index = helper.display_gallery_pager(len(results), csv_key[0])
+                source_image, cache_key, detections = results[image_index]
+                image_name = img_name_up[image_index]
+                with col1:
+                    st.image(helper.annotated_thumbnail(source_image, cache_key, None, confidence),
+                             caption=f"Original Image:{image_name}", use_column_width=True)
+                with col2:
+                    st.image(helper.annotated_thumbnail(source_image, cache_key, detections, confidence,
+                                                        overlay_mode),
+                             caption=f"Detected Image:{image_name}", use_column_width=True)
+                    if st.checkbox("Full resolution", help="Renders this image at full size from its cached boxes"):
+                        st.download_button("Download annotated image",
+                                           helper.annotated_full_resolution(source_image, cache_key, detections,
+                                                                            confidence, overlay_mode),
+                                           file_name=f"{Path(image_name).stem}_detected.jpg", mime="image/jpeg")
+                    with st.expander("Detection Results"):
+                        st.dataframe(df)
+                        st.download_button(
+                            label="Download",
+                            data=st.session_state['csv_data'],
+                            file_name="data.csv",
+                            key="download-csv"
+                        )
+                    helper.display_unique_objects(results, csv_key)
     except Exception as ex:
             st.error("Error occurred while opening the image.")
             st.error(ex)
@@ -166,23 +179,18 @@ if source_radio == settings.IMAGE:
     
 
 elif source_radio == settings.VIDEO:
-    confidence = float(st.sidebar.slider(
-    "Select Model Confidence", 20, 100, 35)) / 100
     helper.play_stored_video(confidence, model)
 
 elif source_radio == settings.WEBCAM:
-    confidence = float(st.sidebar.slider(
-    "Select Model Confidence", 20, 100, 35)) / 100
     helper.play_webcam(confidence, model)
 
 elif source_radio == settings.RTSP:
-    confidence = float(st.sidebar.slider(
-    "Select Model Confidence", 20, 100, 35)) / 100
     helper.play_rtsp_stream(confidence, model)
 
+elif source_radio == settings.MULTI_STREAM:
+    helper.play_multi_stream(confidence, model)
+
 elif source_radio == settings.YOUTUBE:
-    confidence = float(st.sidebar.slider(
-    "Select Model Confidence", 20, 100, 35)) / 100
     helper.play_youtube_video(confidence, model)
 
 else:
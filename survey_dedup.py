@@ -0,0 +1,593 @@
+"""
+Unique objects across the overlapping frames of a survey.
+
+Drone surveys photograph the same litter in many overlapping frames, so raw
+detection counts overcount it. Every frame is placed on a common survey plane:
+
+    gps       DJI geotags (GPS position, height above the take-off point,
+              gimbal yaw and 35 mm focal length) place nadir images in metres
+              east and south of the first image
+    features  ORB matches between consecutive frames give the motion to the
+              previous frame, chained back to the first frame of the chain;
+              a frame that cannot be matched starts a new chain
+
+Boxes are projected onto the plane and merged with the objects already seen
+there. Objects are kept in a grid-hash spatial index, so a box is only compared
+with the objects in the cells it covers. A whole survey is merged in about
+linear time instead of comparing every detection with every other. Boxes are
+matched one-to-one per frame (backends.match_boxes), so two detections in the
+same frame never become one object.
+
+    python -m survey_dedup images/survey_2024 --detections runs/nightly/detections.csv
+
+Nadir frames only rotate, scale and shift between neighbours, so by default
+the motion is estimated as a similarity. Its four degrees of freedom drift far
+less over long chains than a full homography, which is kept for oblique
+footage (motion='homography'). Objects are only merged within one chain. GPS
+placement does not drift, but assumes the camera points straight down over
+flat ground.
+"""
+import argparse
+from collections import Counter, defaultdict
+from dataclasses import dataclass
+import io
+import math
+from pathlib import Path
+import re
+import time
+
+import cv2
+import numpy as np
+import PIL.Image
+
+import settings
+from backends import match_boxes
+
+METHODS = ('auto', 'gps', 'features')
+MOTIONS = ('similarity', 'homography')
+GPS_SEGMENT = 'gps'
+EARTH_RADIUS = 6378137.0  # metres, WGS 84 equator
+XMP_SEARCH_BYTES = 256 * 1024  # DJI writes its XMP packet near the start of the file
+LOWE_RATIO = 0.75
+
+_GPS_IFD = 0x8825
+_EXIF_IFD = 0x8769
+_FOCAL_LENGTH_35MM = 0xA405
+_DJI_XMP = re.compile(rb'drone-dji:(\w+)="([^"]*)"')
+
+
+@dataclass
+class Geotag:
+    """Where a nadir drone image was taken from."""
+    latitude: float
+    longitude: float
+    altitude: float  # metres above the take-off point
+    yaw: float  # degrees clockwise from north the top of the image faces
+    focal_35mm: float
+    width: int
+    height: int
+
+    @property
+    def ground_sample_distance(self):
+        """Metres per pixel, for a camera pointing straight down."""
+        return self.altitude * 36 / (self.focal_35mm * self.width)
+
+    def offset(self, origin):
+        """Metres (east, south) of this position from `origin`'s."""
+        east = EARTH_RADIUS * math.radians(self.longitude - origin.longitude) * math.cos(
+            math.radians(origin.latitude))
+        south = -EARTH_RADIUS * math.radians(self.latitude - origin.latitude)
+        return east, south
+
+    def transform(self, origin):
+        """Homography from image pixels to metres east (x) and south (y) of `origin`'s position."""
+        gsd = self.ground_sample_distance
+        cos, sin = math.cos(math.radians(self.yaw)), math.sin(math.radians(self.yaw))
+        east, south = self.offset(origin)
+        to_centre = np.array([[1, 0, -self.width / 2], [0, 1, -self.height / 2], [0, 0, 1]])
+        return np.array([[gsd * cos, -gsd * sin, east], [gsd * sin, gsd * cos, south], [0, 0, 1]]) @ to_centre
+
+    def position(self, east, south):
+        """(latitude, longitude) of a point given in metres from this geotag's position."""
+        latitude = self.latitude - math.degrees(south / EARTH_RADIUS)
+        longitude = self.longitude + math.degrees(east / (EARTH_RADIUS * math.cos(math.radians(self.latitude))))
+        return latitude, longitude
+
+
+def _degrees(value, ref):
+    degrees, minutes, seconds = (float(v) for v in value)
+    degrees += minutes / 60 + seconds / 3600
+    return -degrees if ref in ('S', 'W') else degrees
+
+
+def _open(source):
+    """PIL image and the first bytes of a path or uploaded file."""
+    if hasattr(source, 'getvalue'):
+        data = source.getvalue()
+        return PIL.Image.open(io.BytesIO(data)), data[:XMP_SEARCH_BYTES]
+    with open(source, 'rb') as f:
+        head = f.read(XMP_SEARCH_BYTES)
+    return PIL.Image.open(source), head
+
+
+def read_geotag(source):
+    """
+    Reads the DJI geotag of an image.
+
+    Parameters:
+        source (str, Path or uploaded file): The image.
+
+    Returns:
+        A Geotag, or None when the GPS position, relative altitude or focal
+        length is missing.
+    """
+    image, head = _open(source)
+    with image:
+        exif = image.getexif()
+        gps = exif.get_ifd(_GPS_IFD)
+        focal_35mm = exif.get_ifd(_EXIF_IFD).get(_FOCAL_LENGTH_35MM)
+        width, height = image.size
+    xmp = dict(_DJI_XMP.findall(head))
+    altitude = xmp.get(b'RelativeAltitude')
+    if 2 not in gps or 4 not in gps or altitude is None or not focal_35mm:
+        return None
+    # The gimbal yaw is where the camera faces; the aircraft may be turned
+    yaw = xmp.get(b'GimbalYawDegree', xmp.get(b'FlightYawDegree', b'0'))
+    return Geotag(latitude=_degrees(gps[2], gps.get(1, 'N')), longitude=_degrees(gps[4], gps.get(3, 'E')),
+                  altitude=float(altitude), yaw=float(yaw), focal_35mm=float(focal_35mm), width=width,
+                  height=height)
+
+
+def load_gray(source, max_side=settings.DEDUP_FEATURE_MAX_SIDE):
+    """
+    Decodes an image downscaled for registration.
+
+    Returns:
+        (grayscale array, its size relative to the full image)
+    """
+    image, _ = _open(source)
+    with image:
+        full_width = image.size[0]
+        # Lets the JPEG decoder skip straight to a reduced scale
+        image.draft('L', (max_side, max_side))
+        image = image.convert('L')
+        image.thumbnail((max_side, max_side))
+        return np.asarray(image), image.size[0] / full_width
+
+
+def _image_size(path):
+    with PIL.Image.open(path) as image:
+        return image.size
+
+
+def _downscale(gray, max_side=settings.DEDUP_FEATURE_MAX_SIDE):
+    scale = min(1.0, max_side / max(gray.shape[:2]))
+    if scale < 1:
+        gray = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    return gray, scale
+
+
+def _plausible(step, shape):
+    """False for homographies that fold, flip or scale the frame implausibly between neighbours."""
+    height, width = shape[:2]
+    corners = np.float32([[0, 0], [width, 0], [width, height], [0, height]]).reshape(-1, 1, 2)
+    warped = cv2.perspectiveTransform(corners, step)
+    if not cv2.isContourConvex(warped):
+        return False
+    # contourArea is signed when oriented; a mirrored frame comes back negative
+    return 0.25 < cv2.contourArea(warped, oriented=True) / (width * height) < 4
+
+
+class FeatureRegistrar:
+    """Chains frame-to-frame transforms from ORB matches into the first frame's plane."""
+
+    def __init__(self, motion=settings.DEDUP_MOTION, features=settings.DEDUP_ORB_FEATURES,
+                 min_inliers=settings.DEDUP_MIN_INLIERS):
+        """
+        Parameters:
+            motion (str): 'similarity' (rotation, scale and shift) or 'homography'.
+            features (int): ORB keypoints per frame.
+            min_inliers (int): RANSAC inliers needed to register a frame to
+                the previous one; with fewer a new chain starts.
+        """
+        if motion not in MOTIONS:
+            raise ValueError(f"Unknown motion model: {motion}")
+        self.motion = motion
+        self.min_inliers = min_inliers
+        self.chain = -1
+        self.frames = 0
+        self.registered = 0
+        self._orb = cv2.ORB_create(features)
+        self._matcher = cv2.BFMatcher(cv2.NORM_HAMMING)
+        self._previous = None  # points, descriptors, scale and transform of the last frame
+
+    def _step(self, points, descriptors, shape):
+        """3x3 transform from this frame to the previous one, both at registration size, or None."""
+        previous_points, previous_descriptors = self._previous[:2]
+        if descriptors is None or previous_descriptors is None or len(previous_descriptors) < 2:
+            return None
+        good = [pair[0] for pair in self._matcher.knnMatch(descriptors, previous_descriptors, k=2)
+                if len(pair) == 2 and pair[0].distance < LOWE_RATIO * pair[1].distance]
+        if len(good) < self.min_inliers:
+            return None
+        source = points[[m.queryIdx for m in good]]
+        target = previous_points[[m.trainIdx for m in good]]
+        if self.motion == 'similarity':
+            step, inliers = cv2.estimateAffinePartial2D(source, target, method=cv2.RANSAC, ransacReprojThreshold=3.0)
+            step = None if step is None else np.vstack([step, [0, 0, 1]])
+        else:
+            step, inliers = cv2.findHomography(source, target, cv2.RANSAC, 3.0)
+        if step is None or inliers.sum() < self.min_inliers or not _plausible(step, shape):
+            return None
+        return step
+
+    def register(self, gray, scale=1.0):
+        """
+        Places a frame on the plane of its chain.
+
+        Parameters:
+            gray (numpy array): Grayscale frame at registration size.
+            scale (float): Size of `gray` relative to the coordinates the boxes are in.
+
+        Returns:
+            (chain, transform): the chain number and the 3x3 homography from
+            box coordinates to the chain's plane.
+        """
+        self.frames += 1
+        keypoints, descriptors = self._orb.detectAndCompute(gray, None)
+        points = np.float32([keypoint.pt for keypoint in keypoints]).reshape(-1, 2)
+        transform = None
+        if self._previous is not None:
+            step = self._step(points, descriptors, gray.shape)
+            if step is not None:
+                _, _, previous_scale, previous_transform = self._previous
+                transform = previous_transform @ np.diag([1 / previous_scale, 1 / previous_scale, 1]) @ step @ \
+                    np.diag([scale, scale, 1])
+                self.registered += 1
+        if transform is None:
+            self.chain += 1
+            transform = np.eye(3)
+        self._previous = (points, descriptors, scale, transform)
+        return self.chain, transform
+
+
+def project_boxes(boxes, transform):
+    """Axis-aligned bounds of xyxy boxes after a homography."""
+    corners = boxes[:, [0, 1, 2, 1, 2, 3, 0, 3]].reshape(-1, 1, 2).astype(np.float64)
+    projected = cv2.perspectiveTransform(corners, transform).reshape(-1, 4, 2)
+    return np.concatenate([projected.min(axis=1), projected.max(axis=1)], axis=1)
+
+
+class GridIndex:
+    """Uniform grid over the survey plane: cell -> keys of the boxes touching it."""
+
+    def __init__(self, cell_size):
+        self.cell_size = cell_size
+        self._cells = defaultdict(set)
+        self._spans = {}  # key -> cells it was inserted into
+
+    def __len__(self):
+        return len(self._spans)
+
+    def _span(self, box):
+        x1, y1, x2, y2 = (int(v) for v in np.floor(np.asarray(box) / self.cell_size))
+        return [(i, j) for i in range(x1, x2 + 1) for j in range(y1, y2 + 1)]
+
+    def insert(self, key, box):
+        span = self._spans[key] = self._span(box)
+        for cell in span:
+            self._cells[cell].add(key)
+
+    def remove(self, key):
+        for cell in self._spans.pop(key):
+            keys = self._cells[cell]
+            keys.discard(key)
+            if not keys:
+                del self._cells[cell]
+
+    def move(self, key, box):
+        span = self._span(box)
+        if span != self._spans[key]:
+            self.remove(key)
+            self.insert(key, box)
+
+    def query(self, box):
+        """Keys of the boxes sharing a cell with `box`."""
+        found = set()
+        for cell in self._span(box):
+            found.update(self._cells.get(cell, ()))
+        return found
+
+
+@dataclass
+class SurveyObject:
+    """One physical object and the detections merged into it."""
+    object_id: int
+    label: str
+    segment: str
+    box: np.ndarray  # confidence-weighted mean of the projected boxes
+    weight: float
+    sightings: int
+    max_conf: float
+    first: tuple  # (file name, frame) of the first and last sighting
+    last: tuple
+
+    def merge(self, box, conf, sighting):
+        self.weight += conf
+        self.box += (box - self.box) * (conf / self.weight)
+        self.sightings += 1
+        self.max_conf = max(self.max_conf, conf)
+        self.last = sighting
+
+
+class SurveyDeduplicator:
+    """Merges the detections of registered frames into unique objects."""
+
+    def __init__(self, iou=settings.DEDUP_IOU, cell_scale=settings.DEDUP_CELL_SCALE, origin=None):
+        """
+        Parameters:
+            iou (float): Minimum IoU of a projected box with an object's box to merge into it.
+            cell_scale (float): Index cells are this many median box sizes wide.
+            origin (Geotag): Position of the GPS plane's origin, for latitudes
+                and longitudes in the object table.
+        """
+        self.iou = iou
+        self.cell_scale = cell_scale
+        self.origin = origin
+        self.objects = []
+        self.detections = 0
+        self.frames = 0
+        self._indexes = {}  # segment -> GridIndex
+
+    def _index(self, segment, projected):
+        index = self._indexes.get(segment)
+        if index is None:
+            # Sized from the first boxes seen, as the plane's units depend on the segment
+            size = float(np.median(np.maximum(projected[:, 2] - projected[:, 0], projected[:, 3] - projected[:, 1])))
+            index = self._indexes[segment] = GridIndex(max(size * self.cell_scale, 1e-6))
+        return index
+
+    def add(self, boxes, conf, labels, transform, segment, file_name, frame=0):
+        """
+        Merges the detections of one frame.
+
+        Parameters:
+            boxes (numpy array): (N, 4) xyxy boxes in the frame's coordinates.
+            conf (numpy array): Confidence per box.
+            labels (sequence): Class name per box; only the same class is merged.
+            transform (numpy array): 3x3 homography from frame coordinates to the segment's plane.
+            segment (str): Plane the frame was placed on; objects never merge across segments.
+            file_name (str): Source of the frame, for the object table.
+            frame (int): Frame index within the source.
+
+        Returns:
+            Object ID per box.
+        """
+        self.frames += 1
+        ids = np.zeros(len(boxes), int)
+        if not len(boxes):
+            return ids
+        projected = project_boxes(np.asarray(boxes, dtype=np.float64), transform)
+        conf = np.asarray(conf, dtype=np.float64)
+        labels = np.asarray(labels, dtype=object)
+        index = self._index(segment, projected)
+        sighting = (file_name, int(frame))
+        for label in set(labels.tolist()):
+            rows = np.flatnonzero(labels == label)
+            candidates = set()
+            for row in rows:
+                candidates.update(index.query(projected[row]))
+            candidates = [key for key in sorted(candidates) if self.objects[key - 1].label == label]
+            matched = np.zeros(len(rows), bool)
+            if candidates:
+                reference = np.array([self.objects[key - 1].box for key in candidates])
+                for r, c, _ in zip(*match_boxes(reference, projected[rows], self.iou)):
+                    survey_object = self.objects[candidates[r] - 1]
+                    survey_object.merge(projected[rows[c]], conf[rows[c]], sighting)
+                    index.move(survey_object.object_id, survey_object.box)
+                    ids[rows[c]] = survey_object.object_id
+                    matched[c] = True
+            for row in rows[~matched]:
+                survey_object = SurveyObject(object_id=len(self.objects) + 1, label=label, segment=segment,
+                                             box=projected[row].copy(), weight=conf[row], sightings=1,
+                                             max_conf=conf[row], first=sighting, last=sighting)
+                self.objects.append(survey_object)
+                index.insert(survey_object.object_id, survey_object.box)
+                ids[row] = survey_object.object_id
+        self.detections += len(boxes)
+        return ids
+
+    def counts(self):
+        """Unique objects per class."""
+        return dict(sorted(Counter(survey_object.label for survey_object in self.objects).items()))
+
+    def to_dataframe(self):
+        """One row per unique object; boxes are in metres on the GPS plane and in pixels otherwise."""
+        import pandas as pd
+
+        rows = []
+        for o in self.objects:
+            x1, y1, x2, y2 = o.box.tolist()
+            latitude = longitude = float('nan')
+            if o.segment == GPS_SEGMENT and self.origin is not None:
+                latitude, longitude = self.origin.position((x1 + x2) / 2, (y1 + y2) / 2)
+            rows.append({'object_id': o.object_id, 'class': o.label, 'sightings': o.sightings,
+                         'first_file': o.first[0], 'first_frame': o.first[1],
+                         'last_file': o.last[0], 'last_frame': o.last[1],
+                         'segment': o.segment, 'units': 'm' if o.segment == GPS_SEGMENT else 'px',
+                         'X1': x1, 'Y1': y1, 'X2': x2, 'Y2': y2,
+                         'latitude': latitude, 'longitude': longitude,
+                         'max_confidence': o.max_conf, 'mean_confidence': o.weight / o.sightings})
+        return pd.DataFrame(rows, columns=['object_id', 'class', 'sightings', 'first_file', 'first_frame',
+                                           'last_file', 'last_frame', 'segment', 'units', 'X1', 'Y1', 'X2',
+                                           'Y2', 'latitude', 'longitude', 'max_confidence', 'mean_confidence'])
+
+
+def _name(source):
+    return getattr(source, 'name', None) or str(source)
+
+
+def register_images(sources, method='auto', motion=settings.DEDUP_MOTION):
+    """
+    Places images on a survey plane.
+
+    Parameters:
+        sources (list): Image paths or uploaded files, in flight order.
+        method (str): 'gps', 'features', or 'auto' for GPS when every image
+            is geotagged and features otherwise.
+        motion (str): Motion model of feature registration, see FeatureRegistrar.
+
+    Returns:
+        (origin, placements): the first image's Geotag when placed by GPS
+        (else None), and a generator of (segment, transform) per image.
+    """
+    if method not in METHODS:
+        raise ValueError(f"Unknown registration method: {method}")
+    geotags = [read_geotag(source) for source in sources] if method != 'features' else []
+    if method == 'gps' and not all(geotags):
+        missing = [_name(source) for source, geotag in zip(sources, geotags) if geotag is None]
+        raise ValueError(f"{len(missing)} images have no DJI geotag, e.g. {missing[0]}")
+    if geotags and all(geotags):
+        origin = geotags[0]
+        return origin, ((GPS_SEGMENT, geotag.transform(origin)) for geotag in geotags)
+
+    def by_features():
+        registrar = FeatureRegistrar(motion)
+        for source in sources:
+            chain, transform = registrar.register(*load_gray(source))
+            yield f"images#{chain}", transform
+
+    return None, by_features()
+
+
+def deduplicate_images(sources, detections, method='auto', progress=None):
+    """
+    Unique objects across a set of overlapping images.
+
+    Parameters:
+        sources (list): Image paths or uploaded files, in flight order.
+        detections (list): Detections of each image, in the image's pixels.
+        method (str): See register_images.
+        progress (callable): Called with (done, total) after every image.
+
+    Returns:
+        A SurveyDeduplicator holding the objects.
+    """
+    origin, placements = register_images(sources, method)
+    dedup = SurveyDeduplicator(origin=origin)
+    for done, (source, result, (segment, transform)) in enumerate(zip(sources, detections, placements), 1):
+        labels = [str(result.names.get(int(c), c)) for c in result.cls]
+        dedup.add(result.boxes, result.conf, labels, transform, segment, _name(source))
+        if progress is not None:
+            progress(done, len(sources))
+    return dedup
+
+
+def _video_placements(path, wanted, register_every, motion):
+    """
+    Yields (frame, segment, transform, (width, height)) for the frames in `wanted`, in order.
+
+    Every `register_every`-th frame in between is registered too, so chains
+    survive stretches without detections.
+    """
+    registrar = FeatureRegistrar(motion)
+    vid_cap = cv2.VideoCapture(str(path))
+    try:
+        for frame_index in range(max(wanted) + 1):
+            if frame_index not in wanted and frame_index % register_every:
+                if not vid_cap.grab():
+                    break
+                continue
+            success, image = vid_cap.read()
+            if not success:
+                break
+            chain, transform = registrar.register(*_downscale(cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)))
+            if frame_index in wanted:
+                yield frame_index, f"{path}#{chain}", transform, image.shape[1::-1]
+    finally:
+        vid_cap.release()
+
+
+def deduplicate_survey(detections_csv, images, videos, method='auto', iou=settings.DEDUP_IOU,
+                       register_every=settings.DEDUP_VIDEO_REGISTER_EVERY, motion=settings.DEDUP_MOTION):
+    """
+    Unique objects in the detections.csv of a batch_detect run.
+
+    Parameters:
+        detections_csv (str or Path): batch_detect output.
+        images (list): Every image of the survey in flight order, including
+            the ones without detections, which still link their neighbours.
+        videos (list): Video files; each is registered on its own.
+        method (str): Placement of the images, see register_images. Videos
+            are always registered by features.
+        iou (float): Minimum IoU to merge a box into an object.
+        register_every (int): Video frames between registrations when no detection forces one.
+        motion (str): Motion model of feature registration, see FeatureRegistrar.
+
+    Returns:
+        A SurveyDeduplicator holding the objects.
+    """
+    import pandas as pd
+
+    table = pd.read_csv(detections_csv)
+    frames = {(file_name, int(frame)): group for (file_name, frame), group
+              in table.groupby(['file_name', 'frame'], sort=False)}
+
+    def add(dedup, file_name, frame, segment, transform, size):
+        group = frames.get((file_name, frame))
+        if group is None:
+            dedup.frames += 1
+            return
+        # The CSV's boxes are normalized to the frame size
+        width, height = size() if callable(size) else size
+        dedup.add(group[['x1', 'y1', 'x2', 'y2']].to_numpy(np.float64), group['confidence'].to_numpy(),
+                  group['class'].astype(str).to_numpy(), transform @ np.diag([width, height, 1.0]), segment,
+                  file_name, frame)
+
+    origin, placements = register_images(images, method, motion) if images else (None, iter(()))
+    dedup = SurveyDeduplicator(iou=iou, origin=origin)
+    for image, (segment, transform) in zip(images, placements):
+        add(dedup, image, 0, segment, transform, lambda: _image_size(image))
+    for video in videos:
+        wanted = {frame for file_name, frame in frames if file_name == video}
+        if not wanted:
+            continue
+        for frame, segment, transform, size in _video_placements(video, wanted, max(1, register_every), motion):
+            add(dedup, video, frame, segment, transform, size)
+    return dedup
+
+
+def report(dedup, output):
+    """Writes the object table to `output` and prints the unique counts."""
+    dedup.to_dataframe().to_csv(output, index=False, float_format='%.7g')
+    counts = ', '.join(f"{label}: {count}" for label, count in dedup.counts().items()) or 'none'
+    print(f"{dedup.detections} detections in {dedup.frames} frames -> {len(dedup.objects)} unique objects "
+          f"({counts}) -> {output}")
+
+
+def main(argv=None):
+    import batch_detect
+
+    parser = argparse.ArgumentParser(description="Count unique objects across overlapping survey frames.")
+    parser.add_argument('inputs', nargs='+', help='the image/video files, folders or .txt lists given to batch_detect')
+    parser.add_argument('--detections', required=True, help='detections.csv written by batch_detect')
+    parser.add_argument('--output', help='object table (default: objects.csv next to the detections)')
+    parser.add_argument('--method', default='auto', choices=METHODS,
+                        help='place images by DJI geotags, feature matches, or geotags when all have one')
+    parser.add_argument('--iou', type=float, default=settings.DEDUP_IOU)
+    parser.add_argument('--register-every', type=int, default=settings.DEDUP_VIDEO_REGISTER_EVERY,
+                        help='video frames between registrations when no detection forces one')
+    parser.add_argument('--motion', default=settings.DEDUP_MOTION, choices=MOTIONS,
+                        help='similarity for nadir surveys, homography for oblique footage')
+    args = parser.parse_args(argv)
+
+    images, videos = batch_detect.collect_inputs(args.inputs)
+    start = time.perf_counter()
+    dedup = deduplicate_survey(args.detections, images, videos, args.method, args.iou, args.register_every,
+                               args.motion)
+    report(dedup, Path(args.output or Path(args.detections).with_name('objects.csv')))
+    print(f"done in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
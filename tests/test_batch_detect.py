@@ -0,0 +1,138 @@
+"""
+Resume and failure handling of batch_detect.run, with the worker pool replaced
+by an in-process one so no model is needed.
+"""
+import json
+from pathlib import Path
+import sys
+from types import SimpleNamespace
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import numpy as np
+import pytest
+
+import batch_detect
+import detection_store
+from result_cache import Detections
+
+HEADER = ','.join(batch_detect.COLUMNS) + '\n'
+
+
+class _InlinePool:
+    """Runs the tasks in this process, in order."""
+
+    def __init__(self, workers, initializer=None, initargs=()):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def imap_unordered(self, func, tasks):
+        return map(func, tasks)
+
+
+@pytest.fixture
+def calls(monkeypatch):
+    """Replaces the pool and the task runner; tasks listed in `calls.failing` raise."""
+    calls = SimpleNamespace(ran=[], failing=set())
+
+    def run_task(task):
+        calls.ran.append(task['id'])
+        if task['id'] in calls.failing:
+            return task['id'], b'', 0, 0.0, "OSError: unreadable"
+        return task['id'], f"{task['id']},0,0,1,1,2,2,plastic,0.9\n".encode(), 1, 0.0, None
+
+    monkeypatch.setattr(batch_detect, '_run_task', run_task)
+    monkeypatch.setattr(batch_detect.multiprocessing, 'get_context',
+                        lambda method: SimpleNamespace(Pool=_InlinePool))
+    return calls
+
+
+def _tasks(*ids):
+    return [{'id': task_id, 'kind': 'images', 'paths': [task_id]} for task_id in ids]
+
+
+def _manifest(output):
+    return [json.loads(line) for line in (output / 'manifest.jsonl').read_text().splitlines()]
+
+
+def test_resume_skips_finished_tasks(tmp_path, calls):
+    assert batch_detect.run(_tasks('a', 'b'), tmp_path, {}, 1) == (2, [])
+    calls.ran.clear()
+
+    assert batch_detect.run(_tasks('a', 'b', 'c'), tmp_path, {}, 1) == (1, [])
+    assert calls.ran == ['c']
+    lines = (tmp_path / 'detections.csv').read_text().splitlines(keepends=True)
+    assert lines[0] == HEADER and len(lines) == 4
+    assert [line.split(',')[0] for line in lines[1:]] == ['a', 'b', 'c']
+
+
+def test_failed_task_is_recorded_and_retried(tmp_path, calls):
+    calls.failing.add('b')
+    assert batch_detect.run(_tasks('a', 'b', 'c'), tmp_path, {}, 1) == (3, ['b'])
+    records = {record['task']: record for record in _manifest(tmp_path)}
+    assert records['b']['error'] == "OSError: unreadable"
+    assert 'error' not in records['a'] and 'error' not in records['c']
+
+    calls.failing.clear()
+    calls.ran.clear()
+    assert batch_detect.run(_tasks('a', 'b', 'c'), tmp_path, {}, 1) == (1, [])
+    assert calls.ran == ['b']
+
+
+def test_main_exits_non_zero_when_a_task_failed(tmp_path, calls, monkeypatch):
+    calls.failing.add('a')
+    monkeypatch.setattr(batch_detect, 'plan_tasks', lambda *args: _tasks('a', 'b'))
+    with pytest.raises(SystemExit) as exit_info:
+        batch_detect.main([str(tmp_path / 'in'), '--output', str(tmp_path / 'out'), '--workers', '1'])
+    assert exit_info.value.code == 1
+
+
+def test_load_manifest_truncates_rows_after_last_task(tmp_path):
+    csv_path, manifest_path = tmp_path / 'detections.csv', tmp_path / 'manifest.jsonl'
+    rows = HEADER + 'a,0,0,1,1,2,2,plastic,0.9\n'
+    csv_path.write_text(rows + 'b,0,0,1,1,2,2,plas')  # task b was interrupted mid-write
+    manifest_path.write_text(json.dumps({'task': 'a', 'rows': 1, 'csv_offset': len(rows)}) + '\n' +
+                             '{"task": "b", "rows": 1, "csv_of')  # and so was its manifest line
+
+    assert batch_detect._load_manifest(manifest_path, csv_path) == {'a'}
+    assert csv_path.read_text() == rows
+    assert manifest_path.read_text().splitlines() == [json.dumps({'task': 'a', 'rows': 1, 'csv_offset': len(rows)})]
+
+
+def test_load_manifest_without_records_empties_csv(tmp_path):
+    csv_path, manifest_path = tmp_path / 'detections.csv', tmp_path / 'manifest.jsonl'
+    csv_path.write_text(HEADER + 'a,0,0,1,1,2,2,plastic,0.9\n')
+
+    assert batch_detect._load_manifest(manifest_path, csv_path) == set()
+    assert csv_path.stat().st_size == 0
+
+
+def _detections(count):
+    boxes = np.tile(np.array([[10, 20, 30, 60]], np.float32), (count, 1))
+    return Detections(boxes, np.full(count, 0.9, np.float32), np.zeros(count, int), (100, 200), {0: 'plastic'})
+
+
+def test_store_parts_of_finished_tasks_are_merged_and_exported(tmp_path):
+    parts_dir = tmp_path / 'parts'
+    parts_dir.mkdir()
+    batch_detect._write_part(batch_detect.part_path(parts_dir, 'a'), [_detections(2), _detections(0)],
+                             ['a.jpg', 'b.jpg'], None, {0: 'plastic'})
+    batch_detect._write_part(batch_detect.part_path(parts_dir, 'v'), [_detections(1)], ['v.mp4'], [7],
+                             {0: 'plastic'})
+    # Left behind by a retry that failed; not a finished task
+    batch_detect._write_part(batch_detect.part_path(parts_dir, 'x'), [_detections(5)], ['x.jpg'], None,
+                             {0: 'plastic'})
+
+    store_path = tmp_path / 'store.parquet'
+    batch_detect._merge_parts(_tasks('a', 'v', 'x'), {'a', 'v'}, parts_dir, store_path)
+    coco = json.loads(detection_store.export(store_path, 'COCO JSON').read_text())
+
+    assert sorted(image['file_name'] for image in coco['images']) == ['a.jpg', 'v.mp4#7']
+    assert len(coco['annotations']) == 3
+    assert coco['annotations'][0]['bbox'] == [10.0, 20.0, 20.0, 40.0]
+    assert coco['categories'] == [{'id': 1, 'name': 'plastic'}]
@@ -0,0 +1,58 @@
+"""grab_reader on a small generated video: which frames are decoded, and what the scheduler counts."""
+from pathlib import Path
+import sys
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import cv2
+import numpy as np
+import pytest
+
+from keyframes import KeyframeScheduler, grab_reader
+
+FRAMES = 23
+
+
+@pytest.fixture
+def video(tmp_path):
+    """Frame i is a flat grey of 10 * i, so decoded frames can be told apart."""
+    path = tmp_path / 'clip.avi'
+    writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*'MJPG'), 25, (64, 48))
+    for index in range(FRAMES):
+        writer.write(np.full((48, 64, 3), 10 * index, np.uint8))
+    writer.release()
+    return path
+
+
+def _read_all(video, every_n):
+    vid_cap = cv2.VideoCapture(str(video))
+    scheduler = KeyframeScheduler(every_n)
+    read = grab_reader(vid_cap, every_n, scheduler)
+    decoded = []
+    try:
+        while True:
+            success, frame, index = read()
+            if not success:
+                break
+            assert scheduler.is_keyframe(frame, index)
+            assert abs(float(frame.mean()) - 10 * index) < 3
+            decoded.append(index)
+    finally:
+        vid_cap.release()
+    return decoded, scheduler
+
+
+def test_decodes_every_nth_frame_from_the_first(video):
+    decoded, scheduler = _read_all(video, 5)
+
+    assert decoded == [0, 5, 10, 15, 20]
+    assert scheduler.frames == FRAMES
+    assert scheduler.keyframes == 5
+    assert scheduler.skipped == FRAMES - 5
+
+
+def test_every_frame_without_skipping(video):
+    decoded, scheduler = _read_all(video, 1)
+
+    assert decoded == list(range(FRAMES))
+    assert scheduler.skipped == 0 and scheduler.keyframe_ratio == 1.0
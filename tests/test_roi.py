@@ -0,0 +1,29 @@
+"""Validation of the ROI polygon text typed into the sidebar."""
+from pathlib import Path
+import sys
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import pytest
+
+from roi import format_polygons, parse_polygons
+
+
+def test_parses_polygons_and_skips_blank_lines():
+    polygons = parse_polygons("0,0.4 1,0.4 1,1 0,1\n\n0,0 0.5,0 0.5,0.2\n")
+
+    assert polygons == [[(0.0, 0.4), (1.0, 0.4), (1.0, 1.0), (0.0, 1.0)], [(0.0, 0.0), (0.5, 0.0), (0.5, 0.2)]]
+    assert parse_polygons(format_polygons(polygons)) == polygons
+
+
+@pytest.mark.parametrize('text', [
+    "0.5 1,1 0,1",  # one value
+    "0,0,1 1,1 0,1",  # three values
+    "0,0 1.5,0 1,1",  # outside the frame
+    "0,-0.1 1,0 1,1",
+    "0,0 1,1",  # too few points
+    "0,0 a,1 1,1",
+])
+def test_rejects_malformed_polygons(text):
+    with pytest.raises(ValueError):
+        parse_polygons(text)
@@ -0,0 +1,96 @@
+"""Grid index and the merging of repeat sightings into unique survey objects."""
+from dataclasses import replace
+from pathlib import Path
+import sys
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import numpy as np
+
+from survey_dedup import GPS_SEGMENT, Geotag, GridIndex, SurveyDeduplicator, project_boxes
+
+# 50 m up with a 24 mm lens: 0.01875 m per pixel, so 30 m is 1600 pixels
+ORIGIN = Geotag(latitude=52.0, longitude=4.0, altitude=50.0, yaw=0.0, focal_35mm=24.0, width=4000, height=3000)
+
+
+def _east(geotag, metres):
+    """The same camera moved `metres` east."""
+    latitude, longitude = geotag.position(metres, 0)
+    return replace(geotag, latitude=latitude, longitude=longitude)
+
+
+def test_grid_index_finds_boxes_in_shared_cells():
+    index = GridIndex(10)
+    index.insert(1, [0, 0, 5, 5])
+    index.insert(2, [25, 25, 28, 28])
+
+    assert index.query([8, 8, 12, 12]) == {1}
+    assert index.query([40, 40, 45, 45]) == set()
+
+    index.move(1, [41, 41, 44, 44])
+    assert index.query([8, 8, 12, 12]) == set()
+    assert index.query([40, 40, 45, 45]) == {1}
+
+    index.remove(2)
+    assert len(index) == 1
+    assert index.query([25, 25, 28, 28]) == set()
+
+
+def test_project_boxes_applies_the_transform():
+    shift = np.array([[2, 0, 10], [0, 2, -5], [0, 0, 1]], dtype=np.float64)
+
+    projected = project_boxes(np.array([[0, 0, 4, 3]]), shift)
+
+    np.testing.assert_allclose(projected, [[10, -5, 18, 1]])
+
+
+def test_same_frame_seen_twice_is_one_set_of_objects():
+    boxes = np.array([[100, 100, 140, 140], [300, 300, 340, 340]], dtype=np.float64)
+    dedup = SurveyDeduplicator()
+
+    first = dedup.add(boxes, [0.9, 0.8], ['plastic', 'plastic'], np.eye(3), 'survey', 'a.jpg')
+    second = dedup.add(boxes, [0.7, 0.6], ['plastic', 'plastic'], np.eye(3), 'survey', 'b.jpg')
+
+    assert first.tolist() == second.tolist() == [1, 2]
+    assert [o.sightings for o in dedup.objects] == [2, 2]
+    assert dedup.objects[0].first == ('a.jpg', 0) and dedup.objects[0].last == ('b.jpg', 0)
+
+
+def test_objects_do_not_merge_across_classes_segments_or_distance():
+    box = np.array([[100, 100, 140, 140]], dtype=np.float64)
+    shifted = np.array([[1, 0, 500], [0, 1, 0], [0, 0, 1]], dtype=np.float64)
+    dedup = SurveyDeduplicator()
+
+    dedup.add(box, [0.9], ['plastic'], np.eye(3), 'survey', 'a.jpg')
+    dedup.add(box, [0.9], ['metal'], np.eye(3), 'survey', 'a.jpg')
+    dedup.add(box, [0.9], ['plastic'], np.eye(3), 'other', 'a.jpg')
+    dedup.add(box, [0.9], ['plastic'], shifted, 'survey', 'a.jpg')
+
+    assert len(dedup.objects) == 4
+    assert dedup.counts() == {'metal': 1, 'plastic': 3}
+
+
+def test_revisited_gps_position_is_deduplicated():
+    dedup = SurveyDeduplicator(origin=ORIGIN)
+    box = np.array([[2500, 1400, 2600, 1500]], dtype=np.float64)
+    moved = _east(ORIGIN, 30)
+
+    dedup.add(box, [0.9], ['plastic'], ORIGIN.transform(ORIGIN), GPS_SEGMENT, 'first.jpg')
+    # 30 m further east the object is 1600 pixels further left in the frame
+    dedup.add(box - [1600, 0, 1600, 0], [0.8], ['plastic'], moved.transform(ORIGIN), GPS_SEGMENT, 'next.jpg')
+    # Flying back over the first position facing south turns the frame upside down
+    back = replace(ORIGIN, yaw=180.0)
+    upside_down = np.array([[1400, 1500, 1500, 1600]], dtype=np.float64)
+    dedup.add(upside_down, [0.7], ['plastic'], back.transform(ORIGIN), GPS_SEGMENT, 'return.jpg')
+
+    assert len(dedup.objects) == 1
+    survey_object = dedup.objects[0]
+    assert survey_object.sightings == 3
+    assert survey_object.last == ('return.jpg', 0)
+
+    table = dedup.to_dataframe()
+    assert table['units'].tolist() == ['m']
+    # The box centre is 550 pixels right of and 50 above the frame centre
+    gsd = ORIGIN.ground_sample_distance
+    latitude, longitude = ORIGIN.position(550 * gsd, -50 * gsd)
+    np.testing.assert_allclose([table['latitude'][0], table['longitude'][0]], [latitude, longitude], atol=1e-7)
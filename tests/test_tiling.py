@@ -0,0 +1,69 @@
+"""Tile layout and the merging of boxes found on overlapping tiles."""
+from pathlib import Path
+import sys
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import numpy as np
+import pytest
+
+import tiling
+from result_cache import Detections
+from tiling import TileConfig, drop_seam_fragments, nms, tile_coords, weighted_boxes_fusion
+
+
+def test_tiles_end_on_the_frame_edge():
+    windows = tile_coords(1200, 640, 640, 0.2)
+
+    assert windows.tolist() == [[0, 0, 640, 640], [512, 0, 1152, 640], [560, 0, 1200, 640]]
+
+
+def test_small_frame_is_one_tile():
+    assert tile_coords(300, 200, 640, 0.2).tolist() == [[0, 0, 300, 200]]
+
+
+def test_nms_keeps_the_best_box_per_class():
+    boxes = np.array([[0, 0, 10, 10], [1, 1, 11, 11], [0, 0, 10, 10], [50, 50, 60, 60]], np.float32)
+    scores = np.array([0.6, 0.9, 0.8, 0.5], np.float32)
+    cls = np.array([0, 0, 1, 0])
+
+    assert sorted(nms(boxes, scores, cls, 0.5).tolist()) == [1, 2, 3]
+
+
+def test_wbf_averages_a_cluster_by_score():
+    boxes = np.array([[0, 0, 10, 10], [2, 0, 12, 10]], np.float32)
+    fused, scores, cls = weighted_boxes_fusion(boxes, np.array([0.75, 0.25], np.float32), np.zeros(2, int), 0.5)
+
+    assert fused.tolist() == [[0.5, 0.0, 10.5, 10.0]]
+    assert scores.tolist() == [0.5] and cls.tolist() == [0]
+
+
+def test_seam_fragment_gives_way_to_the_whole_box():
+    boxes = np.array([[600, 100, 640, 200], [600, 100, 700, 200], [800, 100, 840, 200]], np.float32)
+    scores = np.array([0.95, 0.9, 0.8], np.float32)
+    cut = np.array([True, False, True])
+
+    # The third box is cut too but overlaps nothing, so it stays
+    assert drop_seam_fragments(boxes, scores, np.zeros(3, int), cut, 0.6).tolist() == [1, 2]
+
+
+@pytest.mark.parametrize('merge', ['nms', 'wbf'])
+def test_box_split_by_two_tiles_merges_to_one(monkeypatch, merge):
+    frame = np.zeros((640, 1200, 3), np.uint8)
+    target = np.array([600, 100, 700, 200], np.float32)
+
+    def detect_batch(model, tiles, conf, imgsz):
+        # What a detector sees: the object clipped to each tile, the clipped part scored higher
+        found = []
+        for (x0, y0, x1, y1), tile in zip(tile_coords(1200, 640, 640, 0.2), tiles):
+            box = np.clip(target - [x0, y0, x0, y0], 0, [x1 - x0, y1 - y0] * 2).astype(np.float32)
+            score = 0.9 if box[2] - box[0] == 100 else 0.95
+            found.append(Detections(box[None], np.array([score], np.float32), np.array([0]), tile.shape[:2],
+                                    {0: 'plastic'}))
+        return found
+
+    monkeypatch.setattr(tiling, 'detect_batch', detect_batch)
+    result = tiling.tiled_predict(None, frame, 0.3, TileConfig(merge=merge))
+
+    assert result.boxes.tolist() == [target.tolist()]
+    assert result.orig_shape == (640, 1200)
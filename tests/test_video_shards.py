@@ -0,0 +1,36 @@
+"""Stitching per-segment track IDs into global ones."""
+from pathlib import Path
+import sys
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import numpy as np
+
+from video_shards import plan_segments, stitch
+
+
+def _rows(*tracks):
+    """(frame, id, box x offset) triples -> track_segment rows."""
+    return np.array([[frame, track_id, x, 0.1, x + 0.1, 0.2, 0.9, 0] for frame, track_id, x in tracks], float)
+
+
+def test_plan_segments_overlap_the_previous_segment():
+    assert plan_segments(100, 2, 10) == [(0, 0, 50), (40, 50, 100)]
+
+
+def test_tracks_are_joined_across_the_overlap_without_id_gaps():
+    first = {'start': 0, 'owned_start': 0, 'end': 5,
+             # track 7 moves along; track 9 only appears on frames the next segment does not own
+             'rows': _rows(*[(f, 7, 0.1) for f in range(5)], (1, 9, 0.6))}
+    second = {'start': 3, 'owned_start': 5, 'end': 8,
+              # 2 continues 7 through the overlap; 4 is only seen in the overlap; 5 is new
+              'rows': _rows(*[(f, 2, 0.1) for f in range(3, 8)], (3, 4, 0.8), (6, 5, 0.4))}
+
+    rows = stitch([first, second])
+
+    ids = {int(frame): set() for frame in rows[:, 0]}
+    for frame, track_id in rows[:, :2].astype(int):
+        ids[frame].add(track_id)
+    assert sorted(ids) == list(range(8))
+    assert ids[1] == {1, 2} and ids[5] == {1} and ids[6] == {1, 3}
+    assert set(rows[:, 1].astype(int)) == {1, 2, 3}
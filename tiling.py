@@ -0,0 +1,241 @@
+"""
+Tiled (sliced) inference for high-resolution imagery.
+
+A large frame is cut into overlapping tiles that are run through the model at
+their native resolution, so small objects are not lost to downscaling. Boxes
+from all tiles are shifted back to frame coordinates and duplicates along tile
+seams are merged with NMS or weighted box fusion.
+
+A box cut off by a tile edge barely overlaps the whole box found in the
+neighbouring tile by IoU, though it lies almost entirely inside it. Such seam
+fragments are removed first, by intersection over the smaller box (IOS)
+against the other boxes, which is one vectorized comparison of the few cut
+boxes with all boxes. The remaining duplicates are merged by IoU, which
+torchvision's batched NMS handles in C++ when it is installed.
+"""
+from dataclasses import dataclass
+
+import cv2
+import numpy as np
+
+import settings
+from result_cache import Detections, detect_batch
+
+
+@dataclass
+class TileConfig:
+    tile_size: int = settings.TILE_SIZE
+    overlap: float = settings.TILE_OVERLAP  # fraction of the tile shared with its neighbour
+    merge: str = 'nms'  # 'nms' or 'wbf'
+    match_metric: str = 'iou'  # 'iou', or 'ios' to merge every pair by IOS (a slower Python loop)
+    match_threshold: float = 0.5
+    seam_threshold: float = 0.6  # IOS above which a box cut by a tile edge is dropped; None keeps them
+    max_batch_bytes: int = settings.TILE_MAX_BATCH_BYTES
+
+    @property
+    def tag(self):
+        """Short string identifying the settings, e.g. for cache keys."""
+        return (f"t{self.tile_size}o{self.overlap:.2f}{self.merge}{self.match_metric}{self.match_threshold:.2f}"
+                f"s{self.seam_threshold}")
+
+
+def tile_coords(width, height, tile_size, overlap):
+    """
+    Returns the (N, 4) x0, y0, x1, y1 windows covering a width x height frame.
+
+    The last row and column are shifted back to end on the frame edge, so all
+    tiles have the same size whenever the frame is at least one tile large.
+    """
+    step = max(int(tile_size * (1 - overlap)), 1)
+
+    def starts(length):
+        if length <= tile_size:
+            return np.array([0])
+        points = np.arange(0, length - tile_size, step)
+        return np.append(points, length - tile_size)
+
+    xs, ys = np.meshgrid(starts(width), starts(height))
+    x0, y0 = xs.ravel(), ys.ravel()
+    return np.stack([x0, y0, np.minimum(x0 + tile_size, width), np.minimum(y0 + tile_size, height)], axis=1)
+
+
+def box_overlap(box, boxes, metric='iou'):
+    """Overlap of one xyxy box with each of `boxes`, as IoU or intersection over the smaller box."""
+    ix1 = np.maximum(box[0], boxes[:, 0])
+    iy1 = np.maximum(box[1], boxes[:, 1])
+    ix2 = np.minimum(box[2], boxes[:, 2])
+    iy2 = np.minimum(box[3], boxes[:, 3])
+    inter = np.clip(ix2 - ix1, 0, None) * np.clip(iy2 - iy1, 0, None)
+    area = (box[2] - box[0]) * (box[3] - box[1])
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    if metric == 'ios':
+        denom = np.minimum(area, areas)
+    else:
+        denom = area + areas - inter
+    return inter / np.maximum(denom, 1e-9)
+
+
+def pairwise_overlap(boxes_a, boxes_b, metric='iou'):
+    """(len(boxes_a), len(boxes_b)) overlaps of two sets of xyxy boxes, as IoU or IOS."""
+    a, b = boxes_a[:, None, :], boxes_b[None, :, :]
+    inter = (np.clip(np.minimum(a[..., 2], b[..., 2]) - np.maximum(a[..., 0], b[..., 0]), 0, None) *
+             np.clip(np.minimum(a[..., 3], b[..., 3]) - np.maximum(a[..., 1], b[..., 1]), 0, None))
+    area_a = (a[..., 2] - a[..., 0]) * (a[..., 3] - a[..., 1])
+    area_b = (b[..., 2] - b[..., 0]) * (b[..., 3] - b[..., 1])
+    if metric == 'ios':
+        denom = np.minimum(area_a, area_b)
+    else:
+        denom = area_a + area_b - inter
+    return inter / np.maximum(denom, 1e-9)
+
+
+def cut_by_tile(boxes, window, width, height, margin=2):
+    """
+    Marks the boxes of one tile that touch an edge of the tile inside the frame.
+
+    Parameters:
+        boxes (numpy array): (N, 4) xyxy in tile pixels.
+        window: x0, y0, x1, y1 of the tile in the frame.
+        width, height (int): Frame size; tile edges on the frame border cut nothing.
+        margin (float): Pixels from the edge that still count as touching it.
+    """
+    x0, y0, x1, y1 = window
+    return (((boxes[:, 0] <= margin) & (x0 > 0)) | ((boxes[:, 1] <= margin) & (y0 > 0)) |
+            ((boxes[:, 2] >= x1 - x0 - margin) & (x1 < width)) | ((boxes[:, 3] >= y1 - y0 - margin) & (y1 < height)))
+
+
+def drop_seam_fragments(boxes, scores, cls, cut, threshold):
+    """
+    Indices of the boxes left after removing seam fragments.
+
+    A box cut by a tile edge is dropped when it lies mostly (IOS >= threshold)
+    inside another box of its class that is either uncut or cut but scored
+    higher, so the whole box from the neighbouring tile wins.
+    """
+    fragments = np.flatnonzero(cut)
+    if not fragments.size:
+        return np.arange(len(boxes))
+    overlap = pairwise_overlap(boxes[fragments], boxes, 'ios')
+    overlap[np.arange(len(fragments)), fragments] = 0
+    others = np.arange(len(boxes))[None, :]
+    stronger = (~cut[None, :] | (scores[None, :] > scores[fragments, None]) |
+                ((scores[None, :] == scores[fragments, None]) & (others < fragments[:, None])))
+    drop = ((overlap >= threshold) & (cls[None, :] == cls[fragments, None]) & stronger).any(axis=1)
+    keep = np.ones(len(boxes), bool)
+    keep[fragments[drop]] = False
+    return np.flatnonzero(keep)
+
+
+def _clusters(boxes, scores, cls, threshold, metric):
+    """Greedy clustering in descending score order; yields index arrays, highest score first."""
+    order = np.argsort(-scores)
+    while order.size:
+        top = order[0]
+        rest = order[1:]
+        same = (box_overlap(boxes[top], boxes[rest], metric) >= threshold) & (cls[rest] == cls[top])
+        yield np.concatenate(([top], rest[same]))
+        order = rest[~same]
+
+
+def nms(boxes, scores, cls, threshold=0.5, metric='iou'):
+    """Class-aware NMS. Returns the indices of the kept boxes, highest score first."""
+    if metric == 'iou':
+        try:
+            import torch
+            from torchvision.ops import batched_nms
+        except ImportError:
+            pass
+        else:
+            keep = batched_nms(torch.from_numpy(boxes).float(), torch.from_numpy(scores).float(),
+                               torch.from_numpy(cls), threshold)
+            return keep.numpy()
+    return np.array([cluster[0] for cluster in _clusters(boxes, scores, cls, threshold, metric)], dtype=int)
+
+
+def weighted_boxes_fusion(boxes, scores, cls, threshold=0.5, metric='iou'):
+    """Fuses each cluster of overlapping boxes into its score-weighted mean box."""
+    fused_boxes, fused_scores, fused_cls = [], [], []
+    for cluster in _clusters(boxes, scores, cls, threshold, metric):
+        weights = scores[cluster]
+        fused_boxes.append((boxes[cluster] * weights[:, None]).sum(axis=0) / weights.sum())
+        fused_scores.append(weights.mean())
+        fused_cls.append(cls[cluster[0]])
+    if not fused_boxes:
+        return np.zeros((0, 4), np.float32), np.zeros(0, np.float32), np.zeros(0, int)
+    return np.array(fused_boxes, np.float32), np.array(fused_scores, np.float32), np.array(fused_cls, int)
+
+
+def _limit_pixels(image, max_pixels):
+    """
+    Downscales a frame that exceeds the pixel budget. Returns the image and the scale applied.
+
+    The frame has already been decoded at full size by then, so this bounds
+    the tiles and the model's work, not the peak memory of decoding. Decoding
+    straight to the reduced size (e.g. PIL's JPEG draft mode) would also save
+    that, but only for some formats and only by powers of two, so it is left
+    to the caller.
+    """
+    height, width = image.shape[:2]
+    if height * width <= max_pixels:
+        return image, 1.0
+    scale = (max_pixels / (height * width)) ** 0.5
+    size = (int(width * scale), int(height * scale))
+    return cv2.resize(image, size, interpolation=cv2.INTER_AREA), scale
+
+
+def tiled_predict(model, image, conf, config=None):
+    """
+    Runs the model over overlapping tiles of a frame and merges the boxes.
+
+    Tiles are cropped lazily and sent through the model in batches no larger
+    than `config.max_batch_bytes`, so only one batch of tile copies is held in
+    memory at a time. Frames above settings.TILE_MAX_IMAGE_PIXELS are
+    downscaled first (see _limit_pixels).
+
+    Parameters:
+        model (YOLO): A YOLOv8 object detection model, or an InferenceClient.
+        image (numpy array): BGR frame.
+        conf (float): Confidence threshold for object detection.
+        config (TileConfig): Tiling settings, defaults from settings.
+
+    Returns:
+        Detections in pixel coordinates of `image`.
+    """
+    config = config or TileConfig()
+    orig_shape = image.shape[:2]
+    image, scale = _limit_pixels(image, settings.TILE_MAX_IMAGE_PIXELS)
+    height, width = image.shape[:2]
+    windows = tile_coords(width, height, config.tile_size, config.overlap)
+    per_batch = max(1, config.max_batch_bytes // (config.tile_size * config.tile_size * 3))
+
+    boxes, scores, classes, cut = [], [], [], []
+    names = {}
+    for start in range(0, len(windows), per_batch):
+        batch = windows[start:start + per_batch]
+        tiles = [np.ascontiguousarray(image[y0:y1, x0:x1]) for x0, y0, x1, y1 in batch]
+        for window, found in zip(batch, detect_batch(model, tiles, conf, config.tile_size)):
+            x0, y0 = window[:2]
+            names = found.names
+            if not len(found.conf):
+                continue
+            boxes.append(found.boxes + np.array([x0, y0, x0, y0], dtype=found.boxes.dtype))
+            scores.append(found.conf)
+            classes.append(found.cls)
+            cut.append(cut_by_tile(found.boxes, window, width, height))
+
+    if not boxes:
+        return Detections(np.zeros((0, 4), np.float32), np.zeros(0, np.float32), np.zeros(0, int),
+                          orig_shape, dict(names))
+    boxes = np.concatenate(boxes)
+    scores = np.concatenate(scores)
+    classes = np.concatenate(classes)
+    if config.seam_threshold is not None:
+        keep = drop_seam_fragments(boxes, scores, classes, np.concatenate(cut), config.seam_threshold)
+        boxes, scores, classes = boxes[keep], scores[keep], classes[keep]
+    if config.merge == 'wbf':
+        boxes, scores, classes = weighted_boxes_fusion(boxes, scores, classes, config.match_threshold,
+                                                       config.match_metric)
+    else:
+        keep = nms(boxes, scores, classes, config.match_threshold, config.match_metric)
+        boxes, scores, classes = boxes[keep], scores[keep], classes[keep]
+    return Detections(boxes / scale, scores, classes, orig_shape, dict(names))
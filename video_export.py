@@ -0,0 +1,238 @@
+"""
+Annotated video export.
+
+AnnotatedVideoWriter takes FrameResults from the inference loop through a
+queue and draws, scales and encodes them in a background thread. The queue
+is bounded by the bytes of the frames it holds, not their number, so 4K
+sources queue fewer frames than 720p ones. When it is full, frames are dropped and counted rather than holding up
+inference, unless the writer was created with `block=True`, as the offline
+batch path does. The output is H.264 through an ffmpeg pipe when ffmpeg is
+installed, which browsers play and which honours the bitrate. Otherwise
+cv2.VideoWriter is used, without bitrate control.
+
+With `segments_only` only the stretches with detections are written, padded
+by a few frames on both sides. The frames held back for the padding before a
+segment count against the queue's byte budget, and at most half of it, so a
+4K source gets less pre-roll than `padding` rather than more memory. The source frame ranges of the segments are
+saved next to the video as `<name>.segments.json`.
+"""
+from collections import deque
+import json
+from pathlib import Path
+import queue
+import shutil
+import subprocess
+import threading
+
+import cv2
+
+import settings
+from overlay import OverlayRenderer
+
+_END = object()
+
+
+class _FfmpegEncoder:
+    def __init__(self, path, fps, size, bitrate):
+        width, height = size
+        command = [shutil.which('ffmpeg'), '-y', '-loglevel', 'error',
+                   '-f', 'rawvideo', '-pix_fmt', 'bgr24', '-s', f"{width}x{height}", '-r', f"{fps:.3f}", '-i', '-',
+                   '-c:v', 'libx264', '-preset', 'veryfast', '-pix_fmt', 'yuv420p', '-movflags', '+faststart']
+        if bitrate:
+            command += ['-b:v', str(bitrate)]
+        self._process = subprocess.Popen(command + [str(path)], stdin=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    def write(self, frame):
+        self._process.stdin.write(frame.tobytes())
+
+    def close(self):
+        self._process.stdin.close()
+        if self._process.wait() != 0:
+            raise RuntimeError(f"ffmpeg failed: {self._process.stderr.read().decode(errors='replace').strip()}")
+
+
+class _OpenCvEncoder:
+    def __init__(self, path, fps, size, bitrate):
+        self._writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*settings.EXPORT_FOURCC), fps, size)
+        if not self._writer.isOpened():
+            raise RuntimeError(f"cv2.VideoWriter could not open {path}")
+
+    def write(self, frame):
+        self._writer.write(frame)
+
+    def close(self):
+        self._writer.release()
+
+
+def _output_size(frame_shape, width):
+    """Output (width, height) for a frame scaled to `width`, rounded to even numbers for yuv420p."""
+    height, frame_width = frame_shape[:2]
+    if width and width != frame_width:
+        height = height * width / frame_width
+        frame_width = width
+    return int(frame_width) // 2 * 2, int(round(height)) // 2 * 2
+
+
+class AnnotatedVideoWriter:
+    """Draws and encodes FrameResults to a video file in a background thread."""
+
+    def __init__(self, path, fps, width=None, bitrate=settings.EXPORT_BITRATE, segments_only=False,
+                 padding=settings.EXPORT_SEGMENT_PADDING, mode='labels', max_queued_bytes=settings.EXPORT_QUEUE_BYTES,
+                 block=False):
+        """
+        Parameters:
+            path (str or Path): Video file to write (replaced if it exists).
+            fps (float): Frame rate of the output.
+            width (int): Output width, height follows the aspect ratio; None keeps the frame size.
+            bitrate (str): Target bitrate for ffmpeg, e.g. '4M'.
+            segments_only (bool): Only write frames within `padding` frames of a detection.
+            padding (int): Frames kept before and after each stretch with detections.
+            mode (str): Overlay mode, see overlay.MODES.
+            max_queued_bytes (int): Image bytes waiting for the encoder; a
+                single larger frame is still accepted when the queue is empty.
+            block (bool): Wait for room in the queue instead of dropping frames.
+        """
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.fps = fps or 30.0
+        self.width = width
+        self.bitrate = bitrate
+        self.segments_only = segments_only
+        self.padding = padding
+        self.block = block
+        self.written = 0
+        self.dropped = 0
+        self.segments = []  # [first, last] source frame index of each written stretch
+        self.error = None
+        self._renderer = OverlayRenderer(mode)
+        self._encoder = None
+        self._size = None
+        self._pre_roll = deque()  # (frame_result, source_frame, bytes) held back for the next segment
+        self._pre_roll_bytes = 0
+        self._since_detection = None  # frames since the last detection, None outside a segment
+        self._writing = False  # the previous frame was written, so the next one extends its segment
+        self.max_queued_bytes = max_queued_bytes
+        self.queued_bytes = 0
+        self._room = threading.Condition()
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name='video-export', daemon=True)
+        self._thread.start()
+
+    def write(self, frame_result, source_frame=None):
+        """
+        Queues a frame for export without waiting for the encoder (unless `block`).
+
+        Parameters:
+            frame_result (FrameResult): Boxes and the frame they belong to.
+            source_frame (numpy array): The full-size BGR frame `frame_result`
+                was resized from; exported instead, with the boxes scaled to it.
+        """
+        size = frame_result.image.nbytes + (source_frame.nbytes if source_frame is not None else 0)
+        with self._room:
+            if self.block:
+                self._room.wait_for(lambda: self._has_room(size))
+            elif not self._has_room(size):
+                self.dropped += 1
+                return
+            self.queued_bytes += size
+        self._queue.put((frame_result, source_frame, size))
+
+    def _has_room(self, size):
+        return not self.queued_bytes or self.queued_bytes + size <= self.max_queued_bytes
+
+    def close(self):
+        """Encodes the queued frames, finishes the file and raises any encoding error."""
+        self._queue.put(_END)
+        self._thread.join()
+        if self.segments_only and self.segments:
+            self.path.with_suffix('.segments.json').write_text(json.dumps(
+                {'fps': self.fps, 'segments': self.segments}))
+        if self.error is not None:
+            raise self.error
+
+    def _encode(self, frame_result, source_frame):
+        image, boxes = frame_result.image, frame_result.boxes
+        if source_frame is not None and source_frame.shape != image.shape:
+            scale = source_frame.shape[1] / image.shape[1]
+            image, boxes = source_frame, boxes * scale
+        canvas = self._renderer.draw(image, boxes, frame_result.conf, frame_result.cls, frame_result.names,
+                                     frame_result.track_ids)
+        if self._encoder is None:
+            self._size = _output_size(canvas.shape, self.width)
+            encoder = _FfmpegEncoder if shutil.which('ffmpeg') else _OpenCvEncoder
+            self._encoder = encoder(self.path, self.fps, self._size, self.bitrate)
+        if canvas.shape[1::-1] != self._size:
+            canvas = cv2.resize(canvas, self._size, interpolation=cv2.INTER_AREA)
+        self._encoder.write(canvas)
+        self.written += 1
+        index = frame_result.frame_index
+        if self._writing:
+            self.segments[-1][1] = index
+        else:
+            self.segments.append([index, index])
+        self._writing = True
+
+    def _release(self, size):
+        with self._room:
+            self.queued_bytes -= size
+            self._room.notify_all()
+
+    def _drop_pre_roll(self):
+        _, _, size = self._pre_roll.popleft()
+        self._pre_roll_bytes -= size
+        self._release(size)
+
+    def _handle(self, frame_result, source_frame, size):
+        """Returns True when the frame is held back as pre-roll, so its bytes stay counted."""
+        if not self.segments_only:
+            self._encode(frame_result, source_frame)
+            return False
+        if frame_result.num_boxes:
+            # Start or extend a segment, beginning with the frames just before it
+            while self._pre_roll:
+                frame_result_before, source_frame_before, _ = self._pre_roll[0]
+                self._encode(frame_result_before, source_frame_before)
+                self._drop_pre_roll()
+            self._since_detection = 0
+            self._encode(frame_result, source_frame)
+        elif self._since_detection is not None and self._since_detection < self.padding:
+            self._since_detection += 1
+            self._encode(frame_result, source_frame)
+        else:
+            self._since_detection = None
+            self._writing = False
+            if not self.padding or size > self.max_queued_bytes // 2:
+                return False
+            self._pre_roll.append((frame_result, source_frame, size))
+            self._pre_roll_bytes += size
+            while len(self._pre_roll) > self.padding or self._pre_roll_bytes > self.max_queued_bytes // 2:
+                self._drop_pre_roll()
+            return True
+        return False
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is _END:
+                break
+            held = False
+            try:
+                if self.error is None:
+                    held = self._handle(*item)
+            except Exception as e:
+                # Keep draining so write() and close() never hang; close() raises it
+                self.error = e
+            finally:
+                if not held:
+                    self._release(item[2])
+        while self._pre_roll:
+            self._drop_pre_roll()  # frames after the last segment are not exported
+        if self._encoder is not None:
+            try:
+                self._encoder.close()
+            except Exception as e:
+                self.error = self.error or e
+
+    def stats(self):
+        return {'written': self.written, 'dropped': self.dropped, 'segments': len(self.segments),
+                'queued': self._queue.qsize(), 'queued_bytes': self.queued_bytes}
@@ -0,0 +1,201 @@
+"""
+Offline tracking of a stored video split across worker processes.
+
+    python -m video_shards data/sample_videos/Video_1p5s_nw.mp4 --tracker bytetrack.yaml --workers 8
+
+The video is cut into time segments and each segment is tracked in its own
+process with its own model. Every segment after the first also tracks a few
+frames before its start that already belong to the previous segment. Tracks
+from both segments are matched by box overlap on those shared frames, which
+stitches the per-segment track IDs into global ones.
+"""
+import argparse
+from collections import Counter
+import csv
+import multiprocessing
+import os
+from pathlib import Path
+import time
+
+import cv2
+import numpy as np
+
+import settings
+import batch_detect
+from backends import match_boxes
+
+
+def plan_segments(total_frames, segments, overlap):
+    """
+    Splits [0, total_frames) into segments.
+
+    Returns:
+        A list of (start, owned_start, end) tuples: frames [start, owned_start)
+        are the overlap shared with the previous segment, [owned_start, end)
+        are the frames this segment reports.
+    """
+    bounds = np.linspace(0, total_frames, segments + 1).astype(int)
+    plan = []
+    for owned_start, end in zip(bounds[:-1], bounds[1:]):
+        if end > owned_start:
+            plan.append((int(max(0, owned_start - overlap)), int(owned_start), int(end)))
+    return plan
+
+
+def track_segment(job):
+    """
+    Tracks one segment in a worker process.
+
+    Returns:
+        A dict with the segment bounds, per-frame arrays of
+        (frame, track id, x1, y1, x2, y2, conf, cls) rows, boxes normalized,
+        and the model's class names.
+    """
+    import helper
+
+    video, (start, owned_start, end) = job
+    model, options = batch_detect.worker_context()
+    model = model.tracking_copy()  # fresh tracker for every segment
+    begin = time.perf_counter()
+
+    vid_cap = cv2.VideoCapture(video)
+    vid_cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+    rows = []
+    for frame_index in range(start, end):
+        success, image = vid_cap.read()
+        if not success:
+            break
+        frame_result = helper.detect_frame(options['conf'], model, image, True, options['tracker'], frame_index)
+        if frame_result.track_ids is None or not frame_result.num_boxes:
+            continue
+        height, width = frame_result.image.shape[:2]
+        boxesn = frame_result.boxes / [width, height, width, height]
+        rows.append(np.column_stack([np.full(frame_result.num_boxes, frame_index), frame_result.track_ids,
+                                     boxesn, frame_result.conf, frame_result.cls]))
+    vid_cap.release()
+    data = np.concatenate(rows) if rows else np.zeros((0, 8))
+    return {'start': start, 'owned_start': owned_start, 'end': end, 'rows': data,
+            'names': dict(model.names), 'seconds': time.perf_counter() - begin}
+
+
+def _overlap_votes(previous, current, frames, iou_threshold):
+    """Counts, per (previous id, current id) pair, the shared frames on which their boxes match."""
+    votes = Counter()
+    for frame in frames:
+        a = previous[previous[:, 0] == frame]
+        b = current[current[:, 0] == frame]
+        r, c, _ = match_boxes(a[:, 2:6], b[:, 2:6], iou_threshold)
+        votes.update(zip(a[r, 1].astype(int), b[c, 1].astype(int)))
+    return votes
+
+
+def stitch(segments, iou_threshold=0.5, min_votes=2):
+    """
+    Maps per-segment track IDs to global IDs and keeps each frame from its owning segment.
+
+    Global IDs are numbered 1, 2, ... in order of first appearance in the
+    output; tracks seen only on frames another segment owns get none.
+
+    Parameters:
+        segments (list): track_segment results in time order.
+        iou_threshold (float): Minimum IoU for two boxes on a shared frame to match.
+        min_votes (int): Shared frames two tracks must match on to be joined.
+
+    Returns:
+        (N, 8) array of (frame, global track id, x1, y1, x2, y2, conf, cls) rows.
+    """
+    next_id = 1
+    previous, previous_map = None, {}
+    output = []
+    for segment in segments:
+        rows = segment['rows']
+        mapping = {}
+        if previous is not None and segment['start'] < segment['owned_start']:
+            votes = _overlap_votes(previous, rows, range(segment['start'], segment['owned_start']), iou_threshold)
+            used = set()
+            for (prev_id, cur_id), count in votes.most_common():
+                if count < min_votes:
+                    break
+                if cur_id not in mapping and prev_id not in used and prev_id in previous_map:
+                    mapping[cur_id] = previous_map[prev_id]
+                    used.add(prev_id)
+        owned = rows[rows[:, 0] >= segment['owned_start']].copy()
+        # New IDs only after the overlap is trimmed, so every ID appears in the output
+        _, first = np.unique(owned[:, 1], return_index=True)
+        for cur_id in owned[np.sort(first), 1].astype(int):
+            if cur_id not in mapping:
+                mapping[cur_id] = next_id
+                next_id += 1
+        owned[:, 1] = [mapping[int(i)] for i in owned[:, 1]]
+        output.append(owned)
+        previous, previous_map = rows, mapping
+    return np.concatenate(output) if output else np.zeros((0, 8))
+
+
+def track_video(video, options, workers, segments=None, overlap=settings.SHARD_OVERLAP_FRAMES):
+    """
+    Tracks a whole video using one process per segment.
+
+    Parameters:
+        video (str): Path of the video file.
+        options (dict): Worker options as built by batch_detect (weights, backend, conf, tracker, ...).
+        workers (int): Number of worker processes.
+        segments (int): Number of segments, defaults to the number of workers.
+        overlap (int): Frames shared between neighbouring segments for stitching.
+
+    Returns:
+        (rows, per-segment timings, class names) where rows are stitched
+        (frame, id, x1, y1, x2, y2, conf, cls).
+    """
+    vid_cap = cv2.VideoCapture(video)
+    total = int(vid_cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    vid_cap.release()
+    plan = plan_segments(total, segments or workers, overlap)
+    context = multiprocessing.get_context('spawn')
+    with context.Pool(workers, initializer=batch_detect.init_worker, initargs=(options,)) as pool:
+        results = pool.map(track_segment, [(video, bounds) for bounds in plan], chunksize=1)
+    names = results[0]['names'] if results else {}
+    return stitch(results), [r['seconds'] for r in results], names
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Track objects in a stored video using all cores.")
+    parser.add_argument('video')
+    parser.add_argument('--output', help='CSV file for the tracked detections (default: next to the video)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--segments', type=int, help='number of segments (default: one per worker)')
+    parser.add_argument('--overlap', type=int, default=settings.SHARD_OVERLAP_FRAMES)
+    parser.add_argument('--tracker', default='bytetrack.yaml', choices=('bytetrack.yaml', 'botsort.yaml'))
+    parser.add_argument('--conf', type=float, default=0.35)
+    parser.add_argument('--weights', default=str(settings.DETECTION_MODEL))
+    parser.add_argument('--backend', default=settings.MODEL_BACKEND,
+                        choices=(settings.BACKEND_TORCH, settings.BACKEND_ONNX, settings.BACKEND_OPENVINO))
+    args = parser.parse_args(argv)
+
+    options = {
+        'weights': args.weights,
+        'backend': args.backend,
+        'int8': False,
+        'conf': args.conf,
+        'tracker': args.tracker,
+        'tiling': None,
+        'threads': max(1, (os.cpu_count() or 1) // args.workers),
+    }
+    start = time.perf_counter()
+    rows, seconds, names = track_video(args.video, options, args.workers, args.segments, args.overlap)
+    elapsed = time.perf_counter() - start
+
+    output = Path(args.output or Path(args.video).with_suffix('.tracks.csv'))
+    with open(output, 'w', newline='') as f:
+        writer = csv.writer(f)
+        # The same columns as batch_detect's detections.csv
+        writer.writerow(batch_detect.COLUMNS)
+        for frame, track_id, x1, y1, x2, y2, conf, cls in rows:
+            writer.writerow([args.video, int(frame), int(track_id), round(x1, 5), round(y1, 5), round(x2, 5),
+                             round(y2, 5), names.get(int(cls), int(cls)), round(conf, 3)])
+    print(f"{len(rows)} detections, {len(np.unique(rows[:, 1]))} tracks in {elapsed:.1f}s wall clock "
+          f"({sum(seconds):.1f}s of segment work) -> {output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""
+Streamlit viewer for processed video frames.
+
+Pushing every raw frame to the browser ties the inference loop to websocket
+throughput. FrameViewer caps how often the image element is refreshed and
+sends a downscaled, JPEG/WebP-encoded preview instead of the raw array.
+StatsPanel updates a fixed set of metric placeholders in place.
+"""
+import time
+
+import cv2
+import streamlit as st
+
+import settings
+
+_ENCODINGS = {
+    'jpeg': ('.jpg', cv2.IMWRITE_JPEG_QUALITY),
+    'webp': ('.webp', cv2.IMWRITE_WEBP_QUALITY),
+}
+
+
+class FrameViewer:
+    """Shows annotated frames in a Streamlit placeholder at a capped refresh rate."""
+
+    def __init__(self, st_frame, max_fps=settings.VIEWER_MAX_FPS, max_width=settings.VIEWER_MAX_WIDTH,
+                 quality=settings.VIEWER_QUALITY, encoding=settings.VIEWER_ENCODING, caption='Detected Video'):
+        """
+        Parameters:
+            st_frame (Streamlit object): Placeholder the previews are shown in.
+            max_fps (float): Most previews per second; 0 shows every frame.
+            max_width (int): Previews wider than this are downscaled.
+            quality (int): JPEG/WebP quality, 1-100.
+            encoding (str): 'jpeg' or 'webp'.
+            caption (str): Caption under the image.
+        """
+        self.st_frame = st_frame
+        self.min_interval = 1 / max_fps if max_fps else 0.0
+        self.max_width = max_width
+        self.extension, quality_flag = _ENCODINGS[encoding]
+        self.params = [quality_flag, int(quality)]
+        self.caption = caption
+        self.shown = 0
+        self.skipped = 0
+        self.bytes_sent = 0
+        self._last_push = 0.0
+
+    def due(self):
+        return time.perf_counter() - self._last_push >= self.min_interval
+
+    def encode(self, image):
+        """Downscales a BGR frame to the preview width and encodes it."""
+        height, width = image.shape[:2]
+        if width > self.max_width:
+            size = (self.max_width, int(height * self.max_width / width))
+            image = cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+        _, encoded = cv2.imencode(self.extension, image, self.params)
+        return encoded.tobytes()
+
+    def push(self, image, force=False):
+        """
+        Shows a BGR frame unless the previous preview is too recent.
+
+        Returns:
+            True when the frame was sent to the browser.
+        """
+        if not force and not self.due():
+            self.skipped += 1
+            return False
+        data = self.encode(image)
+        self.st_frame.image(data, caption=self.caption, use_column_width=True)
+        self._last_push = time.perf_counter()
+        self.shown += 1
+        self.bytes_sent += len(data)
+        return True
+
+
+class StatsPanel:
+    """A row of metrics created once and updated in place."""
+
+    def __init__(self, labels, container=st):
+        self._placeholders = {label: column.empty()
+                              for label, column in zip(labels, container.columns(len(labels)))}
+
+    def update(self, values):
+        """Parameters: values (dict): label -> value for the metrics to refresh."""
+        for label, value in values.items():
+            self._placeholders[label].metric(label, value)